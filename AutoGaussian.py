@@ -5,12 +5,23 @@
 # Citation: If you use this code, please cite Lopez-Corbalan, R
 
 import os
-import time
 import glob
-import shutil
-import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import itertools
+import time
+import asyncio
 import threading
+from log_watcher import LogWatcher, count_job_steps, read_termination
+from job_ledger import JobLedger, input_hash
+from checkpoint_staging import stage_checkpoint, release_checkpoint
+from step_scheduler import StepScheduler, parse_memory
+from batch_backends import make_backend, write_array_script
+from failure_recovery import apply_recovery, reads_checkpoint
+from conformer_filter import read_input_geometry, load_conformers, deduplicate
+from results_store import ResultsStore, store_extractors, stored_properties
+from gaussian_log_parser import LogParser, JobStatisticsExtractor
+from telemetry import Telemetry, format_report
+from resource_model import ResourceModel, read_job_records, route_signature, count_atoms, format_memory
 
 #########################################################################################################################################################################################
 # User configuration
@@ -18,6 +29,43 @@ memory = "16GB"
 num_processors = "16"
 steps_to_execute = [1, 2, 3, 4, 5, 6]
 max_concurrent_molecules = 35  # Reducir para evitar problemas de concurrencia
+input_patterns = ["*.chk"]     # Input files processed, e.g. ["*.chk", "*.xyz", "*.com"]
+deduplicate_conformers = False  # Drop .xyz/.com inputs whose heavy-atom RMSD to a kept one is below rmsd_threshold
+rmsd_threshold = 0.125          # Angstrom
+energy_window = None            # kcal/mol above the most stable input (needs energies in the .xyz comment line)
+chain_steps = False  # Run all steps of a molecule as one --Link1-- job sharing a single %chk (one submission per molecule)
+gaussian_launcher = ["launch_g16"]  # Command that submits/runs a .com file (the file name is appended)
+execution_backend = "local"   # "local" (gaussian_launcher), "slurm" (sbatch) or "fake" (local stand-in for Slurm, for testing)
+array_submission = False      # slurm/fake: submit each step of every molecule as one job array chained with dependencies
+array_wait = True             # With array_submission: wait for the arrays to finish (False submits and exits)
+gaussian_command = "g16"      # Gaussian executable used inside slurm/fake jobs
+sbatch_options = []           # Extra sbatch options, e.g. ["--partition=long", "--time=2-00:00:00"]
+slurm_dependency = "aftercorr"  # aftercorr: each molecule waits only for its own previous step; afterok: for the whole wave
+node_cores = 560           # Total cores the scheduler may hand out at once (35 x 16 by default)
+node_memory = "560GB"      # Total memory the scheduler may hand out at once
+scheduling_policy = "critical_path"  # fifo, shortest_first, finish_molecules or critical_path
+log_poll_min_interval = 1    # Seconds between log checks while logs are growing
+log_poll_max_interval = 60   # Seconds between log checks once logs are idle
+checkpoint_hardlink = False  # Share the previous step's .chk inode when reflinks are unavailable (Gaussian modifies it in place)
+checkpoint_cleanup = None    # After a step succeeds: "compress" or "delete" the previous step's .chk (None keeps it)
+ledger_file = "AutoGaussian_ledger.sqlite"  # Records finished steps so a rerun resumes where it stopped (None disables it)
+results_file = "AutoGaussian_results.sqlite"  # Energies, charges, frequencies and excitations of every finished step (None disables it)
+telemetry_file = "AutoGaussian_telemetry.jsonl"  # Timings and cycle counts of every Gaussian run, see telemetry.py (None disables it)
+prometheus_file = None       # Prometheus textfile-collector file, e.g. "/var/lib/node_exporter/textfile_collector/autogaussian.prom"
+stall_timeout_minutes = 240  # A started job whose log does not grow for this long is reported as stalled (None disables it)
+max_restarts = 2             # Automatic restarts per step after a recognized failure
+
+# Recovery action for each failure kind (restart_opt, scf_xqc, next_root or None to stop the molecule)
+# The step is restarted from the checkpoint left by the failed run
+recovery_actions = {
+    "opt_steps": "restart_opt",        # Number of optimization steps exceeded (l9999)
+    "scf_convergence": "scf_xqc",      # SCF did not converge
+    "memory": None,
+    "io": None,
+    "crash": None,
+    "stall": None,                     # Always None: the hung job is not killed, a restart would share its log and .chk
+    "error": None,                     # Any other error termination
+}
 
 # Default charge and multiplicity
 default_charge = "2"
@@ -32,50 +80,188 @@ step_commands = {
     5: "# B3LYP/6-31+G(d,p) TD=(Read,NStates=6,Root=1) Geom=Check Guess=Read SCRF=(Solvent=Ethanol,CorrectedLR,NonEquilibrium=Save) NoSymm",
     6: "# B3LYP/6-31+G(d,p) SCRF=(Solvent=Ethanol,NonEquilibrium=Read) Geom=Check Guess=Read NoSymm",
 }
+
+# Optional per-step resources (nprocshared, mem); steps not listed use num_processors and memory
+step_resources = {
+    # 4: ("32", "32GB"),
+}
+
+# Size nprocshared and mem of every (molecule, step) not in step_resources from the logs of earlier batches (see resource_model.py)
+auto_resources = False
+resource_history = ["*/step_*/step*.log"]  # Finished logs the model learns from
+resource_manifest = "AutoGaussian_resources.sqlite"  # Caches what was read from unchanged logs (None reads them all every time)
+resource_core_options = (1, 2, 4, 8, 16, 32)
+
+# Expected relative duration of each step, used to prioritize the scheduler queue
+step_expected_time = {1: 4, 2: 1, 3: 1, 4: 8, 5: 1, 6: 1}
 #########################################################################################################################################################################################
 
 lock = threading.Lock() # Inicializa el Lock
+molecule_locks = {}     # Un Lock por molecula: las copias de distintas moleculas no se bloquean entre si
 
-def wait_for_log_completion(log_file):
-    while True:
-        if os.path.exists(log_file):
-            with open(log_file, "r") as f:
-                content = f.read()
-                if "Normal termination" in content:
-                    print(f"{log_file} completed successfully.")
-                    return True
-                elif "Lnk1e" in content:
-                    print(f"Error detected in {log_file}. Stopping execution.")
-                    return False
-        
-        print(f"Waiting for {log_file} to complete...")
-        time.sleep(60)  # Increased wait time to reduce log spam
+def molecule_lock(molecule_name):
+    with lock:
+        return molecule_locks.setdefault(molecule_name, threading.Lock())
+
+backend = make_backend(execution_backend, gaussian_launcher, gaussian_command, sbatch_options, slurm_dependency,
+                       max_concurrent_molecules, log_poll_max_interval)
+
+log_watcher = LogWatcher(min_interval=log_poll_min_interval, max_interval=log_poll_max_interval,
+                         stall_timeout=stall_timeout_minutes * 60 if stall_timeout_minutes else None) # Un solo hilo vigila todos los logs
+
+ledger = None
+
+def get_ledger():
+    global ledger
+    with lock:
+        if ledger is None and ledger_file:
+            ledger = JobLedger(ledger_file)
+    return ledger
+
+resource_plan = {}  # (molecule, step): (nprocshared, mem), filled by plan_resources
+
+def resources_for(molecule_name, step):
+    """(nprocshared, mem) of a step: step_resources, else the resource plan, else num_processors and memory."""
+    if step in step_resources:
+        return step_resources[step]
+    return resource_plan.get((molecule_name, step), (num_processors, memory))
+
+def read_com_resources(com_path):
+    """(nprocshared, mem) written in an existing input, None if it has none."""
+    resources = {}
+    try:
+        with open(com_path, 'r') as f:
+            for line in f:
+                if line.startswith("%") and "=" in line:
+                    key, value = line[1:].strip().split("=", 1)
+                    resources[key.lower()] = value
+                elif line.startswith("#"):
+                    break
+    except OSError:
+        return None
+    if "nprocshared" not in resources or "mem" not in resources:
+        return None
+    return resources["nprocshared"], resources["mem"]
+
+def plan_resources(input_files):
+    """
+    Fills resource_plan from a model of the finished logs matching resource_history. Steps that
+    already have an input keep the resources written in it, so that a resumed batch does not see
+    its finished steps as changed (and rerun them).
+    """
+    records = read_job_records(sorted({f for pattern in resource_history for f in glob.glob(pattern, recursive=True)}), resource_manifest)
+    if not any(record["success"] and record["elapsed"] for record in records):
+        print("No finished logs to size the steps from: using num_processors and memory.")
+        return
+    model = ResourceModel.fit(records)
+    steps = [step for step in steps_to_execute if step not in step_resources]
+    jobs, pinned = [], {}
+    for input_file in input_files:
+        base_name = os.path.splitext(os.path.basename(input_file))[0]
+        atoms = count_atoms(input_file)
+        for step in steps:
+            existing = read_com_resources(os.path.join(os.getcwd(), base_name, f"step_{step}", f"step{step}.com"))
+            if existing is not None:
+                pinned[(base_name, step)] = existing
+            jobs.append((base_name, step, route_signature(step_commands.get(step, "")), atoms))
+    # The plan is made for every step; the pinned ones then keep what they already ran with
+    planned = model.plan(jobs, node_cores, node_memory, max_concurrent_molecules, resource_core_options)
+    for key, (cores, memory_mb) in planned.items():
+        resource_plan[key] = pinned.get(key, (str(cores), format_memory(memory_mb)))
+    print(f"Resources sized from {len(records)} logs:")
+    for step in steps:
+        chosen = sorted({resource_plan[key] for key in resource_plan if key[1] == step}, key=lambda r: int(r[0]))
+        print(f"    Step {step}: {', '.join(f'{cores} cores/{mem}' for cores, mem in chosen)}")
+
+results_store = None
+
+def get_results_store():
+    global results_store
+    with lock:
+        if results_store is None and results_file:
+            results_store = ResultsStore(results_file)
+    return results_store
+
+telemetry = None
+
+def get_telemetry():
+    global telemetry
+    with lock:
+        if telemetry is None and (telemetry_file or prometheus_file):
+            telemetry = Telemetry(telemetry_file, prometheus_file)
+    return telemetry
+
+def read_step_log(log_file, for_store):
+    """
+    Parses a finished log once for both by-products: Gaussian's times and cycle counts for the telemetry
+    and, with for_store, the properties of the results store.
+
+    Returns:
+    tuple: (job statistics or None, (scalars, arrays, stat) for store_results or None)
+    """
+    want_statistics = get_telemetry() is not None
+    want_store = for_store and get_results_store() is not None
+    extractors = (store_extractors() if want_store else []) + ([JobStatisticsExtractor()] if want_statistics else [])
+    if not extractors:
+        return None, None
+    try:
+        stat = os.stat(log_file)  # Before parsing: a log rewritten meanwhile is read again next time
+        results = LogParser(extractors).parse(log_file)
+    except Exception as e:  # Both consumers are by-products: they never stop a molecule
+        print(f"Could not read {log_file}: {e}")
+        return None, None
+    return results.get("job_statistics"), (*stored_properties(results), stat) if want_store else None
+
+def record_telemetry(molecule_name, step, success, failure, log_file, cores, step_memory, metrics, attempt=0, statistics=None):
+    """Adds one Gaussian run to the telemetry (Gaussian's own times and cycle counts come from statistics or its log)."""
+    step_telemetry = get_telemetry()
+    if step_telemetry is None:
+        return
+    try:
+        step_telemetry.record(molecule_name, step, success, log_file, cores, step_memory, attempt, failure, statistics, **metrics)
+    except Exception as e:  # Like the results store, telemetry never stops a molecule
+        print(f"Could not record the telemetry of {log_file}: {e}")
+
+def store_results(molecule_name, step, log_file, extracted=None):
+    """
+    Adds the properties of a finished step to the results store (see results_store.py); logs already stored
+    unchanged are not read. extracted is what read_step_log already parsed, if anything.
+    """
+    store = get_results_store()
+    if store is None:
+        return
+    try:
+        if extracted is None:
+            store.record_log(log_file, molecule_name, step)
+        else:
+            scalars, arrays, stat = extracted
+            store.record_log(log_file, molecule_name, step, extracted=(scalars, arrays), stat=stat)
+    except Exception as e:  # The store is a by-product: it never stops a molecule
+        print(f"Could not store the results of {log_file}: {e}")
+
+async def wait_for_log_completion(log_file, expected_terminations=1, progress=None):
+    print(f"Waiting for {log_file} to complete...")
+    success, detail = await log_watcher.wait_async(log_file, expected_terminations, progress)
+    if success:
+        print(f"{log_file} completed successfully.")
+    else:
+        print(f"Error detected in {log_file} ({detail}).")
+    return success, detail
 
 def create_cmxyz(input_path, base_folder):
     base_name = os.path.splitext(os.path.basename(input_path))[0]
     os.makedirs(os.path.join(base_folder, "bases"), exist_ok=True)
     cmxyz_path = os.path.join(base_folder, "bases", f"{base_name}.cmxyz")
     
-    with lock: # Adquiere el Lock para proteger el acceso a los archivos
+    with molecule_lock(base_name): # Adquiere el Lock para proteger el acceso a los archivos
         if input_path.endswith(".chk"):
             chk_path = os.path.join(base_folder, "bases", f"{base_name}.chk")
-            shutil.copy(input_path, chk_path)
+            stage_checkpoint(input_path, chk_path, checkpoint_hardlink)
             with open(cmxyz_path, 'w') as f:
                 f.write(f"{default_charge} {default_multiplicity}\n")
             return cmxyz_path, None
         
-        with open(input_path, 'r') as f:
-            lines = f.readlines()
-        
-        if input_path.endswith(".xyz"):
-            geometry = ''.join(lines[2:])
-            local_charge = default_charge
-            local_multiplicity = default_multiplicity
-        elif input_path.endswith(".com"):
-            local_charge, local_multiplicity = lines[7].split()
-            geometry = ''.join(lines[8:])
-        else:
-            raise ValueError("Unsupported file format. Use .xyz, .com, or .chk")
+        local_charge, local_multiplicity, geometry = read_input_geometry(input_path, default_charge, default_multiplicity)
         
         with open(cmxyz_path, 'w') as f:
             f.write(f"{local_charge} {local_multiplicity}\n")
@@ -84,54 +270,101 @@ def create_cmxyz(input_path, base_folder):
             f.write("\n") # Libera el Lock
     return cmxyz_path, geometry
 
+def build_com(charge, multiplicity, memory, num_processors, step, commands, molecule_name, geometry=None, chk_name=None):
+    text = f"%mem={memory}\n"
+    text += f"%nprocshared={num_processors}\n"
+    text += f"%chk={chk_name or f'step{step}.chk'}\n"
+    text += f"{commands}\n"
+    text += "\n"
+    text += f"{molecule_name} Step {step}\n"
+    text += "\n"
+    text += f"{charge} {multiplicity}\n"
+    if geometry:
+        text += geometry
+    text += "\n"
+    return text
+
 def generate_com(com_path, charge, multiplicity, memory, num_processors, step, commands, molecule_name, geometry=None):
+    """Writes the .com file of a step and returns its text."""
+    com_text = build_com(charge, multiplicity, memory, num_processors, step, commands, molecule_name, geometry)
     with open(com_path, 'w') as f:
-        f.write(f"%mem={memory}\n")
-        f.write(f"%nprocshared={num_processors}\n")
-        f.write(f"%chk=step{step}.chk\n")
-        f.write(f"{commands}\n")
-        f.write("\n")
-        f.write(f"{molecule_name} Step {step}\n")
-        f.write("\n")
-        f.write(f"{charge} {multiplicity}\n")
-        if geometry:
-            f.write(geometry)
-        f.write("\n")
-
-def launch_gaussian(com_file):
+        f.write(com_text)
+    return com_text
+
+def job_memory_mb(step_memory):
+    """Memory requested from the batch system for a step: %mem plus the headroom Gaussian needs above it."""
+    return int(parse_memory(step_memory) * 1.2)
+
+async def launch_gaussian(com_file, expected_terminations=1, progress=None, metrics=None, cores=None, step_memory=None):
+    """
+    Runs com_file and waits for its log. metrics, if given, receives launch_latency, start_latency, wall_time and watcher_lag.
+    cores and step_memory (%nprocshared, %mem) size the allocation on batch backends.
+    """
     directory = os.path.dirname(com_file)
     file_name = os.path.basename(com_file)
-    log_file = os.path.join(directory, file_name.replace(".com", ".log"))
-    original_dir = os.getcwd()  # Guarda el directorio original
+    log_file = os.path.join(directory, f"{os.path.splitext(file_name)[0]}.log")
 
     print(f"Launching Gaussian for: {com_file}")
     print(f"Expected log file path: {log_file}")
 
-    try:
-        os.chdir(directory)  # Cambia al directorio del .com
-        result = subprocess.run(f"launch_g16 {file_name}", shell=True, check=True, capture_output=True, text=True)
-        print(result.stdout)  # Imprime la salida estandar
-        print(result.stderr)  # Imprime la salida de error
-        os.chdir(original_dir)  # Regresa al directorio original
-        return wait_for_log_completion(log_file)
-    except subprocess.CalledProcessError as e:
-        print(f"Error launching Gaussian: {e}")
-        print(e.stderr)  # Imprime el error de Gaussian
-        os.chdir(original_dir)  # Asegura regresar al directorio original en caso de error
+    launched_at = time.time()
+    launched = await backend.launch(com_file, None if cores is None else int(cores),
+                                    None if step_memory is None else job_memory_mb(step_memory))
+    if metrics is not None:
+        metrics["launch_latency"] = time.time() - launched_at
+    if not launched:
+        return False, "launch"
+    outcome = await wait_for_log_completion(log_file, expected_terminations, progress)
+    timing = log_watcher.pop_timing(log_file)
+    if metrics is not None and timing is not None:
+        metrics["start_latency"] = None if timing["first_output"] is None else timing["first_output"] - launched_at
+        metrics["wall_time"] = timing["finished"] - launched_at
+        metrics["watcher_lag"] = timing["detection_lag"]
+    return outcome
+
+def copy_checkpoint(molecule_name, chk_source, chk_destination):
+    with molecule_lock(molecule_name):  #Protege la copia del archivo
+        if os.path.exists(chk_source):
+            stage_checkpoint(chk_source, chk_destination, checkpoint_hardlink)
+
+def cleanup_checkpoint(molecule_name, chk_file):
+    with molecule_lock(molecule_name):
+        release_checkpoint(chk_file, checkpoint_cleanup)
+
+def step_is_finished(molecule_name, step, step_hash, current_com, log_file, chk_file):
+    job_ledger = get_ledger()
+    if job_ledger is None:
         return False
+    if not job_ledger.is_complete(molecule_name, step, step_hash, log_file):
+        # Logs touched after they were recorded, finished while the driver was down, or before the ledger existed, are
+        # adopted if their input is unchanged and they end with a normal termination
+        # Jobs submitted or running when the driver stopped may have finished on their own
+        entry = job_ledger.get(molecule_name, step)
+        if entry is not None and (entry["state"] not in ("done", "running", "submitted") or job_ledger.planned_hash(entry) != step_hash):
+            return False
+        if entry is None:
+            if not os.path.exists(current_com):
+                return False
+            with open(current_com, 'r') as f:
+                if input_hash(f.read()) != step_hash:
+                    return False
+        termination = read_termination(log_file)
+        if termination is None or "Normal termination" not in termination:
+            return False
+        job_ledger.record(molecule_name, step, "done", entry["input_hash"] if entry else step_hash, chk_file, log_file, termination, step_hash)
+
+    # The next step restarts from this checkpoint unless it has finished as well
+    following_steps = steps_to_execute[steps_to_execute.index(step) + 1:]
+    return os.path.exists(chk_file) or (bool(following_steps) and job_ledger.is_done(molecule_name, following_steps[0]))
 
-def execute_step(base_folder, step, commands, cmxyz_path, is_first_step, geometry):
+async def execute_step(base_folder, step, commands, cmxyz_path, is_first_step, geometry, queue_latency=None):
     base_name = os.path.basename(base_folder)
     step_folder = os.path.join(base_folder, f"step_{step}")
     os.makedirs(step_folder, exist_ok=True)
     
     current_com = os.path.join(step_folder, f"step{step}.com")
     log_file = os.path.join(step_folder, f"step{step}.log")
-    charge, multiplicity = default_charge, default_multiplicity
-    
-    if os.path.exists(cmxyz_path):
-        with open(cmxyz_path, 'r') as f:
-            charge, multiplicity = f.readline().split()
+    charge, multiplicity = read_charge_multiplicity(cmxyz_path)
     
     if is_first_step:
         chk_source = os.path.join(base_folder, "bases", f"{base_name}.chk")
@@ -141,58 +374,365 @@ def execute_step(base_folder, step, commands, cmxyz_path, is_first_step, geometr
     
     chk_destination = os.path.join(step_folder, f"step{step}.chk")
 
+    step_processors, step_memory = resources_for(base_name, step)
+    com_text = build_com(charge, multiplicity, step_memory, step_processors, step, commands, base_name, geometry if is_first_step else None)
+    step_hash = input_hash(com_text)
+    if step_is_finished(base_name, step, step_hash, current_com, log_file, chk_destination):
+        print(f"Step {step} of {base_name} already completed. Skipping.")
+        await asyncio.to_thread(store_results, base_name, step, log_file)
+        return True
+
     # Validacion de la existencia del archivo .chk
     if not os.path.exists(chk_source) and not is_first_step:
         print(f"Error: Checkpoint file not found: {chk_source}")
         return False
     
-    with lock:  #Protege la copia del archivo
-        if os.path.exists(chk_source):
-            shutil.copy(chk_source, chk_destination)
+    copy_start = time.monotonic()
+    await asyncio.to_thread(copy_checkpoint, base_name, chk_source, chk_destination)  # Las copias grandes no bloquean el bucle de eventos
+    metrics = {"queue_latency": queue_latency, "chk_copy_time": time.monotonic() - copy_start}
     
-    generate_com(current_com, charge, multiplicity, memory, num_processors, step, commands, base_name, geometry if is_first_step else None)
-    return launch_gaussian(current_com)
+    # A log left by an interrupted or failed run would be read as this run's result
+    if os.path.exists(log_file):
+        os.replace(log_file, f"{log_file}.old")
 
-def process_file(input_path):
-    if not os.path.exists(input_path):
-        print(f"File not found: {input_path}")
+    with open(current_com, 'w') as f:
+        f.write(com_text)
+    job_ledger = get_ledger()
+    if job_ledger is not None:
+        job_ledger.record(base_name, step, "running", step_hash, chk_destination, log_file)
+        job_ledger.invalidate(base_name, steps_to_execute[steps_to_execute.index(step) + 1:])  # Downstream results depend on this run
+    success, failure = await launch_gaussian(current_com, count_job_steps(commands), metrics=metrics, cores=step_processors, step_memory=step_memory)
+    statistics, extracted = await asyncio.to_thread(read_step_log, log_file, success)
+    await asyncio.to_thread(record_telemetry, base_name, step, success, failure, log_file, step_processors, step_memory, metrics, 0, statistics)
+
+    # Restart recognized failures from the checkpoint the failed run left behind
+    restarts, ran_hash = 0, step_hash
+    while not success and restarts < max_restarts and recovery_actions.get(failure):
+        restarts += 1
+        commands = apply_recovery(recovery_actions[failure], commands)
+        print(f"Restarting step {step} of {base_name} after {failure} ({restarts}/{max_restarts}): {commands}")
+        if os.path.exists(log_file):
+            os.replace(log_file, f"{log_file}.failed{restarts}")
+        restart_text = generate_com(current_com, charge, multiplicity, step_memory, step_processors, step, commands, base_name,
+                                    None if reads_checkpoint(commands) else (geometry if is_first_step else None))
+        ran_hash = input_hash(restart_text)  # The ledger records the input that ran, skipping still follows step_hash
+        if job_ledger is not None:
+            job_ledger.record(base_name, step, "running", ran_hash, chk_destination, log_file, None, step_hash)
+        metrics = {}
+        success, failure = await launch_gaussian(current_com, count_job_steps(commands), metrics=metrics, cores=step_processors, step_memory=step_memory)
+        statistics, extracted = await asyncio.to_thread(read_step_log, log_file, success)
+        await asyncio.to_thread(record_telemetry, base_name, step, success, failure, log_file, step_processors, step_memory, metrics, restarts, statistics)
+
+    if job_ledger is not None:
+        job_ledger.record(base_name, step, "done" if success else "failed", ran_hash, chk_destination, log_file, read_termination(log_file), step_hash)
+    if success:
+        await asyncio.to_thread(store_results, base_name, step, log_file, extracted)
+    if success and checkpoint_cleanup:
+        await asyncio.to_thread(cleanup_checkpoint, base_name, chk_source)  # Superseded by this step's checkpoint
+    return success
+
+def read_charge_multiplicity(cmxyz_path):
+    if os.path.exists(cmxyz_path):
+        with open(cmxyz_path, 'r') as f:
+            return f.readline().split()
+    return default_charge, default_multiplicity
+
+def split_chained_log(chain_log, steps, step_logs):
+    """Streams a --Link1-- log into one log per step, cutting after each step's last normal termination."""
+    expected = [count_job_steps(step_commands.get(step, "")) for step in steps]
+    index, terminations = 0, 0
+    out = open(step_logs[0], 'wb')
+    with open(chain_log, 'rb') as f:
+        for line in f:
+            out.write(line)
+            if b"Normal termination" in line:
+                terminations += 1
+                if terminations == expected[index] and index + 1 < len(steps):
+                    out.close()
+                    index, terminations = index + 1, 0
+                    out = open(step_logs[index], 'wb')
+    out.close()
+
+async def execute_chain(base_folder, cmxyz_path, geometry, queue_latency=None):
+    """Runs every step of a molecule as a single --Link1-- job, then splits the results into the step_N folders."""
+    base_name = os.path.basename(base_folder)
+    chain_folder = os.path.join(base_folder, "chain")
+    os.makedirs(chain_folder, exist_ok=True)
+    chain_com = os.path.join(chain_folder, f"{base_name}.com")
+    chain_log = os.path.join(chain_folder, f"{base_name}.log")
+    chain_chk = os.path.join(chain_folder, f"{base_name}.chk")
+    charge, multiplicity = read_charge_multiplicity(cmxyz_path)
+
+    sections, step_hashes, step_logs = [], [], []
+    for i, step in enumerate(steps_to_execute):
+        step_folder = os.path.join(base_folder, f"step_{step}")
+        os.makedirs(step_folder, exist_ok=True)
+        step_processors, step_memory = resources_for(base_name, step)
+        section = build_com(charge, multiplicity, step_memory, step_processors, step, step_commands.get(step, ""), base_name,
+                            geometry if i == 0 else None, chk_name=f"{base_name}.chk")
+        with open(os.path.join(step_folder, f"step{step}.com"), 'w') as f:
+            f.write(section)  # Solo como referencia de lo que se ha calculado
+        sections.append(section)
+        step_hashes.append(input_hash(section))
+        step_logs.append(os.path.join(step_folder, f"step{step}.log"))
+
+    job_ledger = get_ledger()
+    if job_ledger is not None and all(job_ledger.is_complete(base_name, step, step_hash, step_log)
+                                      for step, step_hash, step_log in zip(steps_to_execute, step_hashes, step_logs)):
+        print(f"All steps of {base_name} already completed. Skipping.")
+        return True
+
+    copy_start = time.monotonic()
+    await asyncio.to_thread(copy_checkpoint, base_name, os.path.join(base_folder, "bases", f"{base_name}.chk"), chain_chk)
+    metrics = {"queue_latency": queue_latency, "chk_copy_time": time.monotonic() - copy_start}
+    if os.path.exists(chain_log):
+        os.replace(chain_log, f"{chain_log}.old")
+    with open(chain_com, 'w') as f:
+        f.write("--Link1--\n".join(sections))
+    if job_ledger is not None:
+        for step, step_hash, step_log in zip(steps_to_execute, step_hashes, step_logs):
+            job_ledger.record(base_name, step, "running", step_hash, chain_chk, step_log)
+
+    # Cumulative number of normal terminations at the end of each step
+    boundaries = list(itertools.accumulate(count_job_steps(step_commands.get(step, "")) for step in steps_to_execute))
+
+    reported = [0]
+
+    def on_progress(path, terminations):
+        for step, boundary in zip(steps_to_execute, boundaries):
+            if reported[0] < boundary <= terminations:
+                print(f"Step {step} of {base_name} completed inside the chained job.")
+        reported[0] = terminations
+
+    # One allocation for all the sections: the largest resources any of them requests
+    resources = [resources_for(base_name, step) for step in steps_to_execute]
+    chain_cores, chain_memory = max(int(cores) for cores, _ in resources), max(resources, key=lambda r: parse_memory(r[1]))[1]
+    success, failure = await launch_gaussian(chain_com, boundaries[-1], on_progress, metrics, chain_cores, chain_memory)
+    if not success:
+        statistics, _ = await asyncio.to_thread(read_step_log, chain_log, False)
+        await asyncio.to_thread(record_telemetry, base_name, "chain", success, failure, chain_log, chain_cores, chain_memory, metrics, 0, statistics)
+        # Los pasos de un trabajo encadenado no tienen su propio .chk: se repite la cadena completa
+        if job_ledger is not None:
+            for step, step_hash, step_log in zip(steps_to_execute, step_hashes, step_logs):
+                job_ledger.record(base_name, step, "failed", step_hash, chain_chk, step_log, read_termination(chain_log))
         return False
-    
+
+    await asyncio.to_thread(split_chained_log, chain_log, steps_to_execute, step_logs)
+    # Each step log is parsed once; the chain's telemetry entry adds up their statistics
+    parsed = [await asyncio.to_thread(read_step_log, step_log, True) for step_log in step_logs]
+    step_statistics = [statistics for statistics, _ in parsed]
+    chain_statistics = None
+    if all(statistics is not None for statistics in step_statistics):
+        chain_statistics = {key: sum(statistics[key] for statistics in step_statistics) for key in step_statistics[0]}
+    await asyncio.to_thread(record_telemetry, base_name, "chain", success, failure, chain_log, chain_cores, chain_memory, metrics, 0, chain_statistics)
+    last_step = steps_to_execute[-1]
+    last_chk = os.path.join(base_folder, f"step_{last_step}", f"step{last_step}.chk")
+    os.replace(chain_chk, last_chk)
+    os.remove(chain_log)  # Its content now lives in the step_N logs
+    if job_ledger is not None:
+        for step, step_hash, step_log in zip(steps_to_execute, step_hashes, step_logs):
+            job_ledger.record(base_name, step, "done", step_hash, last_chk if step == last_step else None, step_log, read_termination(step_log))
+    for step, step_log, (_, extracted) in zip(steps_to_execute, step_logs, parsed):
+        await asyncio.to_thread(store_results, base_name, step, step_log, extracted)
+    return True
+
+def prepare_molecule(input_path):
     base_name = os.path.splitext(os.path.basename(input_path))[0]
     base_folder = os.path.join(os.getcwd(), base_name)
     os.makedirs(base_folder, exist_ok=True)
     cmxyz_path, geometry = create_cmxyz(input_path, base_folder)
-    
-    for i, step in enumerate(steps_to_execute):
-        success = execute_step(base_folder, step, step_commands.get(step, ""), cmxyz_path, is_first_step=(i == 0), geometry=geometry)
+    return base_folder, cmxyz_path, geometry
+
+def schedule_molecule(scheduler, input_path):
+    """Adds the preparation of a molecule and each of its steps (or its chained job) to the scheduler as a dependency chain."""
+    molecule = {}  # Filled by the preparation task, read by the step tasks
+    tasks = {}     # Scheduler task of each step, for its queue latency
+
+    def prepare():
+        if not os.path.exists(input_path):
+            print(f"File not found: {input_path}")
+            return False
+        molecule["base_folder"], molecule["cmxyz_path"], molecule["geometry"] = prepare_molecule(input_path)
+        return True
+
+    async def run_step(step, is_first_step):
+        success = await execute_step(molecule["base_folder"], step, step_commands.get(step, ""), molecule["cmxyz_path"], is_first_step, molecule["geometry"],
+                                     tasks[step].queue_latency)
         if not success:
             print(f"Error in step {step} for {input_path}. Stopping execution for this molecule.")
-            return False
-    
-    print(f"All steps completed for: {input_path}")
-    return True
+        return success
+
+    async def run_chain():
+        success = await execute_chain(molecule["base_folder"], molecule["cmxyz_path"], molecule["geometry"], tasks["chain"].queue_latency)
+        if not success:
+            print(f"Error in the chained job for {input_path}. Stopping execution for this molecule.")
+        return success
+
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    previous = scheduler.add_task(input_path, 0, prepare, cores=0, memory=0, expected_time=0)
+    if chain_steps:
+        # One job for all the steps: reserve the largest resources any of its sections requests
+        resources = [resources_for(base_name, step) for step in steps_to_execute]
+        tasks["chain"] = scheduler.add_task(input_path, "chain", run_chain,
+                           cores=max(int(cores) for cores, _ in resources), memory=max(parse_memory(mem) for _, mem in resources),
+                           expected_time=sum(step_expected_time.get(step, 1) for step in steps_to_execute), depends_on=[previous])
+        return
+
+    for i, step in enumerate(steps_to_execute):
+        step_processors, step_memory = resources_for(base_name, step)
+        previous = tasks[step] = scheduler.add_task(input_path, step, functools.partial(run_step, step, i == 0),
+                                                    cores=step_processors, memory=step_memory,
+                                                    expected_time=step_expected_time.get(step, 1), depends_on=[previous])
+
+async def run_array_waves(input_files):
+    """
+    Submits each step of every molecule as one job array (one task per molecule), each array
+    depending on the previous one, and optionally waits for the whole batch.
+    """
+    molecules = []
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            print(f"File not found: {input_file}")
+            continue
+        molecules.append((input_file, *await asyncio.to_thread(prepare_molecule, input_file)))
+    if not molecules:
+        return {}
+
+    array_folder = os.path.join(os.getcwd(), "array_jobs")
+    os.makedirs(array_folder, exist_ok=True)
+    job_ledger = get_ledger()
+    rerun = set()  # Molecules with a step to run: everything downstream reruns too
+    submitted = set()  # (input file, step) run by this batch
+    job_ids, dependency = [], None
+
+    for i, step in enumerate(steps_to_execute):
+        commands = step_commands.get(step, "")
+        # One allocation per array: every task gets the largest resources any molecule was sized for
+        resources = [resources_for(os.path.basename(base_folder), step) for _, base_folder, _, _ in molecules]
+        step_processors = max(int(cores) for cores, _ in resources)
+        step_memory = max((mem for _, mem in resources), key=parse_memory)
+        manifest_lines = []
+        for input_file, base_folder, cmxyz_path, geometry in molecules:
+            base_name = os.path.basename(base_folder)
+            step_folder = os.path.join(base_folder, f"step_{step}")
+            os.makedirs(step_folder, exist_ok=True)
+            current_com = os.path.join(step_folder, f"step{step}.com")
+            log_file = os.path.join(step_folder, f"step{step}.log")
+            chk_destination = os.path.join(step_folder, f"step{step}.chk")
+            if i == 0:
+                chk_source = os.path.join(base_folder, "bases", f"{base_name}.chk")
+                chk_source = chk_source if os.path.exists(chk_source) else ""
+            else:
+                previous_step = steps_to_execute[i - 1]
+                chk_source = os.path.join(base_folder, f"step_{previous_step}", f"step{previous_step}.chk")
+
+            charge, multiplicity = read_charge_multiplicity(cmxyz_path)
+            com_processors, com_memory = resources_for(base_name, step)
+            com_text = build_com(charge, multiplicity, com_memory, com_processors, step, commands, base_name, geometry if i == 0 else None)
+            step_hash = input_hash(com_text)
+            if input_file not in rerun and step_is_finished(base_name, step, step_hash, current_com, log_file, chk_destination):
+                manifest_lines.append(f"{step_folder}\t{chk_source}\tdone")
+                continue
+
+            rerun.add(input_file)
+            submitted.add((input_file, step))
+            if os.path.exists(log_file):
+                os.replace(log_file, f"{log_file}.old")
+            with open(current_com, 'w') as f:
+                f.write(com_text)
+            if job_ledger is not None:
+                job_ledger.record(base_name, step, "submitted", step_hash, chk_destination, log_file)
+            manifest_lines.append(f"{step_folder}\t{chk_source}\trun")
+
+        script_path = os.path.join(array_folder, f"step{step}.sh")
+        memory_mb = job_memory_mb(step_memory)
+        write_array_script(script_path, os.path.join(array_folder, f"step{step}.manifest"), manifest_lines,
+                           step, step_processors, memory_mb, gaussian_command)
+        dependency = await backend.submit_array(script_path, len(molecules), dependency)
+        job_ids.append(dependency)
+        print(f"Submitted step {step} for {len(molecules)} molecules as job array {dependency}")
+
+    if not array_wait:
+        print("Job arrays submitted. Rerun the script to collect and resume them.")
+        return {}
+
+    await backend.wait(job_ids)
+
+    states = {}
+    for input_file, base_folder, cmxyz_path, geometry in molecules:
+        base_name = os.path.basename(base_folder)
+        for step in steps_to_execute:
+            log_file = os.path.join(base_folder, f"step_{step}", f"step{step}.log")
+            termination = read_termination(log_file)
+            success = termination is not None and "Normal termination" in termination
+            states[(input_file, step)] = "done" if success else "failed"
+            if (input_file, step) in submitted:  # The scheduler's timings are unknown: only Gaussian's times and cycles
+                statistics, extracted = read_step_log(log_file, success)
+                if success:
+                    store_results(base_name, step, log_file, extracted)
+                step_processors, step_memory = resources_for(base_name, step)
+                record_telemetry(base_name, step, success, None if success else "error", log_file, step_processors, step_memory, {}, 0, statistics)
+            elif success:
+                store_results(base_name, step, log_file)
+            entry = job_ledger.get(base_name, step) if job_ledger is not None else None
+            if entry is not None and entry["state"] == "submitted":
+                job_ledger.record(base_name, step, "done" if success else "failed", entry["input_hash"], entry["chk_path"], log_file, termination,
+                                  entry["planned_hash"])
+    return states
+
+def filter_duplicate_inputs(input_files):
+    """Removes near-duplicate .xyz/.com inputs; .chk inputs cannot be read and are always kept."""
+    geometry_files = [f for f in input_files if f.endswith((".xyz", ".com"))]
+    conformers = load_conformers(geometry_files, default_charge, default_multiplicity)
+    kept, duplicates, discarded = deduplicate(conformers, rmsd_threshold, energy_window)
+    kept_sources = {conformer.source for conformer in kept}
+    for name, same in duplicates.items():
+        if same:
+            print(f"{name}: skipping duplicates {', '.join(same)}")
+    if discarded:
+        print(f"Skipping inputs outside the energy window: {', '.join(discarded)}")
+    return [f for f in input_files if f not in geometry_files or f in kept_sources]
 
 def main():
-    input_files = glob.glob("*.chk")  # Solo busca archivos .chk
+    if recovery_actions.get("stall"):
+        # A stalled job keeps running: a restart would write the same log and .chk alongside it
+        print("recovery_actions['stall'] must be None: stalled jobs are not killed and cannot be restarted safely.")
+        return
+    input_files = sorted({f for pattern in input_patterns for f in glob.glob(pattern)})
     if not input_files:
         print("No valid input files found.")
         return
     
     print(f"Found input files: {input_files}") 
+    if deduplicate_conformers:
+        input_files = filter_duplicate_inputs(input_files)
+        print(f"Input files after removing duplicate conformers: {input_files}")
+    if auto_resources:
+        plan_resources(input_files)
     
-    with ThreadPoolExecutor(max_workers=max_concurrent_molecules) as executor:
-        future_to_file = {executor.submit(process_file, input_file): input_file for input_file in input_files}
-        
-        for future in as_completed(future_to_file):
-            input_file = future_to_file[future]
-            try:
-                success = future.result()
-                if success:
-                    print(f"Successfully processed: {input_file}")
-                else:
-                    print(f"Failed to process: {input_file}")
-            except Exception as exc:
-                print(f"{input_file} generated an exception: {exc}")
+    if array_submission:
+        if not backend.supports_arrays:
+            print(f"The {execution_backend} backend cannot submit job arrays. Use slurm or fake.")
+            return
+        states = asyncio.run(run_array_waves(input_files))
+        if not array_wait:
+            return
+    else:
+        scheduler = StepScheduler(node_cores, node_memory, scheduling_policy, max_running=max_concurrent_molecules)
+        for input_file in input_files:
+            schedule_molecule(scheduler, input_file)
+        states = scheduler.run()
+
+    for input_file in input_files:
+        if all(state == "done" for (molecule, _), state in states.items() if molecule == input_file):
+            print(f"Successfully processed: {input_file}")
+        else:
+            print(f"Failed to process: {input_file}")
+
+    step_telemetry = get_telemetry()
+    if step_telemetry is not None and step_telemetry.entries:
+        print("Where the time of this batch went (telemetry.py for the whole history):")
+        print(format_report(step_telemetry.entries))
 
     print("All calculations are completed.")
 
@@ -4,14 +4,53 @@
 # GitHub: github.com/richardloopez
 # Citation: If you use this code, please cite Lopez-Corbalan, R.
 
-import math
+import os
+import re
+import sys
+import argparse
 import readline
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gaussian_log_parser import search_logs, iter_log_files
+from log_watcher import read_termination
+from log_index import LogIndex, DEFAULT_INDEX_FILE
+from results_store import ResultsStore
 
 # Constants
 R = 0.008314  # Gas constant in kJ/(mol·K)
 T = 298.15  # Temperature in Kelvin (25°C)
 HARTREE_TO_KJ_MOL = 2625.5  # Conversion factor from Hartree to kJ/mol
 
+# Energy read from each log (last occurrence): text searched and how the value follows it
+ENERGY_SOURCES = {
+    "scf": "SCF Done:",                                        # E(RB3LYP) =  -2820.25150012     A.U. after ...
+    "gibbs": "Sum of electronic and thermal Free Energies=",   # -2820.012345
+}
+# Column of the results store (results_store.py) holding each energy
+ENERGY_COLUMNS = {"scf": "scf_energy", "gibbs": "electronic_thermal_free_energy"}
+
+def boltzmann_populations(energies, temperatures=T):
+    """
+    Boltzmann populations of a set of conformers at one or several temperatures. The exponents
+    are shifted by their maximum before exponentiation (log-sum-exp), so large ensembles and
+    wide energy ranges never overflow, and the whole temperature grid is one batched operation.
+
+    Args:
+        energies (ndarray): Energies in Hartree (electronic or Gibbs free energies), shape (n_conformers,)
+        temperatures (float or ndarray): Temperature(s) in Kelvin, shape (n_temperatures,)
+
+    Returns:
+        ndarray: Populations (fractions summing to 1 over the conformers), shape (n_conformers, n_temperatures)
+    """
+    energies = np.asarray(energies, dtype=np.float64)
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))
+    relative_energies = (energies - energies.min()) * HARTREE_TO_KJ_MOL
+    weights = np.multiply.outer(relative_energies, -1 / (R * temperatures))  # Exponents, (n_conformers, n_temperatures)
+    weights -= weights.max(axis=0)
+    np.exp(weights, out=weights)
+    weights /= weights.sum(axis=0)  # Divided by the partition function
+    return weights
+
 def calculate_boltzmann_population(energies, temperature):
     """
     Calculate the Boltzmann population distribution for a set of energies.
@@ -23,41 +62,214 @@ def calculate_boltzmann_population(energies, temperature):
     Returns:
         dict: A dictionary of molecule names and their relative populations.
     """
-    min_energy = min(energies.values())
-    relative_energies = {k: (v - min_energy) * HARTREE_TO_KJ_MOL for k, v in energies.items()}
-    partition_function = sum(math.exp(-e / (R * temperature)) for e in relative_energies.values())
-    populations = {k: math.exp(-e / (R * temperature)) / partition_function for k, e in relative_energies.items()}
-    return populations
+    values = np.fromiter(energies.values(), dtype=np.float64, count=len(energies))
+    populations = boltzmann_populations(values, temperature)[:, 0]
+    return dict(zip(energies, populations.tolist()))
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
 
 def read_energy_file(filename):
     """
-    Read energies from a file.
+    Read energies from a file (one "name,energy" per line). Lines without a numeric energy,
+    such as the "not found" lines of Print_Information_Gaussian.py, are skipped.
 
     Args:
         filename (str): The name of the file containing molecule names and energies.
 
     Returns:
-        dict: A dictionary of molecule names and their energies.
+        tuple: (names array, energies array in Hartree)
     """
-    energies = {}
     with open(filename, 'r') as file:
-        for line in file:
-            name, energy = line.strip().split(',')
-            energies[name] = float(energy)
-    return energies
+        rows = [line.rsplit(',', 1) for line in file.read().splitlines() if ',' in line]
+    if not rows:
+        return np.array([], dtype=str), np.array([], dtype=np.float64)
+    names, values = np.array(rows, dtype=str).T
+    try:
+        energies = values.astype(np.float64)
+    except ValueError:  # Some lines carry text instead of an energy
+        energies = np.array([_to_float(value) for value in values])
+    found = ~np.isnan(energies)
+    if not found.all():
+        print(f"Skipped {np.count_nonzero(~found)} lines without an energy", file=sys.stderr)
+    return names[found], energies[found]
+
+STEP_LOG = re.compile(r"step_(\d+)[/\\]step\1\.log$")  # AutoGaussian: <molecule>/step_N/stepN.log
+
+def select_step_logs(log_files):
+    """
+    The log of the last step that terminated normally in each AutoGaussian molecule folder, so
+    every molecule contributes one energy at one level of theory.
+
+    Returns:
+    list: Selected logs, or None if log_files holds no AutoGaussian step logs
+    """
+    molecules = {}
+    for log_file in log_files:
+        match = STEP_LOG.search(log_file)
+        if match:
+            molecule = os.path.dirname(os.path.dirname(log_file))
+            molecules.setdefault(molecule, []).append((int(match.group(1)), log_file))
+    if not molecules:
+        return None
+    selected = {}
+    for molecule, steps in molecules.items():
+        for step, log_file in sorted(steps, reverse=True):
+            termination = read_termination(log_file)
+            if termination is not None and "Normal termination" in termination:
+                selected[molecule] = (step, log_file)
+                break
+        else:
+            print(f"Skipped {molecule}: no step terminated normally", file=sys.stderr)
+    steps = sorted({step for step, _ in selected.values()})
+    if len(steps) > 1:
+        raise ValueError(f"The molecules finished different steps ({', '.join(map(str, steps))}): their energies come from "
+                         f"different levels of theory. Choose one with --pattern (e.g. step{steps[0]}.log)")
+    return [log_file for _, log_file in selected.values()]
+
+# Worker state, set once per process by init_worker
+worker_index = None
+
+def init_worker(index_file):
+    global worker_index
+    worker_index = LogIndex(index_file) if index_file else None
+
+def read_log_energy(job):
+    """
+    Final energy of one log. job is (log file, energy source); returns (log file, energy or NaN).
+    """
+    log_file, source = job
+    search_text = ENERGY_SOURCES[source]
+    try:
+        value = search_logs(log_file, [search_text], from_end=True, index=worker_index)[0]
+    except OSError as e:
+        print(f"Error reading {log_file}: {e}", file=sys.stderr)
+        value = None
+    if value is not None and source == "scf":
+        value = value.split("=", 1)[1]
+    return log_file, np.nan if value is None else _to_float(value.split()[0])
+
+def read_energy_tree(base_folder, source="scf", pattern=None, workers=None, index_file=DEFAULT_INDEX_FILE, all_logs=False):
+    """
+    Reads the final energy of the logs below base_folder in parallel, straight from the logs.
+    Each folder is one conformer: a folder giving more than one energy is an error unless all_logs.
+
+    Args:
+        base_folder (str): Root of the tree
+        source (str): "scf" (last SCF Done) or "gibbs" (Sum of electronic and thermal Free Energies)
+        pattern (str): File name pattern of the logs to read (e.g. "step1.log"). None: in an AutoGaussian
+                       tree the last normally terminated step of each molecule (see select_step_logs),
+                       otherwise every .log
+        workers (int): Worker processes (default: all cores)
+        index_file (str): Section index cache (see log_index.py), None to disable it
+        all_logs (bool): Accept several logs per folder (e.g. conformers written side by side)
+
+    Returns:
+        tuple: (names array of paths relative to base_folder, energies array in Hartree)
+    """
+    if source not in ENERGY_SOURCES:
+        raise ValueError(f"Unknown energy source: {source}. Use one of {list(ENERGY_SOURCES)}")
+    log_files = iter_log_files(base_folder, pattern or "*.log")
+    if pattern is None:
+        log_files = list(log_files)
+        log_files = select_step_logs(log_files) or log_files
+    jobs = ((log_file, source) for log_file in log_files)
+    names, energies = [], []
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(index_file,)) as executor:
+        for log_file, energy in executor.map(read_log_energy, jobs, chunksize=16):
+            names.append(os.path.relpath(log_file, base_folder))
+            energies.append(energy)
+    names, energies = np.array(names, dtype=str), np.array(energies, dtype=np.float64)
+    found = ~np.isnan(energies)
+    if not found.all():
+        print(f"Skipped {np.count_nonzero(~found)} logs without {ENERGY_SOURCES[source]!r}", file=sys.stderr)
+    names, energies = names[found], energies[found]
+    if not all_logs:
+        folders, counts = np.unique([os.path.dirname(name) for name in names], return_counts=True)
+        if (counts > 1).any():
+            folder = folders[np.argmax(counts)]
+            raise ValueError(f"{folder or '.'} gives {counts.max()} energies: one folder should be one conformer. "
+                             f"Choose one log per folder with --pattern, or use --all-logs")
+    return names, energies
+
+def read_energy_store(store_file, source="scf", step=None):
+    """
+    Reads the energies of a results store (see results_store.py) with one query.
+
+    Args:
+        store_file (str): Results store database
+        source (str): "scf" or "gibbs"
+        step (int): Only the logs of this AutoGaussian step (None for all)
+
+    Returns:
+        tuple: (names array of log paths, energies array in Hartree)
+    """
+    store = ResultsStore(store_file)
+    try:
+        return store.column(ENERGY_COLUMNS[source], step=step)
+    finally:
+        store.close()
+
+def temperature_grid(arguments):
+    if arguments.temperature_range:
+        start, stop, step = arguments.temperature_range
+        return np.arange(start, stop + step / 2, step)
+    return np.array(arguments.temperatures or [T])
 
 def main():
     """
     Main function to calculate and display Boltzmann populations.
     """
-    filename = input("Enter the name of the file containing the energies: ")
-    energies = read_energy_file(filename)
-    populations = calculate_boltzmann_population(energies, T)
+    parser = argparse.ArgumentParser(description="Boltzmann populations of a conformer ensemble.")
+    parser.add_argument("filename", nargs="?", help="Folder tree of .log files, results store (.sqlite), or file with one 'name,energy (Hartree)' per line (asked for if omitted)")
+    parser.add_argument("--energy", choices=sorted(ENERGY_SOURCES), default="scf", help="Energy read from the logs: last SCF Done (scf) or free energy (gibbs)")
+    parser.add_argument("--pattern", default=None, help="Name pattern of the logs read from a folder tree (e.g. step1.log; "
+                                                        "default: the last finished step of each AutoGaussian molecule, or every .log)")
+    parser.add_argument("--all-logs", action="store_true", help="Folder tree: accept several logs (conformers) in the same folder")
+    parser.add_argument("--step", type=int, help="Results store: only the logs of this AutoGaussian step")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes reading the logs (default: all cores)")
+    parser.add_argument("--temperatures", type=float, nargs="+", help="Temperature(s) in K (default 298.15)")
+    parser.add_argument("--temperature-range", type=float, nargs=3, metavar=("START", "STOP", "STEP"), help="Temperature grid in K")
+    parser.add_argument("--output", help="Write the (conformers x temperatures) populations to a .csv or .npz file")
+    args = parser.parse_args()
+
+    filename = args.filename or input("Enter the name of the file containing the energies: ")
+    if os.path.isdir(filename):
+        try:
+            names, energies = read_energy_tree(filename, args.energy, args.pattern, args.workers, all_logs=args.all_logs)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    elif filename.endswith(".sqlite"):
+        names, energies = read_energy_store(filename, args.energy, args.step)
+    else:
+        names, energies = read_energy_file(filename)
+    if len(energies) == 0:
+        print("No energies found.")
+        return
+    temperatures = temperature_grid(args)
+    populations = boltzmann_populations(energies, temperatures)
+    order = np.argsort(-populations[:, 0], kind="stable")
 
-    print("Molecule\tEnergy (Hartree)\tRelative Population (%)")
-    for name, pop in sorted(populations.items(), key=lambda x: x[1], reverse=True):
-        print(f"{name}\t{energies[name]:.6f}\t\t{pop*100:.2f}")
+    if args.output and args.output.endswith(".npz"):
+        np.savez(args.output, names=names, energies=energies, temperatures=temperatures, populations=populations)
+    elif args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write("Molecule,Energy (Hartree)," + ",".join(f"Population {t:g} K" for t in temperatures) + "\n")
+            for i in order:
+                output_file.write(f"{names[i]},{energies[i]:.6f}," + ",".join(f"{p:.6e}" for p in populations[i]) + "\n")
+
+    if len(temperatures) == 1:
+        print("Molecule\tEnergy (Hartree)\tRelative Population (%)")
+        for i in order:
+            print(f"{names[i]}\t{energies[i]:.6f}\t\t{populations[i, 0]*100:.2f}")
+    else:
+        print("Molecule\tEnergy (Hartree)\t" + "\t".join(f"{t:g} K (%)" for t in temperatures))
+        for i in order:
+            print(f"{names[i]}\t{energies[i]:.6f}\t" + "\t".join(f"{p*100:.2f}" for p in populations[i]))
 
 if __name__ == "__main__":
     main()
-
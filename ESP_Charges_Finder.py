@@ -6,114 +6,168 @@
 
 import os
 import csv
-import statistics
+import numpy as np
+from gaussian_log_parser import LogParser, EspChargesExtractor, AtomCountExtractor
+from log_index import LogIndex
+from scan_manifest import ScanManifest
+from results_store import ResultsStore, DEFAULT_RESULTS_FILE
 
-def search_esp_charges(folder, base_dir):
+class ChargeMatrix:
     """
-    Searches for 'ESP charges:' from the beginning of the .log file and extracts the following 73 lines. (one more than the desired atoms is needed)
-    
+    ESP charges of many logs: one row per log, one column per atom, NaN where a log has fewer
+    atoms than the largest molecule seen. Rows are preallocated in blocks and the per-atom
+    mean/variance are accumulated with Welford's algorithm as rows are added.
+    """
+    def __init__(self, capacity=64):
+        self.names = []
+        self.charges = np.full((capacity, 0), np.nan)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def _grow(self, rows, atoms):
+        capacity, columns = self.charges.shape
+        if rows > capacity or atoms > columns:
+            grown = np.full((max(capacity * 2 if rows > capacity else capacity, rows), max(columns, atoms)), np.nan)
+            grown[:capacity, :columns] = self.charges
+            self.charges = grown
+        if atoms > len(self.count):
+            extra = atoms - len(self.count)
+            self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+            self.mean = np.concatenate([self.mean, np.zeros(extra)])
+            self.m2 = np.concatenate([self.m2, np.zeros(extra)])
+
+    def add(self, name, charges):
+        charges = np.asarray(charges, dtype=np.float64)
+        atoms = len(charges)
+        self._grow(len(self.names) + 1, atoms)
+        self.charges[len(self.names), :atoms] = charges
+        self.names.append(name)
+        # Welford update of the first `atoms` columns
+        self.count[:atoms] += 1
+        delta = charges - self.mean[:atoms]
+        self.mean[:atoms] += delta / self.count[:atoms]
+        self.m2[:atoms] += delta * (charges - self.mean[:atoms])
+
+    @property
+    def matrix(self):
+        """(logs, atoms) array of charges, NaN where missing."""
+        return self.charges[:len(self.names)]
+
+    @property
+    def std(self):
+        """Sample standard deviation per atom (0.0 when only one log has the atom)."""
+        return np.sqrt(np.divide(self.m2, self.count - 1, out=np.zeros_like(self.m2), where=self.count > 1))
+
+def search_esp_charges(folder, base_dir, charge_matrix):
+    """
+    Extracts the first 'ESP charges:' block of each .log file (one charge per atom, in atom
+    order; the number of atoms is taken from the log) and adds it to charge_matrix. Logs whose
+    block is not closed by "Sum of ESP charges" right after the last atom are reported and left out.
+
     Args:
     folder (str): The folder to search in
     base_dir (str): The base directory from where the script was launched
-    
-    Returns:
-    dict: A dictionary with the relative path of the file as key and the charges as value
+    charge_matrix (ChargeMatrix): Accumulator of the results, keyed by the relative path of each file
     """
     print(f"Searching in: {folder}")
-    os.chdir(folder)
-    
-    log_files = [f for f in os.listdir() if f.endswith(".log")]
-    results = {}
-    
+
+    log_files = sorted(f for f in os.listdir(folder) if f.endswith(".log"))
+    parser = LogParser([AtomCountExtractor(), EspChargesExtractor(totals=True)])
+
     for log_file in log_files:
+        log_path = os.path.join(folder, log_file)
         try:
-            relative_path = os.path.relpath(os.path.join(folder, log_file), base_dir)
-            
-            with open(log_file, "r") as file:
-                lines = file.readlines()
-                esp_index = None
-                
-                for i, line in enumerate(lines):
-                    if "ESP charges:" in line:
-                        esp_index = i
-                        break
-                
-                if esp_index is not None:
-                    charges = lines[esp_index + 1:esp_index + 74]
-                    results[relative_path] = []
-                    for line in charges:
-                        parts = line.split()
-                        if len(parts) >= 3:
-                            results[relative_path].append(float(parts[2]))
-                        else:
-                            results[relative_path].append(0.0)  # Use 0.0 for numerical calculations
+            relative_path = os.path.relpath(log_path, base_dir)
+            stat = os.stat(log_path)
+            seen_logs.append(relative_path)
+            unchanged, charges = manifest.lookup(relative_path, stat)  # Logs not modified since the last run are not read
+            if not unchanged:
+                results = parser.parse(log_path, log_index)
+                charges = None
+                if results["esp_charges"]:
+                    rows, total = results["esp_charges"][0]
+                    if total is not None:
+                        charges = [charge for _, _, charge in rows]
+                    else:
+                        print(f"Skipping {relative_path}: its ESP block ({len(rows)} charges) does not end with "
+                              f"'Sum of ESP charges' after its {results['atom_count']} atoms")
+                manifest.update(relative_path, stat, charges)
+                parsed_logs[relative_path] = stat
+            if charges is not None:
+                charge_matrix.add(relative_path, charges)
         except Exception as e:
             print(f"Error processing {log_file}: {str(e)}")
-    
-    os.chdir(base_dir)
-    return results
 
 def explore_directory(base_folder, max_depth):
     """
     Explores directories recursively up to a specified depth.
-    
+
     Args:
     base_folder (str): The initial folder for exploration
     max_depth (int): The maximum depth to explore
-    
+
     Returns:
-    dict: A dictionary with all the results
+    ChargeMatrix: All the results
     """
-    all_results = {}
-    
+    charge_matrix = ChargeMatrix()
+
     def explore(current_folder, current_depth):
         if current_depth > max_depth:
             return
-        
+
         for folder in sorted(os.listdir(current_folder)):
             folder_path = os.path.join(current_folder, folder)
-            
+
             if os.path.isdir(folder_path):
                 print(f"Exploring: {folder_path}")
-                results = search_esp_charges(folder_path, base_folder)
-                all_results.update(results)
+                search_esp_charges(folder_path, base_folder, charge_matrix)
                 explore(folder_path, current_depth + 1)
-    
+
     explore(base_folder, 0)
-    return all_results
+    return charge_matrix
 
 # Get user input
 depth_degree = int(input("What is the depth degree of the subfolders? [1 - infinity) [folder containing this code = 0] [0 is allowed] : "))
 
+# Section offsets cached across runs: logs already indexed are not read again
+log_index = LogIndex()
+
 # Start exploration from the current working directory
 base_dir = os.getcwd()
-all_results = explore_directory(base_dir, depth_degree)
-
-# Calculate mean and standard deviation
-means = []
-std_devs = []
-for charges in zip(*all_results.values()):
-    charges = [c for c in charges if c != 0.0]  # Exclude 0.0 values for calculations
-    if charges:
-        means.append(statistics.mean(charges))
-        std_devs.append(statistics.stdev(charges) if len(charges) > 1 else 0.0)
-    else:
-        means.append(0.0)
-        std_devs.append(0.0)
-
-# Write results to a CSV file
+manifest = ScanManifest(os.path.join(base_dir, "esp_manifest.sqlite"))
+seen_logs = []
+parsed_logs = {}  # {relative path: stat} of the logs read in this run
+charge_matrix = explore_directory(base_dir, depth_degree)
+manifest.prune(seen_logs)
+manifest.close()
+charges = charge_matrix.matrix
+means = charge_matrix.mean
+std_devs = charge_matrix.std
+
+# Write results to a CSV file (one row per atom, one column per log)
 with open(os.path.join(base_dir, "ESP_Charges.csv"), "w", newline='') as csvfile:
     writer = csv.writer(csvfile)
-    
+
     # Write headers
-    headers = ["Atom Number"] + list(all_results.keys()) + ["Mean", "Std Dev"]
+    headers = ["Atom Number"] + charge_matrix.names + ["Mean", "Std Dev"]
     writer.writerow(headers)
-    
-    # Write data     ########ATOM RANGE
-    for i in range(73):
-        row = [i+1] + [results[i] if i < len(results) else '' for results in all_results.values()]
+
+    # Write data
+    for i in range(charges.shape[1]):
+        row = [i+1] + ['' if np.isnan(charge) else charge for charge in charges[:, i].tolist()]
         row.append(means[i])
         row.append(std_devs[i])
         writer.writerow(row)
 
-print("The results have been written to ESP_Charges.csv in the base directory.")
+# Same results in binary form: np.load("ESP_Charges.npz")
+np.savez(os.path.join(base_dir, "ESP_Charges.npz"), names=np.array(charge_matrix.names), charges=charges,
+         mask=~np.isnan(charges), mean=means, std=std_devs, count=charge_matrix.count)
+
+# And in the results store of the project, next to the other properties of each log (only the logs read in this run)
+results_store = ResultsStore(os.path.join(base_dir, DEFAULT_RESULTS_FILE))
+results_store.update_many({"log_file": os.path.join(base_dir, name), "stat": parsed_logs[name], "arrays": {"esp_charges": row[~np.isnan(row)]}}
+                          for name, row in zip(charge_matrix.names, charges) if name in parsed_logs)
+results_store.close()
+
+print(f"The results have been written to ESP_Charges.csv, ESP_Charges.npz and {DEFAULT_RESULTS_FILE} in the base directory.")
@@ -2,105 +2,76 @@
 
 # Import necessary modules
 import os
-import shutil
-import subprocess
-import readline
+import sys
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from gaussian_log_parser import search_logs, iter_log_files
+from log_index import LogIndex, DEFAULT_INDEX_FILE
 
 # Author: Richard Lopez Corbalan
 # GitHub: github.com/richardloopez
 # Citation: If you use this code, please cite Lopez-Corbalan, R
 
-def search_string(folder, search_text, search_from_end):
-    """
-    Search for a specific text in log files within a given folder.
-    
-    Args:
-    folder (str): The folder to search in
-    search_text (str): The text to search for
-    search_from_end (bool): Whether to search from the end of the file
-    
-    Returns:
-    list: A list of tuples containing the log file name and the found value (or None if not found)
-    """
-    print(f"Searching in: {folder}")
-    os.chdir(folder)
-    
-    # Get all .log files in the current directory
-    log_files = [f for f in os.listdir() if f.endswith(".log")]
-    
-    results = []
-    if not log_files:
-        print(f"    {folder} does not contain log files")
-    else:
-        for log_file in log_files:
-            found_value = None
-            with open(log_file, "r") as log_file_handle:
-                lines = log_file_handle.readlines()
-                if search_from_end:
-                    lines = reversed(lines)
-                
-                for line in lines:
-                    if search_text in line:
-                        found_value = line.split(search_text)[1].strip()
-                        break
-            
-            results.append((log_file, found_value))
+# Worker state, set once per process by init_worker
+worker_search_texts = None
+worker_from_end = False
+worker_index = None
 
-    os.chdir("../../..")
-    return results
+def init_worker(search_texts, search_from_end, index_file):
+    global worker_search_texts, worker_from_end, worker_index
+    worker_search_texts = search_texts
+    worker_from_end = search_from_end
+    worker_index = LogIndex(index_file) if index_file else None
 
-# Print instructions and warnings
-print("Warning: This script processes subdirectories to apply the Seminario method.")
-print("You can have as many folders and subfolder as you want.") 
-print("\nHave in mind: in the subfolder you want to perform the Seminario method you need to have:"
-      "\n         -Only one .chk file"
-      "\n         -Only one .log file"
-      "\n         *Presence of other files is not a problem"
-      "\n         *This code has to be launched in the folder [0] (along with the other folders, not subfolders)")
-
-# Get user inputs
-depth_degree = int(input("What is the depth degree of the subfolders? [1 - infinite) [folder containing this code = 0] [0 is allowed] : "))
-search_text = input("What text would you like to search for in the .log files? : ")
-search_direction = input("Do you want to search from the beginning or from the end of the file? (Type 'beginning' or 'end'): ").strip().lower()
+def search_string(log_file):
+    """
+    Searches every search text in one log file.
 
-search_from_end = True if search_direction == 'end' else False
+    Returns:
+    tuple: (log file, [found value or None for each search text])
+    """
+    try:
+        return log_file, search_logs(log_file, worker_search_texts, worker_from_end, worker_index)
+    except OSError as e:
+        print(f"Error reading {log_file}: {e}", file=sys.stderr)
+        return log_file, [None] * len(worker_search_texts)
 
-print("Exploring directories...")
-visited_dirs = set()
-all_results = []
+def main():
+    parser = argparse.ArgumentParser(description="Search text in the Gaussian .log files of a folder tree.")
+    parser.add_argument("search_texts", nargs="+", help="Text(s) to search for; what follows each on the matching line is reported")
+    parser.add_argument("--depth", type=int, default=0, help="Depth grade of the subfolders searched (0 = immediate subfolders, -1 = no limit)")
+    parser.add_argument("--from-end", action="store_true", help="Report the last occurrence instead of the first")
+    parser.add_argument("--base", default=os.getcwd(), help="Folder to explore (default: current directory)")
+    parser.add_argument("--output", default="Search_Results.txt", help="Results file, written in the base folder")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel worker processes")
+    parser.add_argument("--index", default=DEFAULT_INDEX_FILE, help="Section index cache (see log_index.py)")
+    parser.add_argument("--no-index", action="store_true", help="Do not use the section index cache")
+    args = parser.parse_args()
 
-def explore_directory(base_folder, current_depth, max_depth):
-    """
-    Recursively explore directories up to a specified depth.
-    
-    Args:
-    base_folder (str): The starting folder for exploration
-    current_depth (int): The current depth of exploration
-    max_depth (int): The maximum depth to explore
-    """
-    if current_depth > max_depth:
-        return
-    
-    for folder in sorted(os.listdir(base_folder)):
-        folder_path = os.path.join(base_folder, folder)
-        
-        if os.path.isdir(folder_path) and folder_path not in visited_dirs:
-            visited_dirs.add(folder_path)
-            print(f"Exploring: {folder_path}")
-            results = search_string(folder_path, search_text, search_from_end)
-            all_results.extend(results)
-            explore_directory(folder_path, current_depth + 1, max_depth)
+    base_dir = os.path.abspath(args.base)
+    max_depth = None if args.depth < 0 else args.depth
+    index_file = None if args.no_index else args.index
 
-# Start the exploration from the current working directory
-base_dir = os.getcwd()
-explore_directory(base_dir, 0, depth_degree)
+    print("Exploring directories...")
+    log_files = iter_log_files(base_dir, max_depth=max_depth, skip_base=True)
+    found = 0
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.search_texts, args.from_end, index_file)) as executor, \
+            open(os.path.join(base_dir, args.output), "w") as output_file:
+        # Sliding window of futures: the tree is walked only as far as the workers keep up, and
+        # results are written in walk order as soon as the oldest one is ready
+        window = max(args.workers or 1, 1) * 4
+        pending = deque(executor.submit(search_string, log_file) for log_file in itertools.islice(log_files, window))
+        while pending:
+            log_file, found_values = pending.popleft().result()
+            for next_file in itertools.islice(log_files, 1):
+                pending.append(executor.submit(search_string, next_file))
+            fields = [value if value is not None else f"{text} not found" for text, value in zip(args.search_texts, found_values)]
+            output_file.write(f"{log_file},{','.join(fields)}\n")
+            found += 1
 
-# Write results to a file
-with open(os.path.join(base_dir, "Search_Results.txt"), "w") as output_file:
-    for log_file, found_value in all_results:
-        if found_value:
-            output_file.write(f"{log_file},{found_value}\n")
-        else:
-            output_file.write(f"{log_file} , {search_text} not found\n")
+    print(f"Searched {found} log files. Results have been written to {args.output} in the base directory.")
 
-print("Results have been written to Search_Results.txt in the base directory.")
+if __name__ == "__main__":
+    main()
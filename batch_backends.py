@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Execution Backends for AutoGaussian
+
+Every backend can start a single step (launch) and, except the local one, submit one step for
+a whole wave of molecules as a job array (submit_array), chained to the array of the previous
+step with a per-task dependency.
+    LocalBackend          Runs the configured launcher (launch_g16) in the step folder
+    SlurmBackend          sbatch: single jobs with --wrap, waves with --array and --dependency
+    FakeSchedulerBackend  Local stand-in for Slurm: runs the same array scripts with the same
+                          dependency semantics, for testing without a cluster
+"""
+import os
+import shlex
+import asyncio
+import itertools
+
+# Job array script shared by SlurmBackend and FakeSchedulerBackend.
+# Each manifest line is: step folder <TAB> checkpoint to start from <TAB> run|done
+ARRAY_SCRIPT = """#!/bin/bash
+#SBATCH --job-name={job_name}
+#SBATCH --cpus-per-task={cores}
+#SBATCH --mem={memory_mb}M
+#SBATCH --output={output}
+IFS=$'\\t' read -r JOB_DIR CHK_SOURCE STATE <<< "$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "{manifest}")"
+cd "$JOB_DIR" || exit 1
+if [ "$STATE" = "done" ]; then exit 0; fi
+if [ -n "$CHK_SOURCE" ] && [ -f "$CHK_SOURCE" ]; then
+    cp --reflink=auto "$CHK_SOURCE" "{chk_name}.staging" && mv "{chk_name}.staging" "{chk_name}" || exit 1
+fi
+{gaussian_command} < "{com_name}" > "{log_name}" 2>&1
+tail -n 1 "{log_name}" | grep -q "Normal termination"
+"""
+
+def write_array_script(script_path, manifest_path, manifest_lines, step, cores, memory_mb, gaussian_command):
+    """Writes the manifest and the array script that runs one step for every manifest line."""
+    with open(manifest_path, "w") as f:
+        f.write("".join(f"{line}\n" for line in manifest_lines))
+    with open(script_path, "w") as f:
+        f.write(ARRAY_SCRIPT.format(
+            job_name=f"AutoGaussian_step{step}", cores=cores, memory_mb=memory_mb,
+            output=os.path.join(os.path.dirname(script_path), f"step{step}_%A_%a.out"),
+            manifest=manifest_path, chk_name=f"step{step}.chk", com_name=f"step{step}.com",
+            log_name=f"step{step}.log", gaussian_command=gaussian_command))
+    os.chmod(script_path, 0o755)
+
+class ExecutionBackend:
+    """Interface of the execution backends."""
+    supports_arrays = False
+
+    async def launch(self, com_file, cores=None, memory_mb=None):
+        """
+        Starts the Gaussian job of one .com file. Returns True if it was started.
+        cores and memory_mb (the step's %nprocshared and %mem plus headroom) size the allocation
+        where the backend makes one; None leaves the scheduler's default.
+        """
+        raise NotImplementedError
+
+    async def submit_array(self, script_path, size, dependency=None):
+        """Submits script_path as a job array of size tasks, each task starting only after the
+        same task of the dependency array succeeded. Returns the job id."""
+        raise NotImplementedError(f"{type(self).__name__} does not support job arrays")
+
+    async def wait(self, job_ids):
+        """Returns once every job in job_ids has left the queue."""
+        raise NotImplementedError(f"{type(self).__name__} does not support job arrays")
+
+class LocalBackend(ExecutionBackend):
+    """
+    Args:
+    launcher (list): Command that runs or submits a .com file (the file name is appended)
+    """
+    def __init__(self, launcher):
+        self.launcher = list(launcher)
+
+    async def launch(self, com_file, cores=None, memory_mb=None):
+        directory = os.path.dirname(com_file)
+        file_name = os.path.basename(com_file)
+        stem = os.path.splitext(file_name)[0]
+        # El directorio de trabajo se pasa al proceso hijo (cwd): nunca se cambia el del driver
+        try:
+            with open(os.path.join(directory, f"{stem}.launch.out"), "wb") as stdout, open(os.path.join(directory, f"{stem}.launch.err"), "wb") as stderr:
+                process = await asyncio.create_subprocess_exec(*self.launcher, file_name, cwd=directory, stdout=stdout, stderr=stderr)
+                returncode = await process.wait()
+        except OSError as e:
+            print(f"Error launching Gaussian: {e}")
+            return False
+        if returncode != 0:
+            print(f"Error launching Gaussian: {' '.join(self.launcher)} {file_name} returned non-zero exit status {returncode}. See {stem}.launch.err")
+            return False
+        return True
+
+class SlurmBackend(ExecutionBackend):
+    """
+    Args:
+    gaussian_command (str): Gaussian executable used inside the jobs (g16, g09)
+    sbatch_options (list): Extra sbatch options, e.g. ["--partition=long", "--time=2-00:00:00"]
+    dependency_type (str): "aftercorr" (each molecule waits only for its own previous step) or
+                           "afterok" (the whole wave waits for the whole previous wave)
+    max_parallel (int): Array throttle (%N), None for no limit
+    poll_interval (float): Seconds between squeue calls in wait(); doubled (up to 16x) while squeue keeps failing
+    """
+    supports_arrays = True
+
+    def __init__(self, gaussian_command="g16", sbatch_options=(), dependency_type="aftercorr", max_parallel=None, poll_interval=60):
+        self.gaussian_command = gaussian_command
+        self.sbatch_options = list(sbatch_options)
+        self.dependency_type = dependency_type
+        self.max_parallel = max_parallel
+        self.poll_interval = poll_interval
+
+    async def _sbatch(self, arguments):
+        process = await asyncio.create_subprocess_exec("sbatch", "--parsable", *self.sbatch_options, *arguments,
+                                                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"sbatch failed: {stderr.decode().strip()}")
+        return stdout.decode().strip().split(";")[0]  # "jobid" or "jobid;cluster"
+
+    async def launch(self, com_file, cores=None, memory_mb=None):
+        directory = os.path.dirname(com_file)
+        file_name = os.path.basename(com_file)
+        log_name = f"{os.path.splitext(file_name)[0]}.log"
+        arguments = [f"--chdir={directory}"]
+        if cores is not None:
+            arguments.append(f"--cpus-per-task={cores}")
+        if memory_mb is not None:
+            arguments.append(f"--mem={memory_mb}M")
+        arguments.append(f"--wrap={self.gaussian_command} < {shlex.quote(file_name)} > {shlex.quote(log_name)} 2>&1")
+        try:
+            job_id = await self._sbatch(arguments)
+        except (OSError, RuntimeError) as e:
+            print(f"Error launching Gaussian: {e}")
+            return False
+        print(f"Submitted {com_file} as Slurm job {job_id}")
+        return True
+
+    async def submit_array(self, script_path, size, dependency=None):
+        array = f"--array=0-{size - 1}" + (f"%{self.max_parallel}" if self.max_parallel else "")
+        arguments = [array]
+        if dependency is not None:
+            arguments += [f"--dependency={self.dependency_type}:{dependency}", "--kill-on-invalid-dep=yes"]
+        return await self._sbatch(arguments + [script_path])
+
+    async def wait(self, job_ids):
+        # One squeue call for the whole batch, whatever its size
+        failures = 0
+        while True:
+            process = await asyncio.create_subprocess_exec("squeue", "-h", "-o", "%i", "-j", ",".join(job_ids),
+                                                           stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+            if process.returncode == 0:
+                if not stdout.strip():
+                    return
+                failures = 0
+            elif "Invalid job id specified" in stderr.decode():  # squeue rejects ids that already left the queue
+                return
+            else:
+                # slurmctld timeouts and the like say nothing about the jobs: back off and ask again
+                failures += 1
+                print(f"squeue failed ({stderr.decode().strip()}), retrying")
+            await asyncio.sleep(self.poll_interval * min(2 ** failures, 16))
+
+class FakeSchedulerBackend(ExecutionBackend):
+    """
+    Local stand-in for SlurmBackend. Array scripts are run with bash and SLURM_ARRAY_TASK_ID set,
+    respecting the array throttle and the aftercorr/afterok dependencies; tasks whose dependency
+    failed are cancelled, as with --kill-on-invalid-dep.
+
+    Args:
+    gaussian_command (str): Command written into the job scripts (a fake g16 for tests)
+    dependency_type (str): "aftercorr" or "afterok"
+    max_parallel (int): Array throttle, None for no limit
+    """
+    supports_arrays = True
+
+    def __init__(self, gaussian_command="g16", dependency_type="aftercorr", max_parallel=None):
+        self.gaussian_command = gaussian_command
+        self.dependency_type = dependency_type
+        self.max_parallel = max_parallel
+        self.job_ids = itertools.count(1000)
+        self.processes = []  # Single jobs started by launch(), kept so they are reaped
+        self.arrays = {}  # job id -> list of asyncio tasks, one per array index (result: success)
+
+    async def launch(self, com_file, cores=None, memory_mb=None):
+        directory = os.path.dirname(com_file)
+        file_name = os.path.basename(com_file)
+        log_name = f"{os.path.splitext(file_name)[0]}.log"
+        try:
+            process = await asyncio.create_subprocess_exec("bash", "-c", f"{self.gaussian_command} < {shlex.quote(file_name)} > {shlex.quote(log_name)} 2>&1", cwd=directory)
+        except OSError as e:
+            print(f"Error launching Gaussian: {e}")
+            return False
+        self.processes = [p for p in self.processes if p.returncode is None] + [process]
+        return True
+
+    async def _run_task(self, job_id, script_path, index, dependency, semaphore):
+        if dependency is not None:
+            previous = self.arrays[dependency]
+            needed = [previous[index]] if self.dependency_type == "aftercorr" else previous
+            results = await asyncio.gather(*needed)
+            if not all(results):
+                return False  # Dependency never satisfied: cancelled
+        async with semaphore:
+            environment = dict(os.environ, SLURM_ARRAY_JOB_ID=str(job_id), SLURM_ARRAY_TASK_ID=str(index))
+            output = os.path.join(os.path.dirname(script_path), f"{os.path.basename(script_path)}_{job_id}_{index}.out")
+            with open(output, "wb") as out:
+                process = await asyncio.create_subprocess_exec("bash", script_path, env=environment, stdout=out, stderr=asyncio.subprocess.STDOUT)
+                return await process.wait() == 0
+
+    async def submit_array(self, script_path, size, dependency=None):
+        job_id = str(next(self.job_ids))
+        semaphore = asyncio.Semaphore(self.max_parallel or size)
+        self.arrays[job_id] = [asyncio.ensure_future(self._run_task(job_id, script_path, index, dependency, semaphore))
+                               for index in range(size)]
+        return job_id
+
+    async def wait(self, job_ids):
+        await asyncio.gather(*(task for job_id in job_ids for task in self.arrays[job_id]))
+
+def make_backend(name, launcher=("launch_g16",), gaussian_command="g16", sbatch_options=(), dependency_type="aftercorr", max_parallel=None, poll_interval=60):
+    """Builds the backend selected by name: "local", "slurm" or "fake"."""
+    if name == "local":
+        return LocalBackend(launcher)
+    if name == "slurm":
+        return SlurmBackend(gaussian_command, sbatch_options, dependency_type, max_parallel, poll_interval)
+    if name == "fake":
+        return FakeSchedulerBackend(gaussian_command, dependency_type, max_parallel)
+    raise ValueError(f"Unknown execution backend: {name}. Use local, slurm or fake")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+AutoGaussian Benchmark
+
+Runs AutoGaussian on hundreds or thousands of simulated molecules, with fake_gaussian.py in
+place of Gaussian, in a scratch folder, and reports what the driver itself costs: makespan
+against the ideal makespan of the simulated run times, driver CPU time, peak RSS, peak thread
+count and bytes read and written. The simulated run times and failures depend only on the seed,
+so two runs with the same options differ only by the driver: save one with --output and compare
+the other with --baseline after changing the scheduler, the watcher or any setting (--set).
+
+The driver runs in its own process; its CPU time, memory, threads and I/O are its own (the fake
+Gaussian runs are separate processes). Simulated steps last --duration seconds per unit of
+AutoGaussian's step_expected_time, scaled with the atoms of each molecule. The fake runs still
+share the machine with the driver: with far more running jobs than CPUs the makespan measures
+the machine as much as the driver, so compare results taken on the same machine.
+
+Usage:
+    python benchmark_autogaussian.py --molecules 500 --output before.json
+    python benchmark_autogaussian.py --molecules 500 --set scheduling_policy='"fifo"' --baseline before.json
+    python benchmark_autogaussian.py --molecules 200 --failure-rate 0.05 --backend fake --set array_submission=true
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+FAKE_GAUSSIAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_gaussian.py")
+SAMPLE_INTERVAL = 0.25  # Seconds between samples of the driver's threads
+
+# Reported metrics: (key, label, format); smaller is better for all of them
+METRICS = [
+    ("makespan", "Makespan (s)", "{:.1f}"),
+    ("ideal_makespan", "Ideal makespan (s)", "{:.1f}"),
+    ("overhead", "Makespan / ideal", "{:.3f}"),
+    ("cpu_time", "Driver CPU time (s)", "{:.2f}"),
+    ("peak_rss_mb", "Peak RSS (MB)", "{:.1f}"),
+    ("peak_threads", "Peak threads", "{:.0f}"),
+    ("read_bytes", "Bytes read", "{:,.0f}"),
+    ("written_bytes", "Bytes written", "{:,.0f}"),
+]
+
+def write_inputs(folder, molecules, min_atoms, max_atoms, seed):
+    """Writes molecules .xyz inputs of min_atoms to max_atoms atoms (a chain of carbons)."""
+    rng = random.Random(seed)
+    width = len(str(molecules))
+    for i in range(molecules):
+        atoms = rng.randint(min_atoms, max_atoms)
+        with open(os.path.join(folder, f"mol_{i + 1:0{width}d}.xyz"), "w") as f:
+            f.write(f"{atoms}\nsimulated\n")
+            f.write("".join(f"C {1.5 * n:.4f} {0.3 * (n % 2):.4f} 0.0000\n" for n in range(atoms)))
+
+def simulator_config(args, step_expected_time):
+    """fake_gaussian.py configuration of a benchmark: one duration per step from step_expected_time."""
+    config = {"seed": args.seed, "write_interval": args.write_interval, "reference_atoms": (args.min_atoms + args.max_atoms) / 2,
+              "steps": {"*": {"duration": args.duration, "sigma": args.sigma, "failure_rate": args.failure_rate, "log_kb": args.log_kb}}}
+    for step, units in step_expected_time.items():
+        config["steps"][str(step)] = {"duration": args.duration * units}
+    if args.simulator_config:
+        with open(args.simulator_config, "r") as f:
+            user = json.load(f)
+        steps = user.pop("steps", {})
+        config.update(user)
+        for step, settings in steps.items():
+            config["steps"][str(step)] = {**config["steps"].get(str(step), {}), **settings}
+    return config
+
+def _proc_values(path, separator=":"):
+    """{key: int} of a /proc/self file of "key: value" lines ({} where /proc does not exist)."""
+    values = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, _, value = line.partition(separator)
+                fields = value.split()
+                if fields and fields[0].isdigit():
+                    values[key.strip()] = int(fields[0])
+    except OSError:
+        pass
+    return values
+
+def run_driver(settings_file):
+    """
+    Driver process: sets AutoGaussian's configuration from the settings, runs its main() in the
+    benchmark folder and writes the driver's own measurements to settings["metrics_file"].
+    """
+    import resource
+    with open(settings_file, "r") as f:
+        settings = json.load(f)
+    os.chdir(settings["folder"])
+    import AutoGaussian
+    from batch_backends import make_backend
+    from log_watcher import LogWatcher
+    for name, value in settings["config"].items():
+        if not hasattr(AutoGaussian, name):
+            raise SystemExit(f"AutoGaussian has no setting named {name}")
+        setattr(AutoGaussian, name, value)
+    # Built at import time from the defaults
+    AutoGaussian.backend = make_backend(AutoGaussian.execution_backend, AutoGaussian.gaussian_launcher, AutoGaussian.gaussian_command,
+                                        AutoGaussian.sbatch_options, AutoGaussian.slurm_dependency, AutoGaussian.max_concurrent_molecules,
+                                        AutoGaussian.log_poll_max_interval)
+    AutoGaussian.log_watcher = LogWatcher(min_interval=AutoGaussian.log_poll_min_interval, max_interval=AutoGaussian.log_poll_max_interval,
+                                          stall_timeout=AutoGaussian.stall_timeout_minutes * 60 if AutoGaussian.stall_timeout_minutes else None)
+
+    peak_threads, done = [0], threading.Event()
+
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak_threads[0] = max(peak_threads[0], threading.active_count() - 1,
+                                  _proc_values("/proc/self/status").get("Threads", 0) - 1)  # Without this sampler
+
+    sampler = threading.Thread(target=sample, name="BenchmarkSampler", daemon=True)
+    io_before, usage_before = _proc_values("/proc/self/io"), resource.getrusage(resource.RUSAGE_SELF)
+    sampler.start()
+    started = time.monotonic()
+    AutoGaussian.main()
+    makespan = time.monotonic() - started
+    done.set()
+    sampler.join()
+    usage, io = resource.getrusage(resource.RUSAGE_SELF), _proc_values("/proc/self/io")
+    metrics = {"makespan": makespan,
+               "cpu_time": usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime,
+               "peak_rss_mb": usage.ru_maxrss / 1024 if sys.platform != "darwin" else usage.ru_maxrss / 1024 ** 2,
+               "peak_threads": peak_threads[0] or None,
+               "read_bytes": io["rchar"] - io_before["rchar"] if io else None,
+               "written_bytes": io["wchar"] - io_before["wchar"] if io else None}
+    with open(settings["metrics_file"], "w") as f:
+        json.dump(metrics, f)
+
+def ideal_makespan(entries, max_running, total_cores):
+    """
+    Lower bound of the makespan from the simulated run times of the telemetry entries: the longest
+    molecule, and all the run time spread over max_running slots and over total_cores cores.
+    """
+    chains, busy, area = defaultdict(float), 0.0, 0.0
+    for entry in entries:
+        seconds = entry.get("elapsed_time") or entry.get("wall_time") or 0.0
+        chains[entry["molecule"]] += seconds
+        busy += seconds
+        area += seconds * (entry.get("cores") or 1)
+    if not chains:
+        return None
+    return max(max(chains.values()), busy / max_running if max_running else 0.0, area / total_cores if total_cores else 0.0)
+
+def benchmark(args):
+    """Runs one benchmark. Returns the result dict (settings, outcome counts and METRICS)."""
+    sys.path.insert(0, os.path.dirname(FAKE_GAUSSIAN))
+    import AutoGaussian
+    from telemetry import load_entries
+
+    config = {"input_patterns": ["*.xyz"], "execution_backend": args.backend, "telemetry_file": "AutoGaussian_telemetry.jsonl",
+              "gaussian_launcher": [sys.executable, FAKE_GAUSSIAN], "gaussian_command": f"{sys.executable} {FAKE_GAUSSIAN}"}
+    if args.steps:
+        config["steps_to_execute"] = [int(step) for step in args.steps.split(",")]
+    for assignment in args.set:
+        name, _, value = assignment.partition("=")
+        try:
+            config[name] = json.loads(value)
+        except ValueError:
+            config[name] = value  # Plain strings need no quotes
+
+    folder = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="autogaussian_benchmark_")
+    os.makedirs(folder, exist_ok=True)
+    try:
+        write_inputs(folder, args.molecules, args.min_atoms, args.max_atoms, args.seed)
+        simulator_file = os.path.join(folder, "fake_gaussian.json")
+        with open(simulator_file, "w") as f:
+            json.dump(simulator_config(args, config.get("step_expected_time", AutoGaussian.step_expected_time)), f, indent=1)
+        settings_file = os.path.join(folder, "benchmark_settings.json")
+        metrics_file = os.path.join(folder, "benchmark_metrics.json")
+        with open(settings_file, "w") as f:
+            json.dump({"folder": folder, "config": config, "metrics_file": metrics_file}, f, indent=1)
+
+        print(f"Running AutoGaussian on {args.molecules} simulated molecules in {folder}...")
+        environment = dict(os.environ, FAKE_GAUSSIAN_CONFIG=simulator_file)
+        with open(os.path.join(folder, "driver.out"), "w") as out:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), "--driver", settings_file],
+                                     cwd=folder, env=environment, stdout=out, stderr=subprocess.STDOUT)
+        if process.returncode != 0 or not os.path.exists(metrics_file):
+            raise RuntimeError(f"The driver failed (exit status {process.returncode}), see {os.path.join(folder, 'driver.out')}")
+        with open(metrics_file, "r") as f:
+            metrics = json.load(f)
+
+        with open(os.path.join(folder, "driver.out"), "r") as f:
+            output = f.read()
+        entries = load_entries(os.path.join(folder, "AutoGaussian_telemetry.jsonl")) if os.path.exists(os.path.join(folder, "AutoGaussian_telemetry.jsonl")) else []
+        get = lambda name: config.get(name, getattr(AutoGaussian, name))
+        metrics["ideal_makespan"] = ideal_makespan(entries, get("max_concurrent_molecules"), get("node_cores"))
+        metrics["overhead"] = metrics["makespan"] / metrics["ideal_makespan"] if metrics["ideal_makespan"] else None
+        return {"molecules": args.molecules, "seed": args.seed, "cpus": os.cpu_count(), "config": {k: v for k, v in config.items() if k not in ("gaussian_launcher", "gaussian_command")},
+                "succeeded": output.count("Successfully processed:"), "failed": output.count("Failed to process:"),
+                "runs": len(entries), "metrics": metrics}
+    finally:
+        if args.keep or args.workdir:
+            print(f"Benchmark files kept in {folder}")
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+def format_result(result, baseline=None):
+    """Text table of the metrics of a result, with the change from baseline if given."""
+    lines = [f"{result['molecules']} molecules: {result['succeeded']} succeeded, {result['failed']} failed, "
+             f"{result['runs']} Gaussian runs ({result['cpus']} CPUs)"]
+    for key, label, template in METRICS:
+        value = result["metrics"].get(key)
+        line = f"    {label:<22}{'-' if value is None else template.format(value):>18}"
+        reference = baseline["metrics"].get(key) if baseline else None
+        if value is not None and reference:
+            line += f"   {value / reference - 1:+.1%} vs baseline ({template.format(reference)})"
+        lines.append(line)
+    return "\n".join(lines)
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--driver":
+        run_driver(sys.argv[2])
+        return
+    parser = argparse.ArgumentParser(description="Time the AutoGaussian driver against simulated Gaussian runs.")
+    parser.add_argument("--molecules", type=int, default=200)
+    parser.add_argument("--steps", default=None, help="Steps to run, e.g. 1,2,3 (AutoGaussian's steps_to_execute by default)")
+    parser.add_argument("--backend", choices=["local", "fake"], default="local", help="local: fake launcher; fake: fake Slurm running fake g16")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="AutoGaussian setting for the run (value as JSON, e.g. max_concurrent_molecules=70)")
+    parser.add_argument("--duration", type=float, default=0.5, help="Simulated seconds per unit of step_expected_time")
+    parser.add_argument("--sigma", type=float, default=0.3, help="Log-normal spread of the simulated durations")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that a simulated run fails")
+    parser.add_argument("--log-kb", type=int, default=200, help="Size of each simulated log")
+    parser.add_argument("--write-interval", type=float, default=0.5, help="Seconds between writes of the simulated logs")
+    parser.add_argument("--min-atoms", type=int, default=20)
+    parser.add_argument("--max-atoms", type=int, default=60)
+    parser.add_argument("--simulator-config", default=None, help="JSON merged into the fake_gaussian.py configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Folder for the run (kept); a temporary folder by default")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary folder")
+    parser.add_argument("--output", default=None, help="Write the result as JSON")
+    parser.add_argument("--baseline", default=None, help="Result JSON of an earlier run to compare with")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    try:
+        result = benchmark(args)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    print(format_result(result, baseline))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=1)
+        print(f"Result written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Checkpoint Staging
+
+Hands a .chk file from one step folder to the next with the cheapest method the filesystem
+supports:
+    1. reflink   Copy-on-write clone (Btrfs, XFS, ...): instant, no extra space until modified
+    2. hardlink  Optional. Gaussian rewrites the .chk in place, so the source is modified too;
+                 only enable it if the previous step's checkpoint is not needed afterwards
+    3. copy      Streamed copy with copy_file_range (server-side copy on NFS 4.2/Lustre when available)
+The destination is written under a temporary name and renamed, so a half-copied checkpoint is
+never picked up by Gaussian or by a resumed run.
+"""
+import os
+import gzip
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+FICLONE = 0x40049409       # ioctl request for reflink clones (linux/fs.h)
+COPY_CHUNK = 64 * 1024 * 1024
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError("reflink not supported on this platform")
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def _hardlink(source, destination):
+    os.link(source, destination)
+
+def _stream_copy(source, destination):
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        copied = False
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK):
+                    pass
+                copied = True
+            except OSError:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+        if not copied:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+    shutil.copymode(source, destination)
+
+def stage_checkpoint(source, destination, allow_hardlink=False):
+    """
+    Places a copy of source at destination.
+
+    Args:
+    source (str): Checkpoint to hand over
+    destination (str): Path of the new checkpoint
+    allow_hardlink (bool): Allow sharing the source inode (see module docstring)
+
+    Returns:
+    str: Method used ("reflink", "hardlink" or "copy")
+    """
+    staging = f"{destination}.staging"
+    methods = [("reflink", _reflink)]
+    if allow_hardlink:
+        methods.append(("hardlink", _hardlink))
+    methods.append(("copy", _stream_copy))
+
+    for name, method in methods:
+        if os.path.lexists(staging):
+            os.remove(staging)
+        try:
+            method(source, staging)
+        except OSError:
+            if name == "copy":
+                raise
+            continue
+        os.replace(staging, destination)
+        return name
+
+def release_checkpoint(path, mode):
+    """
+    Frees the space of a checkpoint that a downstream step has superseded.
+
+    Args:
+    path (str): Checkpoint file
+    mode (str): "compress" (gzip to path.gz) or "delete"
+    """
+    if mode not in ("compress", "delete"):
+        raise ValueError(f"Unknown checkpoint cleanup mode: {mode}")
+    if not os.path.exists(path):
+        return
+    if mode == "compress":
+        with open(path, "rb") as src, gzip.open(f"{path}.gz.staging", "wb", compresslevel=1) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+        os.replace(f"{path}.gz.staging", f"{path}.gz")
+    os.remove(path)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Conformer Deduplication Filter
+
+Removes near-duplicate geometries from a conformer ensemble before it is sent to AutoGaussian.
+Conformers are visited from lowest to highest energy (input order when no energies are
+available) and aligned with the Kabsch algorithm (vectorized with NumPy, batched 3x3 SVDs) against
+the conformers already kept only, so memory grows with the number of unique conformers rather than
+with the square of the ensemble. A conformer is kept only if its heavy-atom RMSD to every kept one
+exceeds the threshold, and, optionally, if it lies within an energy window above the most stable one.
+
+Inputs: .xyz files (single or multi-frame, e.g. CREST ensembles with the energy in the comment
+line) and .com files. Multi-frame files are split into one .xyz per kept conformer.
+
+Usage:
+    python conformer_filter.py ensemble.xyz [more.xyz mol.com ...] --threshold 0.125 --energy-window 3.0 --output unique
+"""
+import os
+import sys
+import argparse
+import numpy as np
+from multixyz_to_pdb import read_xyz
+
+HARTREE_TO_KCAL_MOL = 627.5095
+HYDROGEN_LABELS = {"H", "D", "T", "1"}
+
+def read_input_geometry(input_path, default_charge, default_multiplicity):
+    """
+    Reads the charge, multiplicity and geometry block of an AutoGaussian .xyz or .com input
+    (AutoGaussian's own layout: geometry from line 3 of an .xyz; charge/multiplicity on line 8 of a .com).
+
+    Returns:
+    tuple: (charge, multiplicity, geometry text)
+    """
+    with open(input_path, 'r') as f:
+        lines = f.readlines()
+    if input_path.endswith(".xyz"):
+        return default_charge, default_multiplicity, ''.join(lines[2:])
+    if input_path.endswith(".com"):
+        charge, multiplicity = lines[7].split()
+        return charge, multiplicity, ''.join(lines[8:])
+    raise ValueError("Unsupported file format. Use .xyz, .com, or .chk")
+
+def parse_geometry(geometry_lines):
+    """
+    Returns (element labels, coordinates array (n_atoms, 3)) from Cartesian geometry lines. The
+    molecule specification ends at the first blank line after it, so trailing input sections
+    (ModRedundant, basis sets, ...) are not read as atoms.
+    """
+    elements, coordinates = [], []
+    for line in geometry_lines:
+        parts = line.split()
+        if not parts:
+            if elements:
+                break
+            continue
+        if len(parts) < 4:
+            continue
+        elements.append(parts[0].split("(")[0].split("-")[0].capitalize())
+        coordinates.append([float(value) for value in (parts[1:4] if len(parts) == 4 else parts[-3:])])
+    return elements, np.array(coordinates, dtype=float)
+
+class Conformer:
+    def __init__(self, name, source, elements, coordinates, energy=None, comment=""):
+        self.name = name
+        self.source = source
+        self.elements = elements
+        self.coordinates = coordinates
+        self.energy = energy
+        self.comment = comment
+
+def _comment_energy(comment):
+    try:
+        return float(comment.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def load_conformers(paths, default_charge="0", default_multiplicity="1"):
+    """Reads every geometry of the given .xyz/.com files. Multi-frame .xyz files yield one conformer per frame."""
+    conformers = []
+    for path in paths:
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith(".xyz"):
+            frames = read_xyz(path, with_comments=True)
+            for index, (comment, geometry) in enumerate(frames, start=1):
+                name = base_name if len(frames) == 1 else f"{base_name}_{index}"
+                elements, coordinates = parse_geometry(geometry)
+                conformers.append(Conformer(name, path, elements, coordinates, _comment_energy(comment), comment))
+        elif path.endswith(".com"):
+            _, _, geometry = read_input_geometry(path, default_charge, default_multiplicity)
+            elements, coordinates = parse_geometry(geometry.splitlines())
+            conformers.append(Conformer(base_name, path, elements, coordinates))
+    return conformers
+
+def rmsd_to(structure, references):
+    """
+    Minimum RMSD after optimal superposition (Kabsch) between one structure and each reference.
+
+    Args:
+    structure (ndarray): (n_atoms, 3), centered
+    references (ndarray): (n_references, n_atoms, 3), centered, same atom order as structure
+
+    Returns:
+    ndarray: (n_references,) RMSD in the input units
+    """
+    covariance = np.einsum("ak,ial->ikl", structure, references)  # (n_references, 3, 3)
+    singular_values = np.linalg.svd(covariance, compute_uv=False)
+    # Proper rotations only: flip the smallest singular value when the best fit is a reflection
+    sign = np.sign(np.linalg.det(covariance))
+    sign[sign == 0] = 1
+    singular_values[..., -1] *= sign
+    norms = np.einsum("ias,ias->i", references, references)
+    squared = (np.einsum("as,as->", structure, structure) + norms - 2 * singular_values.sum(axis=-1)) / len(structure)
+    return np.sqrt(np.clip(squared, 0, None))
+
+def deduplicate(conformers, threshold=0.125, energy_window=None, heavy_atoms_only=True):
+    """
+    Groups near-duplicate conformers.
+
+    Args:
+    conformers (list): Conformer objects
+    threshold (float): RMSD (Angstrom) at or below which two conformers are duplicates
+    energy_window (float): Keep only conformers within this many kcal/mol of the most stable one (None keeps all)
+    heavy_atoms_only (bool): Ignore hydrogens in the RMSD
+
+    Returns:
+    tuple: (kept conformers, {kept name: [duplicate names]}, [names outside the energy window])
+    """
+    kept, duplicates, discarded = [], {}, []
+    # Only structures with the same atoms in the same order can be compared
+    families = {}
+    for conformer in conformers:
+        families.setdefault(tuple(conformer.elements), []).append(conformer)
+
+    for elements, members in families.items():
+        energies = np.array([np.nan if c.energy is None else c.energy for c in members])
+        if not np.isnan(energies).all():
+            order = np.argsort(np.where(np.isnan(energies), np.inf, energies), kind="stable")
+        else:
+            order = np.arange(len(members))
+        if energy_window is not None and not np.isnan(energies).all():
+            relative = (energies - np.nanmin(energies)) * HARTREE_TO_KCAL_MOL
+            outside = relative > energy_window
+            discarded += [members[i].name for i in order if outside[i]]
+            order = np.array([i for i in order if not outside[i]], dtype=int)
+        if len(order) == 0:
+            continue
+
+        mask = np.array([e not in HYDROGEN_LABELS for e in elements]) if heavy_atoms_only else np.ones(len(elements), bool)
+        if not mask.any():
+            mask[:] = True
+        # Centered coordinates of the kept conformers, grown by doubling
+        representatives = np.empty((min(len(order), 16), int(mask.sum()), 3))
+        names = []
+        for index in order:
+            structure = members[index].coordinates[mask]
+            structure = structure - structure.mean(axis=0)
+            if names:
+                distances = rmsd_to(structure, representatives[:len(names)])
+                closest = int(np.argmin(distances))
+                if distances[closest] <= threshold:
+                    duplicates[names[closest]].append(members[index].name)
+                    continue
+            if len(names) == len(representatives):
+                representatives = np.concatenate([representatives, np.empty_like(representatives)])
+            representatives[len(names)] = structure
+            names.append(members[index].name)
+            kept.append(members[index])
+            duplicates[members[index].name] = []
+    return kept, duplicates, discarded
+
+def write_xyz(path, conformer):
+    with open(path, 'w') as f:
+        f.write(f"{len(conformer.elements)}\n{conformer.comment}\n")
+        for element, (x, y, z) in zip(conformer.elements, conformer.coordinates):
+            f.write(f"{element:<2} {x:14.8f} {y:14.8f} {z:14.8f}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove near-duplicate conformers before an AutoGaussian batch.")
+    parser.add_argument("inputs", nargs="+", help=".xyz (single or multi-frame) and .com files")
+    parser.add_argument("--threshold", type=float, default=0.125, help="Heavy-atom RMSD threshold in Angstrom (default 0.125)")
+    parser.add_argument("--energy-window", type=float, default=None, help="Energy window in kcal/mol (needs energies in the .xyz comment lines)")
+    parser.add_argument("--all-atoms", action="store_true", help="Include hydrogens in the RMSD")
+    parser.add_argument("--output", default="unique_conformers", help="Folder for the kept conformers (one .xyz each)")
+    args = parser.parse_args()
+
+    conformers = load_conformers(args.inputs)
+    if not conformers:
+        print("No geometries found.")
+        sys.exit(1)
+    kept, duplicates, discarded = deduplicate(conformers, args.threshold, args.energy_window, not args.all_atoms)
+
+    os.makedirs(args.output, exist_ok=True)
+    for conformer in kept:
+        write_xyz(os.path.join(args.output, f"{conformer.name}.xyz"), conformer)
+        if duplicates[conformer.name]:
+            print(f"{conformer.name}: duplicates {', '.join(duplicates[conformer.name])}")
+    if discarded:
+        print(f"Outside the energy window: {', '.join(discarded)}")
+    print(f"Kept {len(kept)} of {len(conformers)} conformers in {args.output}/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Recovery Actions for Failed Gaussian Steps
+
+Each action rewrites the route section of a failed step so it can be restarted from the
+checkpoint the failed run left behind. AutoGaussian maps failure kinds (see
+log_watcher.FAILURE_KINDS) to these actions through its recovery_actions setting.
+    restart_opt   Opt=(...,Restart): continue the optimization stored in the checkpoint
+    scf_xqc       SCF=(XQC,MaxCycle=512): quadratic convergence fallback, more cycles
+    next_root     TD=(...,Root=n+1): follow the next excited state
+"""
+import re
+
+def _split_options(options):
+    """Splits "(A,B=(C,D),E)" or "A" into ["A", "B=(C,D)", "E"]."""
+    options = options.strip()
+    if options.startswith("(") and options.endswith(")"):
+        options = options[1:-1]
+    parts, depth, current = [], 0, ""
+    for char in options:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current:
+        parts.append(current)
+    return [part.strip() for part in parts if part.strip()]
+
+def _keyword_pattern(keyword):
+    # keyword, keyword=value or keyword=(options), as a whole route word
+    return re.compile(rf"(?<![\w/]){keyword}(=\([^)]*(?:\([^)]*\)[^)]*)*\)|=[^\s]+)?(?=\s|$)", re.IGNORECASE)
+
+def set_keyword_option(route, keyword, option, replace_prefix=None):
+    """
+    Adds option to keyword in route (creating keyword if absent). With replace_prefix, options of
+    keyword starting with it (e.g. "MaxCycle") are removed first.
+    """
+    pattern = _keyword_pattern(keyword)
+    match = pattern.search(route)
+    if match is None:
+        return f"{route} {keyword}=({option})"
+    options = _split_options(match.group(1)[1:]) if match.group(1) else []
+    if replace_prefix is not None:
+        options = [o for o in options if not o.lower().startswith(replace_prefix.lower())]
+    if option.lower() not in [o.lower() for o in options]:
+        options.append(option)
+    return route[:match.start()] + f"{keyword}=({','.join(options)})" + route[match.end():]
+
+def restart_opt(route):
+    return set_keyword_option(route, "Opt", "Restart")
+
+def scf_xqc(route):
+    route = set_keyword_option(route, "SCF", "XQC")
+    return set_keyword_option(route, "SCF", "MaxCycle=512", replace_prefix="MaxCycle")
+
+def next_root(route):
+    match = re.search(r"Root=(\d+)", route, re.IGNORECASE)
+    root = int(match.group(1)) + 1 if match else 2
+    return set_keyword_option(route, "TD", f"Root={root}", replace_prefix="Root")
+
+RECOVERY_ACTIONS = {
+    "restart_opt": restart_opt,
+    "scf_xqc": scf_xqc,
+    "next_root": next_root,
+}
+
+def apply_recovery(action, route):
+    """Returns route rewritten by the named action."""
+    if action not in RECOVERY_ACTIONS:
+        raise ValueError(f"Unknown recovery action: {action}. Use one of {list(RECOVERY_ACTIONS)}")
+    return RECOVERY_ACTIONS[action](route)
+
+def reads_checkpoint(route):
+    """True if the route takes its geometry from the checkpoint (no molecule specification needed)."""
+    route = route.lower()
+    return "geom=check" in route or "geom=allcheck" in route or re.search(r"opt=\([^)]*restart", route) is not None
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Fake Gaussian
+
+Stand-in for launch_g16 and g16 that runs no chemistry: it reads a .com file and writes, over a
+simulated run time, a log that grows the way a Gaussian log does (route echo, NAtoms, NBasis,
+SCF cycles, optimization steps, "Job cpu time", "Elapsed time", one termination per job step
+and per --Link1-- section) together with a growing checkpoint file. It lets AutoGaussian, its
+scheduler, watcher, ledger and recovery be run and timed without Gaussian.
+
+Run times follow a log-normal distribution per step (the step is read from the title line
+AutoGaussian writes, "molecule Step N"), scaled with the number of atoms and with the cores
+(Amdahl's law). Runs fail with a configurable rate, with the messages of real failures
+(SCF convergence, optimization steps, memory, I/O, crash) or by stalling. Everything is set in
+a JSON file named by the FAKE_GAUSSIAN_CONFIG environment variable; see DEFAULT_CONFIG. The
+random draws depend only on the seed and the input, so a rerun of a benchmark repeats them.
+
+Usage:
+    As the launcher (returns at once and writes stepN.log next to the input, like a queue):
+        gaussian_launcher = ["python", "/path/to/fake_gaussian.py"]
+    As the Gaussian executable of the slurm/fake backends (input on stdin, log on stdout):
+        gaussian_command = "python /path/to/fake_gaussian.py"
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import subprocess
+from log_watcher import count_job_steps
+
+CONFIG_ENVIRONMENT = "FAKE_GAUSSIAN_CONFIG"
+CHK_MAGIC = b"FAKECHK"
+
+DEFAULT_CONFIG = {
+    "seed": 0,
+    "detach": True,            # As the launcher: run in the background and return at once
+    "start_delay": 0.0,        # Seconds before the log appears (queue wait)
+    "write_interval": 0.5,     # Seconds between writes to the log
+    "reference_atoms": 30,     # Durations are for this many atoms...
+    "reference_cores": 16,     # ...on this many cores
+    "size_exponent": 1.0,      # Duration ~ atoms^size_exponent
+    "serial_fraction": 0.05,   # Amdahl's law over the cores
+    "chk_kb": 256,             # Checkpoint size at the end of a run
+    # Per step ("*": any step not listed). duration: median seconds and log-normal sigma,
+    # failure_rate: probability that a run fails, log_kb: final log size
+    "steps": {"*": {"duration": 2.0, "sigma": 0.3, "failure_rate": 0.0, "log_kb": 200}},
+    # Relative weights of the failure kinds drawn for a failed run
+    "failure_kinds": {"scf_convergence": 3, "opt_steps": 3, "memory": 1, "io": 1, "crash": 1, "stall": 0},
+}
+
+# Lines written before the error termination of each failure kind
+FAILURE_MESSAGES = {
+    "scf_convergence": [" >>>>>>>>>> Convergence criterion not met.", " Convergence failure -- run terminated."],
+    "opt_steps": [" Optimization stopped.", "    -- Number of steps exceeded,  NStep=  100"],
+    "memory": [" galloc:  could not allocate memory."],
+    "io": [" Erroneous write. Write -1 instead of 1048576."],
+    "crash": [" Error: segmentation violation"],
+}
+FILLER = " " + " ".join(f"{n:9.6f}" for n in (0.123456, -1.234567, 2.345678, -0.456789, 1.567890, -2.678901)) + "\n"
+
+def load_config():
+    """DEFAULT_CONFIG updated with the JSON file in FAKE_GAUSSIAN_CONFIG (steps are merged key by key)."""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    path = os.environ.get(CONFIG_ENVIRONMENT)
+    if path:
+        with open(path, "r") as f:
+            user = json.load(f)
+        steps = user.pop("steps", {})
+        config.update(user)
+        for step, settings in sorted(steps.items(), key=lambda item: item[0] != "*"):  # "*" first: the others build on it
+            config["steps"][str(step)] = {**config["steps"]["*"], **settings}
+    return config
+
+def parse_sections(text):
+    """
+    Link 0 commands, route, title, charge/multiplicity and atom count of every --Link1-- section
+    of an input.
+
+    Returns:
+    list: dicts with link0 (dict), route, title, step (int or None), charge, multiplicity, atoms
+    """
+    sections = []
+    for block in re.split(r"^--Link1--\s*$", text, flags=re.MULTILINE):
+        lines = block.lstrip("\n").splitlines()  # The split leaves the newline that ends "--Link1--"
+        link0, route, i = {}, [], 0
+        while i < len(lines) and lines[i].startswith("%"):
+            key, _, value = lines[i][1:].partition("=")
+            link0[key.strip().lower()] = value.strip()
+            i += 1
+        while i < len(lines) and lines[i].strip():
+            route.append(lines[i].strip())
+            i += 1
+        title, i = [], i + 1
+        while i < len(lines) and lines[i].strip():
+            title.append(lines[i].strip())
+            i += 1
+        charge_line = lines[i + 1].split() if i + 1 < len(lines) else ["0", "1"]
+        atoms = sum(1 for line in lines[i + 2:] if len(line.split()) >= 4)
+        step = re.search(r"Step (\d+)", " ".join(title))
+        sections.append({"link0": link0, "route": " ".join(route), "title": " ".join(title),
+                         "step": int(step.group(1)) if step else None, "charge": charge_line[0],
+                         "multiplicity": charge_line[1] if len(charge_line) > 1 else "1", "atoms": atoms})
+    return sections
+
+def checkpoint_atoms(chk_path):
+    """Atom count stored in a fake checkpoint (None for a missing or real one)."""
+    try:
+        with open(chk_path, "rb") as f:
+            header = f.read(64)
+    except OSError:
+        return None
+    match = re.match(re.escape(CHK_MAGIC) + rb" atoms=(\d+)", header)
+    return int(match.group(1)) if match else None
+
+def _duration_text(seconds):
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(days)} days {int(hours):2d} hours {int(minutes):2d} minutes {seconds:4.1f} seconds."
+
+def _now():
+    return time.strftime("%a %b %d %H:%M:%S %Y")
+
+class FakeRun:
+    """
+    Simulated run of one input.
+
+    Args:
+    com_text (str): The input
+    config (dict): load_config()
+    """
+    def __init__(self, com_text, config):
+        self.config = config
+        self.sections = parse_sections(com_text)
+        self.random = random.Random(f"{config['seed']}\n{com_text}")
+        self.failure = None
+
+    def settings(self, section):
+        return self.config["steps"].get(str(section["step"]), self.config["steps"]["*"])
+
+    def plan(self, section, atoms):
+        """(duration in seconds, failure kind or None, fraction of the run done before failing)."""
+        settings, config = self.settings(section), self.config
+        cores = int(section["link0"].get("nprocshared", config["reference_cores"]) or config["reference_cores"])
+        s = config["serial_fraction"]
+        amdahl = (s + (1 - s) / cores) / (s + (1 - s) / config["reference_cores"])
+        size = (max(atoms, 1) / config["reference_atoms"]) ** config["size_exponent"]
+        duration = settings["duration"] * size * amdahl * math.exp(self.random.gauss(0, settings.get("sigma", 0)))
+        if self.random.random() >= settings.get("failure_rate", 0):
+            return duration, None, 1.0
+        kinds = {kind: weight for kind, weight in config["failure_kinds"].items() if weight > 0}
+        kind = self.random.choices(list(kinds), list(kinds.values()))[0] if kinds else "error"
+        return duration, kind, self.random.uniform(0.1, 0.9)
+
+    def run(self, log, chk_folder="."):
+        """Writes the log of every section to the open binary file log, growing the checkpoints as it goes."""
+        config = self.config
+        if config["start_delay"]:
+            time.sleep(config["start_delay"])
+        atoms = None
+        for section in self.sections:
+            chk_path = os.path.join(chk_folder, section["link0"]["chk"]) if section["link0"].get("chk") else None
+            if section["atoms"]:
+                atoms = section["atoms"]
+            elif atoms is None:
+                atoms = (checkpoint_atoms(chk_path) if chk_path else None) or config["reference_atoms"]
+            if not self.run_section(section, atoms, log, chk_path):
+                return False
+        return True
+
+    def run_section(self, section, atoms, log, chk_path):
+        config = self.config
+        duration, failure, failure_point = self.plan(section, atoms)
+        steps = count_job_steps(section["route"])
+        basis = int(atoms * 9.5)
+        target_bytes = self.settings(section).get("log_kb", 200) * 1024 / max(len(self.sections), 1)
+        writes = max(1, int(duration / config["write_interval"]))
+        cores = section["link0"].get("nprocshared", "1")
+
+        def write(text):
+            log.write(text.encode())
+            log.flush()
+
+        route_echo = "".join(f" {section['route'][i:i + 70]}\n" for i in range(0, len(section["route"]), 70))
+        header = (f" Entering Gaussian System, Link 0=g16\n Input=stdin\n Output=stdout\n"
+                  + "".join(f" %{key}={value}\n" for key, value in section["link0"].items())
+                  + f" Will use up to {cores} processors via shared memory.\n"
+                  + f" {'-' * 70}\n{route_echo} {'-' * 70}\n {'-' * len(section['title'])}\n {section['title']}\n"
+                  + f" {'-' * len(section['title'])}\n Charge = {section['charge']} Multiplicity = {section['multiplicity']}\n"
+                  + f" NAtoms=   {atoms} NQM=   {atoms} NQMF=    0 NMMM=    0 NMMF=      0 NMic=       0\n"
+                  + f"   {basis} basis functions,  {basis * 2} primitive gaussians\n"
+                  + f" NBasis=   {basis} RedAO= T EigKep=  1.00D-05  NBF=   {basis}\n")
+        write(header)
+        written, energy, cycle, opt_step = len(header), -1000.0 - atoms, 0, 0
+        started = time.monotonic()
+        job_writes = max(1, writes // steps)
+        for job in range(steps):
+            job_started = time.monotonic()
+            for i in range(job_writes):
+                progress = (job * job_writes + i + 1) / (job_writes * steps)
+                time.sleep(max(0.0, started + duration * progress - time.monotonic()))
+                cycle += 1
+                energy -= 1e-4 / cycle
+                chunk = f" SCF Done:  E(RB3LYP) =  {energy:.9f}     A.U. after   {12 + cycle % 5} cycles\n"
+                if "opt" in section["route"].lower() and job == 0:
+                    opt_step += 1
+                    chunk += f" Step number  {opt_step} out of a maximum of  100\n"
+                # Filler up to the configured log size
+                chunk += FILLER * max(0, int((target_bytes * progress - written - len(chunk)) / len(FILLER)))
+                write(chunk)
+                written += len(chunk)
+                if chk_path:
+                    self.grow_checkpoint(chk_path, atoms, progress)
+                if failure is not None and progress >= failure_point:
+                    self.fail(failure, write, time.monotonic() - job_started)
+                    return False
+            elapsed = time.monotonic() - job_started
+            write(f" Job cpu time:       {_duration_text(elapsed * int(cores) * 0.9)}\n"
+                  f" Elapsed time:       {_duration_text(elapsed)}\n"
+                  f" Normal termination of Gaussian 16 at {_now()}.\n")
+        return True
+
+    def fail(self, failure, write, elapsed):
+        self.failure = failure
+        if failure == "stall":
+            return  # The log simply stops growing, as when a node hangs
+        write("\n".join(FAILURE_MESSAGES.get(failure, [])) + "\n"
+              f" Error termination via Lnk1e in /opt/g16/l502.exe at {_now()}.\n"
+              f" Job cpu time:       {_duration_text(elapsed)}\n Elapsed time:       {_duration_text(elapsed)}\n")
+
+    def grow_checkpoint(self, chk_path, atoms, progress):
+        size = int(self.config["chk_kb"] * 1024 * progress)
+        with open(chk_path, "ab") as f:
+            if f.tell() == 0:
+                f.write(CHK_MAGIC + f" atoms={atoms}\n".encode())
+            if f.tell() < size:
+                f.write(b"\0" * (size - f.tell()))
+
+def run_file(com_file, log_file, config):
+    """Simulates com_file into log_file (checkpoints next to the input). Returns True on success."""
+    with open(com_file, "r") as f:
+        run = FakeRun(f.read(), config)
+    with open(log_file, "wb") as log:
+        return run.run(log, os.path.dirname(os.path.abspath(com_file)))
+
+def main():
+    config = load_config()
+    arguments = sys.argv[1:]
+    if arguments and arguments[0] == "--run":  # Detached run started by the launcher mode
+        sys.exit(0 if run_file(arguments[1], arguments[2], config) else 1)
+    if arguments:  # Launcher mode: fake_gaussian.py stepN.com, from the step folder
+        com_file = arguments[0]
+        log_file = f"{os.path.splitext(com_file)[0]}.log"
+        if not config["detach"]:
+            sys.exit(0 if run_file(com_file, log_file, config) else 1)
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run", com_file, log_file], start_new_session=True,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print(f"Fake job started for {com_file}")
+        return
+    # g16 mode: input on stdin, log on stdout, checkpoints in the working directory
+    run = FakeRun(sys.stdin.read(), config)
+    sys.exit(0 if run.run(sys.stdout.buffer, os.getcwd()) else 1)
+
+if __name__ == "__main__":
+    main()
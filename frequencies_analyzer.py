@@ -5,75 +5,175 @@
 # Citation: If you use this code, please cite Lopez-Corbalan, R.
 
 import os
-import glob
 import csv
-
-def process_log_files():
-    frequency_results = []
-    processed_files = set()
+import argparse
+import numpy as np
+from gaussian_log_parser import LogParser, FrequencyExtractor, iter_log_files
+from log_index import LogIndex
+from scan_manifest import ScanManifest
+from results_store import ResultsStore, DEFAULT_RESULTS_FILE
+
+# Physical constants (CODATA 2018)
+PLANCK = 6.62607015e-34          # J s
+SPEED_OF_LIGHT = 2.99792458e10   # cm/s
+BOLTZMANN = 1.380649e-23         # J/K
+HARTREE = 4.3597447222071e-18    # J
+
+FIELDS = ("frequencies", "reduced_masses", "force_constants", "ir_intensities")
+SPURIOUS_THRESHOLD = 50.0  # cm-1: modes below this (in absolute value) are usually numerical noise or hindered rotations
+
+def vibrational_analysis(block, spurious_threshold=SPURIOUS_THRESHOLD):
+    """
+    Converts one frequency block of FrequencyExtractor into NumPy arrays.
+
+    Args:
+    block (dict): Block as returned by FrequencyExtractor
+    spurious_threshold (float): |frequency| (cm-1) below which a mode is flagged as spurious
+
+    Returns:
+    dict: frequencies, reduced_masses, force_constants, ir_intensities (n_modes arrays), modes
+          ((n_modes, n_atoms, 3) array, if read), imaginary (count), spurious (boolean mask)
+    """
+    analysis = {field: np.array(block[field], dtype=np.float64) for field in FIELDS}
+    if block.get("modes"):
+        analysis["modes"] = np.array(block["modes"], dtype=np.float64)
+    frequencies = analysis["frequencies"]
+    analysis["imaginary"] = int(np.count_nonzero(frequencies < 0))
+    analysis["spurious"] = np.abs(frequencies) < spurious_threshold
+    return analysis
+
+def vibrational_thermochemistry(frequencies, temperatures=298.15, low_frequency_cutoff=None):
+    """
+    Harmonic-oscillator vibrational contributions to the thermochemistry, for any number of
+    temperatures at once. Imaginary modes are left out, as Gaussian does.
+
+    Args:
+    frequencies (ndarray): Frequencies in cm-1
+    temperatures (float or ndarray): Temperatures in K (> 0)
+    low_frequency_cutoff (float): If given, real modes below it are raised to it (quasi-harmonic
+                                  correction of Truhlar for the entropy of low modes)
+
+    Returns:
+    dict: zero_point (Hartree), and arrays shaped like temperatures: thermal_energy (ZPE
+          included, Hartree), entropy (Hartree/K), gibbs (thermal_energy - T*entropy, Hartree)
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    frequencies = frequencies[frequencies > 0]
+    if low_frequency_cutoff is not None:
+        frequencies = np.maximum(frequencies, low_frequency_cutoff)
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    theta = PLANCK * SPEED_OF_LIGHT * frequencies / BOLTZMANN   # Vibrational temperatures (n_modes,)
+    x = theta / temperatures[..., None]                           # (..., n_modes)
+
+    with np.errstate(over="ignore"):
+        occupation = 1 / np.expm1(x)                               # Bose-Einstein; 0 for very stiff modes
+    zero_point = 0.5 * BOLTZMANN * theta.sum() / HARTREE
+    thermal_energy = BOLTZMANN * (theta * (0.5 + occupation)).sum(axis=-1) / HARTREE
+    entropy = BOLTZMANN * (x * occupation - np.log(-np.expm1(-x))).sum(axis=-1) / HARTREE
+    return {"zero_point": zero_point, "thermal_energy": thermal_energy, "entropy": entropy,
+            "gibbs": thermal_energy - temperatures * entropy}
+
+def process_log_files(temperature=298.15, spurious_threshold=SPURIOUS_THRESHOLD, with_modes=False, manifest_file="frequency_manifest.sqlite",
+                      results_file=DEFAULT_RESULTS_FILE, full=False):
+    """
+    Analyzes the frequencies of every .log file below the current directory and writes
+    frequency_results.csv.
+
+    Args:
+    temperature (float): Temperature (K) of the vibrational thermochemistry columns
+    spurious_threshold (float): |frequency| (cm-1) below which a mode is flagged as spurious
+    with_modes (bool): Also read the normal-mode displacements (the manifest does not store them: every log is parsed)
+    manifest_file (str): Scan manifest (see scan_manifest.py): only new, grown or replaced logs are
+                         parsed and the rest is taken from it. None parses every log
+    results_file (str): Results store (see results_store.py) the frequencies are added to, None to skip it
+    full (bool): Parse every log again and rewrite the manifest with what was read
+
+    Returns:
+    dict: {relative path: analysis dict} of the logs with frequencies
+    """
+    frequency_results = {}
+    parser = LogParser([FrequencyExtractor(modes=with_modes)])
+    log_index = LogIndex()  # Section offsets cached across runs
 
     # Get the current directory
     base_directory = os.getcwd()
     print(f"Current directory: {base_directory}")
+    manifest = ScanManifest(os.path.join(base_directory, manifest_file)) if manifest_file else None
+
+    seen, parsed = [], {}  # parsed: {relative path: stat} of the logs read in this run
+    for file_path in iter_log_files(base_directory):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue  # Removed while scanning
+        relative_path = os.path.relpath(file_path, base_directory)
+        seen.append(relative_path)
+        if manifest is not None and not (with_modes or full):
+            unchanged, block = manifest.lookup(relative_path, stat)
+            if unchanged:
+                if block is not None:
+                    frequency_results[relative_path] = vibrational_analysis(block, spurious_threshold)
+                continue
+        try:
+            blocks = parser.parse(file_path, log_index)["frequencies"]["blocks"]
+        except (OSError, ValueError) as e:
+            print(f"Error processing {file_path}: {e}")
+            continue
+        parsed[relative_path] = stat
+        block = blocks[-1] if blocks and blocks[-1]["frequencies"] else None  # The one after the last "Low frequencies"
+        if block is not None:
+            frequency_results[relative_path] = vibrational_analysis(block, spurious_threshold)
+        if manifest is not None:
+            manifest.update(relative_path, stat, None if block is None else {field: block[field] for field in FIELDS})
+
+    if manifest is not None:
+        manifest.prune(seen)
+        manifest.close()
+    print(f"Parsed {len(parsed)} of {len(seen)} log files.")
+
+    if results_file:
+        # Only the logs read in this run: the others are stored from an earlier one
+        store = ResultsStore(os.path.join(base_directory, results_file))
+        store.update_many({"log_file": os.path.join(base_directory, filename), "stat": stat,
+                           "scalars": {"imaginary_modes": frequency_results[filename]["imaginary"],
+                                       "lowest_frequency": float(frequency_results[filename]["frequencies"].min())},
+                           "arrays": {field: frequency_results[filename][field] for field in FIELDS}}
+                          for filename, stat in parsed.items() if filename in frequency_results)
+        store.close()
 
     # Open the results file
     with open('frequency_results.csv', 'w', newline='') as result_file:
         csv_writer = csv.writer(result_file)
-        csv_writer.writerow(["Filename", "Frequencies", "Negatives?"])
-
-        for file_path in glob.iglob(f"{base_directory}/**/*.log", recursive=True):
-            if file_path in processed_files:
-                continue
-
-            print(f"Processing file: {file_path}")
-            processed_files.add(file_path)
-
-            with open(file_path, "r") as log:
-                lines = log.readlines()
-
-                patterns = ["Diagonal vibrational", None, "Harmonic", None, None, None, None, None, "Frequencies --"]
-                pattern_index = 0
-                low_freq_line = None
-                frequencies = []
-
-                # Search for "Low frequencies" from the end of the file
-                for line_num, line in enumerate(reversed(lines)):
-                    if "Low frequencies" in line:
-                        print(f"Found 'Low frequencies' on line {len(lines) - line_num}: {line.strip()}")
-                        low_freq_line = len(lines) - line_num
-                        break
-
-                if low_freq_line is not None:
-                    for line in lines[low_freq_line:]:
-                        if patterns[pattern_index] is None:
-                            pattern_index += 1
-                            continue
-                        elif patterns[pattern_index] in line:
-                            print(f"Pattern found: {patterns[pattern_index]} in line: {line.strip()}")
-                            pattern_index += 1
-                            if pattern_index == len(patterns):
-                                break
-                        else:
-                            print(f"'{patterns[pattern_index]}' not found in line: '{line.strip()}'")
-
-                    if "Frequencies --" in line:
-                        frequency_data = line.split("Frequencies --")[1].strip()
-                        frequencies = frequency_data.split()
-
-                        first_frequency = float(frequencies[0]) if frequencies else 0.0
-                        negatives = "YES" if first_frequency < 0 else "NO"
-
-                        filename = os.path.basename(file_path)
-                        csv_writer.writerow([filename, frequency_data, negatives])
-                        print(f"Frequency found in file {filename}: {frequency_data} -> Negatives? {negatives}")
-                        frequency_results.append(f"Frequency found in file {filename}")
+        csv_writer.writerow(["Filename", "Frequencies", "Negatives?", "Imaginary modes", "Lowest frequency",
+                             f"Modes below {spurious_threshold:g} cm-1", "Zero-point (Hartree)",
+                             f"Vibrational thermal energy {temperature:g} K (Hartree)",
+                             f"Vibrational entropy {temperature:g} K (Hartree/K)",
+                             f"Vibrational G {temperature:g} K (Hartree)"])
+        for filename, analysis in frequency_results.items():
+            frequencies = analysis["frequencies"]
+            thermochemistry = vibrational_thermochemistry(frequencies, temperature)
+            csv_writer.writerow([filename, "  ".join(f"{frequency:.4f}" for frequency in frequencies[:3]),
+                                 "YES" if analysis["imaginary"] else "NO", analysis["imaginary"],
+                                 f"{frequencies.min():.4f}", int(analysis["spurious"].sum()),
+                                 f"{thermochemistry['zero_point']:.6f}", f"{thermochemistry['thermal_energy']:.6f}",
+                                 f"{thermochemistry['entropy']:.6e}", f"{thermochemistry['gibbs']:.6f}"])
 
     return frequency_results
 
 if __name__ == "__main__":
-    results = process_log_files()
+    parser = argparse.ArgumentParser(description="Vibrational analysis of every Gaussian .log file below the current directory.")
+    parser.add_argument("--temperature", type=float, default=298.15, help="Temperature (K) of the thermochemistry columns")
+    parser.add_argument("--spurious-threshold", type=float, default=SPURIOUS_THRESHOLD, help="Flag modes with |frequency| below this (cm-1)")
+    parser.add_argument("--full", action="store_true", help="Parse every log again instead of only new or changed ones")
+    parser.add_argument("--no-store", action="store_true", help=f"Do not add the frequencies to the results store ({DEFAULT_RESULTS_FILE})")
+    args = parser.parse_args()
+    results = process_log_files(args.temperature, args.spurious_threshold,
+                                results_file=None if args.no_store else DEFAULT_RESULTS_FILE, full=args.full)
 
     if results:
-        print("Frequencies found:", results)
+        imaginary = [filename for filename, analysis in results.items() if analysis["imaginary"]]
+        print(f"Frequencies found in {len(results)} files; {len(imaginary)} with imaginary modes.")
+        for filename in imaginary:
+            print(f"    {filename}: {results[filename]['imaginary']} imaginary")
     else:
         print("No complete sequence found.")
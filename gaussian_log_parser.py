@@ -0,0 +1,702 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Streaming Gaussian Log Parser
+
+Reads a .log file once, in fixed-size chunks, and hands each section to the extractors
+registered for it. The markers that open a section are located with bytes.find over each chunk,
+so lines outside any section are never split or decoded, and memory use does not depend on the
+size of the log. With a LogIndex (log_index.py), the offsets of the main sections are cached and
+later parses of an unchanged log read only those sections.
+
+Usage:
+    parser = LogParser([ScfEnergyExtractor(), EspChargesExtractor()])
+    results = parser.parse("step1.log")      # {"scf_energies": [...], "esp_charges": [...]}
+
+Writing an extractor: set name and triggers (bytes markers), implement start(line) and, for
+multi-line sections, feed(line). start returns True to receive the following lines; feed returns
+False on the first line that no longer belongs to the section (that line is then scanned for
+triggers again).
+"""
+import os
+import re
+import sys
+import mmap
+import fnmatch
+
+CHUNK_SIZE = 8 * 1024 * 1024
+REVERSE_BLOCK_SIZE = 1024 * 1024
+NUMBER = re.compile(r"-?\d+\.\d+")
+
+class Extractor:
+    name = None
+    triggers = ()
+
+    def reset(self):
+        """Clears the results before a new log is parsed."""
+
+    def start(self, line):
+        """Called with a line containing one of the triggers. Return True to receive the next lines."""
+        return False
+
+    def feed(self, line):
+        """Called with each following line while the section lasts. Return False when it is over."""
+        return False
+
+    def result(self):
+        raise NotImplementedError
+
+class AtomCountExtractor(Extractor):
+    """Number of atoms, from the first "NAtoms=" line; None if absent."""
+    name = "atom_count"
+    triggers = (b"NAtoms=",)
+
+    def reset(self):
+        self.count = None
+
+    def start(self, line):
+        # NAtoms=     72 NActive=     72 NUniq=     72 SFac= 1.00D+00 NAtFMM=   60 NAOKFM=T Big=F
+        if self.count is None:
+            self.count = int(line.split("NAtoms=")[1].split()[0])
+        return False
+
+    def result(self):
+        return self.count
+
+class ScfEnergyExtractor(Extractor):
+    """Every "SCF Done:" energy, in Hartree, in order of appearance."""
+    name = "scf_energies"
+    triggers = (b"SCF Done:",)
+
+    def reset(self):
+        self.energies = []
+
+    def start(self, line):
+        # SCF Done:  E(RB3LYP) =  -2820.25150012     A.U. after   14 cycles
+        self.energies.append(float(line.split("=")[1].split()[0]))
+        return False
+
+    def result(self):
+        return self.energies
+
+class EspChargesExtractor(Extractor):
+    """
+    Every "ESP charges:" block, as a list of (atom number, element, charge) per block.
+
+    Args:
+    totals (bool): Bound each block by the log's atom count ("NAtoms=") and return it as
+                   (rows, total), total being the "Sum of ESP charges" that follows the last atom;
+                   None when the block ends before it or something else follows (truncated log,
+                   atom count and block disagree)
+    """
+    name = "esp_charges"
+
+    def __init__(self, totals=False):
+        self.totals = totals
+        self.triggers = (b"ESP charges:", b"NAtoms=") if totals else (b"ESP charges:",)
+
+    def reset(self):
+        self.blocks = []
+        self.block_totals = []
+        self.atoms = None
+
+    def start(self, line):
+        if "NAtoms=" in line:
+            if self.atoms is None:
+                self.atoms = int(line.split("NAtoms=")[1].split()[0])
+            return False
+        self.blocks.append([])
+        self.block_totals.append(None)
+        return True
+
+    def feed(self, line):
+        parts = line.split()
+        if len(parts) == 1 and parts[0].isdigit():  # Column header
+            return True
+        full = self.totals and self.atoms is not None and len(self.blocks[-1]) == self.atoms
+        if len(parts) == 3 and parts[0].isdigit() and not full:
+            self.blocks[-1].append((int(parts[0]), parts[1], float(parts[2])))
+            return True
+        if full and "Sum of ESP charges" in line:
+            self.block_totals[-1] = float(line.split("=")[1].split()[0])
+        return False  # "Sum of ESP charges = ..."
+
+    def result(self):
+        if self.totals:
+            return list(zip(self.blocks, self.block_totals))
+        return self.blocks
+
+class FrequencyExtractor(Extractor):
+    """
+    Every "Harmonic frequencies" block, as a dict of lists: frequencies (cm-1), reduced masses
+    (AMU), force constants (mDyne/A) and IR intensities (KM/Mole); plus the "Low frequencies" lines.
+
+    Args:
+    modes (bool): Also read the normal-mode displacements: block["modes"][i] is the list of
+                  (x, y, z) per atom of mode i (not available for the Freq=HPModes block)
+    """
+    name = "frequencies"
+    triggers = (b"Harmonic frequencies", b"Low frequencies")
+    FIELDS = {"Frequencies --": "frequencies", "Red. masses --": "reduced_masses",
+              "Frc consts  --": "force_constants", "IR Inten    --": "ir_intensities",
+              # High-precision block (Freq=HPModes)
+              "Reduced masses ---": "reduced_masses", "Force constants ---": "force_constants",
+              "IR Intensities ---": "ir_intensities"}
+
+    def __init__(self, modes=False):
+        self.modes = modes
+
+    def reset(self):
+        self.blocks = []
+        self.low_frequencies = []
+
+    def start(self, line):
+        if "Low frequencies" in line:
+            # Fixed-width fields: large values can run together ("-12.3456-10.1234")
+            self.low_frequencies.append([float(value) for value in NUMBER.findall(line.split("---", 1)[1])])
+            return False
+        self.blocks.append({field: [] for field in self.FIELDS.values()})
+        self.blocks[-1]["high_precision"] = False
+        if self.modes:
+            self.blocks[-1]["modes"] = []
+        self.group = (0, 0)  # (first mode, number of modes) of the current group of columns
+        return True
+
+    def feed(self, line):
+        if "- Thermochemistry -" in line or "Low frequencies" in line or "Harmonic frequencies" in line:
+            return False
+        block = self.blocks[-1]
+        if "--" in line:
+            for label, field in self.FIELDS.items():
+                if label in line:
+                    values = [float(value) for value in line.split("--", 1)[1].lstrip("-").split()]
+                    if field == "frequencies":
+                        block["high_precision"] |= "Frequencies ---" in line
+                        self.group = (len(block["frequencies"]), len(values))
+                        if self.modes:
+                            block["modes"] += [[] for _ in values]
+                    block[field] += values
+                    break
+        elif self.modes and not block["high_precision"]:
+            # Displacements:  atom  AN   x y z   x y z   x y z
+            parts = line.split()
+            first, size = self.group
+            if len(parts) == 2 + 3 * size and size and parts[0].isdigit() and parts[1].isdigit():
+                values = [float(value) for value in parts[2:]]
+                for column in range(size):
+                    block["modes"][first + column].append(values[3 * column:3 * column + 3])
+        return True
+
+    def result(self):
+        return {"blocks": self.blocks, "low_frequencies": self.low_frequencies}
+
+class ExcitedStateExtractor(Extractor):
+    """Every "Excited State" line: state, label, excitation energy (eV), wavelength (nm), oscillator strength."""
+    name = "excited_states"
+    triggers = (b" Excited State ",)
+    PATTERN = re.compile(r"Excited State\s+(\d+):\s+(\S+)\s+([-\d.]+) eV\s+([-\d.]+) nm\s+f=([-\d.]+)")
+
+    def reset(self):
+        self.states = []
+
+    def start(self, line):
+        match = self.PATTERN.search(line)
+        if match:
+            state, label, energy, wavelength, strength = match.groups()
+            self.states.append({"state": int(state), "label": label, "energy_ev": float(energy),
+                                "wavelength_nm": float(wavelength), "oscillator_strength": float(strength)})
+        return False
+
+    def result(self):
+        return self.states
+
+def last_excited_block(states):
+    """Excited states of the last TD calculation of a log (an optimization prints one block per cycle)."""
+    starts = [i for i, state in enumerate(states) if state["state"] == 1]
+    return states[starts[-1]:] if starts else states
+
+class ThermochemistryExtractor(Extractor):
+    """Zero-point/thermal corrections and the "Sum of electronic and ..." energies (Hartree), last occurrence."""
+    name = "thermochemistry"
+    LABELS = {
+        "Zero-point correction=": "zero_point_correction",
+        "Thermal correction to Energy=": "thermal_correction_energy",
+        "Thermal correction to Enthalpy=": "thermal_correction_enthalpy",
+        "Thermal correction to Gibbs Free Energy=": "thermal_correction_gibbs",
+        "Sum of electronic and zero-point Energies=": "electronic_zero_point",
+        "Sum of electronic and thermal Energies=": "electronic_thermal_energy",
+        "Sum of electronic and thermal Enthalpies=": "electronic_thermal_enthalpy",
+        "Sum of electronic and thermal Free Energies=": "electronic_thermal_free_energy",
+    }
+    triggers = tuple(label.encode() for label in LABELS)
+
+    def reset(self):
+        self.values = {}
+
+    def start(self, line):
+        for label, key in self.LABELS.items():
+            if label in line:
+                self.values[key] = float(line.split("=")[1].split()[0])
+                break
+        return False
+
+    def result(self):
+        return self.values
+
+class TerminationExtractor(Extractor):
+    """The last termination line ("Normal termination ..." or "Error termination ..."), or None."""
+    name = "termination"
+    triggers = (b"Normal termination", b"Error termination")
+
+    def reset(self):
+        self.line = None
+
+    def start(self, line):
+        self.line = line.strip()
+        return False
+
+    def result(self):
+        return self.line
+
+class JobSetupExtractor(Extractor):
+    """
+    How the (first) job of a log was set up: %nprocshared and %mem as written in the input, the
+    route section (as echoed, continuation lines joined) and the number of basis functions.
+    """
+    name = "job_setup"
+    triggers = (b"%nproc", b"%mem", b" #", b"NBasis=")
+
+    def reset(self):
+        self.setup = {"nprocshared": None, "mem": None, "route": None, "basis_functions": None}
+        self.route_lines = None
+
+    def start(self, line):
+        text = line.strip()
+        lowered = text.lower()
+        if lowered.startswith("%nproc") and self.setup["nprocshared"] is None:
+            value = text.split("=", 1)[-1].strip()
+            self.setup["nprocshared"] = int(value) if value.isdigit() else None
+        elif lowered.startswith("%mem") and self.setup["mem"] is None:
+            self.setup["mem"] = text.split("=")[1].strip() if "=" in text else None
+        elif "NBasis=" in line and self.setup["basis_functions"] is None:
+            # NBasis=   302 RedAO= T EigKep=  1.07D-05  NBF=   302
+            self.setup["basis_functions"] = int(line.split("NBasis=")[1].split()[0])
+        elif line.startswith(" #") and self.setup["route"] is None:
+            self.route_lines = [line.rstrip("\r\n")[1:]]
+            return True
+        return False
+
+    def feed(self, line):
+        text = line.strip()
+        if not text or set(text) == {"-"}:  # The route is echoed between two lines of dashes
+            self.setup["route"] = "".join(self.route_lines).strip()
+            return False
+        self.route_lines.append(line.rstrip("\r\n")[1:])  # The echo is cut at a fixed width, even inside a keyword
+        return True
+
+    def result(self):
+        if self.setup["route"] is None and self.route_lines:
+            self.setup["route"] = "".join(self.route_lines).strip()
+        return self.setup
+
+class JobStatisticsExtractor(Extractor):
+    """
+    Totals over the job steps of a log: Gaussian's "Job cpu time" and "Elapsed time" (seconds),
+    SCF cycles ("SCF Done ... after N cycles"), optimization steps ("Step number N") and the
+    number of job steps that reported their times.
+    """
+    name = "job_statistics"
+    triggers = (b"Job cpu time:", b"Elapsed time:", b"SCF Done:", b"Step number")
+    DURATION = re.compile(r"([\d.]+)\s+days\s+([\d.]+)\s+hours\s+([\d.]+)\s+minutes\s+([\d.]+)\s+seconds")
+
+    def reset(self):
+        self.statistics = {"cpu_time": 0.0, "elapsed_time": 0.0, "scf_cycles": 0, "opt_steps": 0, "jobs": 0}
+
+    def start(self, line):
+        if "SCF Done:" in line:
+            # SCF Done:  E(RB3LYP) =  -2820.25150012     A.U. after   14 cycles
+            parts = line.split("after")
+            if len(parts) > 1 and parts[1].split()[0].isdigit():
+                self.statistics["scf_cycles"] += int(parts[1].split()[0])
+        elif "Step number" in line:
+            self.statistics["opt_steps"] += 1
+        else:
+            # Job cpu time:       0 days  1 hours 23 minutes 45.6 seconds.
+            match = self.DURATION.search(line)
+            if match:
+                days, hours, minutes, seconds = (float(value) for value in match.groups())
+                key = "cpu_time" if "Job cpu time" in line else "elapsed_time"
+                self.statistics[key] += ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+                self.statistics["jobs"] += key == "cpu_time"
+        return False
+
+    def result(self):
+        return self.statistics
+
+class TextSearchExtractor(Extractor):
+    """
+    What follows search_text on the first (or last) line that contains it, stripped; None if absent.
+
+    Args:
+    search_text (str): Text to look for
+    last (bool): Keep the last occurrence instead of the first
+    name (str): Key of the result (defaults to the search text)
+    """
+    def __init__(self, search_text, last=False, name=None):
+        self.search_text = search_text
+        self.last = last
+        self.name = search_text if name is None else name
+        self.triggers = (search_text.encode(),)
+
+    def reset(self):
+        self.value = None
+        self.found = False
+
+    def start(self, line):
+        if self.last or not self.found:
+            self.value = line.split(self.search_text, 1)[1].strip()
+            self.found = True
+        return False
+
+    def result(self):
+        return self.value
+
+def _find_all(block, marker):
+    found = block.find(marker)
+    while found != -1:
+        yield found
+        found = block.find(marker, found + len(marker))
+
+class _MarkerScanner:
+    """
+    Earliest occurrence of any of several byte markers in a block. Each marker is searched with
+    bytes.find, which is much faster than an alternation regex over the whole block; the next
+    occurrence of every marker is cached until the scan moves past it.
+    """
+    def __init__(self, block, markers):
+        self.block = block
+        self.next = {marker: block.find(marker) for marker in markers}
+
+    def search(self, position):
+        """Returns (start, marker) of the first marker at or after position, or None."""
+        best = None
+        for marker, found in self.next.items():
+            if -1 < found < position:
+                found = self.next[marker] = self.block.find(marker, position)
+            if found != -1 and (best is None or found < best[0] or (found == best[0] and len(marker) > len(best[1]))):
+                best = (found, marker)
+        return best
+
+class LogParser:
+    """
+    Args:
+    extractors (list): Extractor instances; their results are returned under extractor.name
+    chunk_size (int): Bytes read at a time
+    """
+    def __init__(self, extractors=(), chunk_size=CHUNK_SIZE):
+        self.extractors = []
+        self.chunk_size = chunk_size
+        for extractor in extractors:
+            self.register(extractor)
+
+    def register(self, extractor):
+        self.extractors.append(extractor)
+        return extractor
+
+    def _trigger_table(self):
+        table = {}
+        for extractor in self.extractors:
+            for trigger in extractor.triggers:
+                table.setdefault(trigger, []).append(extractor)
+        return table
+
+    def _line_extractors(self, table, raw):
+        """
+        Extractors of every trigger on a line, once each and in registration order; triggers that
+        overlap (one a prefix of another) or sit side by side on the line are all dispatched.
+        """
+        hits = {id(extractor) for trigger, extractors in table.items() if trigger in raw for extractor in extractors}
+        return [extractor for extractor in self.extractors if id(extractor) in hits]
+
+    def parse_stream(self, stream, offsets=None):
+        """
+        Parses an open binary stream. Returns {extractor.name: extractor.result()}.
+
+        Args:
+        stream: Binary file object positioned at the start of the log
+        offsets (dict): If given, {marker: []} lists filled with the offset of every line containing each marker
+        """
+        for extractor in self.extractors:
+            extractor.reset()
+        table = self._trigger_table()
+        active = None
+        carry = b""
+        base = 0
+
+        while True:
+            chunk = stream.read(self.chunk_size)
+            data = carry + chunk
+            if not chunk and data and not data.endswith(b"\n"):
+                data += b"\n"
+            cut = data.rfind(b"\n") + 1
+            block, carry = data[:cut], data[cut:]
+
+            if offsets is not None:
+                for marker, positions in offsets.items():
+                    for found in _find_all(block, marker):
+                        line_start = base + block.rfind(b"\n", 0, found) + 1
+                        if not positions or positions[-1] != line_start:
+                            positions.append(line_start)
+
+            scanner = _MarkerScanner(block, table)
+            position = 0
+            while position < len(block):
+                if active is None:
+                    match = scanner.search(position)
+                    if match is None:
+                        break
+                    start, trigger = match
+                    line_start = max(block.rfind(b"\n", position, start) + 1, position)
+                    line_end = block.find(b"\n", start + len(trigger)) + 1
+                    raw = block[line_start:line_end]
+                    line = raw.decode("latin-1")
+                    position = line_end
+                    for extractor in self._line_extractors(table, raw):
+                        if extractor.start(line) and active is None:
+                            active = extractor
+                else:
+                    line_end = block.find(b"\n", position) + 1
+                    if active.feed(block[position:line_end].decode("latin-1")):
+                        position = line_end
+                    else:
+                        active = None  # The same line is scanned again for triggers
+            base += len(block)
+            if not chunk:
+                break
+
+        return {extractor.name: extractor.result() for extractor in self.extractors}
+
+    def _indexed_markers(self, markers):
+        """Maps every trigger to an indexed marker it contains; None if some trigger is not covered."""
+        covered = {}
+        for extractor in self.extractors:
+            for trigger in extractor.triggers:
+                marker = next((marker for marker in markers if marker in trigger), None)
+                if marker is None:
+                    return None
+                covered[trigger] = marker
+        return covered
+
+    def parse_indexed(self, stream, offsets):
+        """
+        Parses only the lines at the given section offsets (and the lines that continue those
+        sections). Gives the same results as parse_stream for extractors covered by the index.
+        """
+        for extractor in self.extractors:
+            extractor.reset()
+        table = self._trigger_table()
+        markers = set(self._indexed_markers(offsets).values())
+        candidates = sorted({offset for marker in markers for offset in offsets[marker]})
+        consumed = 0  # Lines before this offset already belong to a parsed section
+
+        for offset in candidates:
+            if offset < consumed:
+                continue
+            stream.seek(offset)
+            raw = stream.readline()
+            extractors = self._line_extractors(table, raw)
+            if not extractors:
+                continue  # Line holds the marker but not the full trigger
+            active = None
+            for extractor in extractors:
+                if extractor.start(raw.decode("latin-1")) and active is None:
+                    active = extractor
+            consumed = stream.tell()
+            while active is not None:
+                raw = stream.readline()
+                if not raw:
+                    break
+                if not active.feed(raw.decode("latin-1")):
+                    break  # The line that closed the section is a candidate of its own
+                consumed = stream.tell()
+
+        return {extractor.name: extractor.result() for extractor in self.extractors}
+
+    def parse(self, log_file, index=None):
+        """
+        Parses a log file. Returns {extractor.name: extractor.result()}.
+
+        Args:
+        log_file (str): Gaussian .log file
+        index (LogIndex): Section index (see log_index.py). Used when it holds a valid entry for
+                          the log and every trigger contains an indexed marker; filled by this
+                          parse when it has no valid entry
+        """
+        with open(log_file, "rb") as stream:
+            if index is None:
+                return self.parse_stream(stream)
+            stat = os.fstat(stream.fileno())
+            offsets = index.lookup(log_file, stat)
+            if offsets is not None:
+                if self._indexed_markers(offsets) is not None:
+                    return self.parse_indexed(stream, offsets)
+                return self.parse_stream(stream)  # Free-text trigger: the index cannot locate it
+            offsets = {marker: [] for marker in index.markers}
+            results = self.parse_stream(stream, offsets)
+            index.store(log_file, stat, offsets)
+            return results
+
+def parse_log(log_file, *extractors, index=None):
+    """Shortcut: parses log_file once with the given extractors."""
+    return LogParser(extractors).parse(log_file, index)
+
+def _line_at(stream, position):
+    """Returns the whole line containing byte position of a seekable binary stream."""
+    start = position
+    while start > 0:
+        step = min(4096, start)
+        stream.seek(start - step)
+        newline = stream.read(step).rfind(b"\n")
+        if newline != -1:
+            start = start - step + newline + 1
+            break
+        start -= step
+    stream.seek(start)
+    return stream.readline()
+
+def _find_backward(stream, needle, block_size=REVERSE_BLOCK_SIZE):
+    """Offset of the last occurrence of needle, reading fixed-size blocks backward from EOF; -1 if absent."""
+    size = end = stream.seek(0, os.SEEK_END)
+    overlap = len(needle) - 1  # A match may straddle two blocks
+    while end > 0:
+        start = max(0, end - block_size)
+        stream.seek(start)
+        block = stream.read(min(end + overlap, size) - start)
+        found = block.rfind(needle)
+        if found != -1:
+            return start + found
+        end = start
+    return -1
+
+def _scan_lines(mapped, needles, from_end=False, block_size=REVERSE_BLOCK_SIZE):
+    """
+    First (or last) line of mapped containing each needle, in one pass of a single compiled
+    alternation: forward from the start, or block by block backward from the end, stopping as
+    soon as every needle has its line. Every needle is checked against each matching line, so
+    needles that overlap (one a prefix of another) are all found.
+    """
+    wanted = set(needles)
+    lines = {}
+
+    def take(found):
+        line_start = mapped.rfind(b"\n", 0, found) + 1
+        line_end = mapped.find(b"\n", found) + 1 or len(mapped)
+        line = mapped[line_start:line_end]
+        for needle in wanted.difference(lines):
+            if needle in line:
+                lines[needle] = line
+        return line_end
+
+    if wanted:
+        pattern = re.compile(b"|".join(re.escape(needle) for needle in sorted(wanted, key=len, reverse=True)))
+        if from_end:
+            overlap = max(len(needle) for needle in wanted) - 1  # A match may straddle two blocks
+            end = len(mapped)
+            while end > 0 and len(lines) < len(wanted):
+                start = max(0, end - block_size)
+                for match in reversed(list(pattern.finditer(mapped, start, min(end + overlap, len(mapped))))):
+                    take(match.start())
+                end = start
+        else:
+            position = 0
+            while len(lines) < len(wanted):
+                match = pattern.search(mapped, position)
+                if match is None:
+                    break
+                position = take(match.start())
+    return [lines.get(needle) for needle in needles]
+
+def find_lines(log_file, search_texts, from_end=False):
+    """
+    First (or last) line of log_file containing each of search_texts, as bytes (None if absent).
+    The log is memory-mapped and scanned once for all the texts together, so only the pages
+    between the start (or the end) of the file and the last match needed are read; files that
+    cannot be mapped are read in blocks backward from EOF (or streamed forward).
+    """
+    needles = [text.encode() for text in search_texts]
+    with open(log_file, "rb") as stream:
+        try:
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):  # Empty file or a filesystem without mmap
+            mapped = None
+        if mapped is not None:
+            with mapped:
+                return _scan_lines(mapped, needles, from_end)
+        if from_end:
+            lines = []
+            for needle in needles:
+                found = _find_backward(stream, needle)
+                lines.append(None if found == -1 else _line_at(stream, found))
+            return lines
+        lines = [None] * len(needles)
+        for line in stream:
+            for position, needle in enumerate(needles):
+                if lines[position] is None and needle in line:
+                    lines[position] = line
+            if all(line is not None for line in lines):
+                break
+        return lines
+
+def find_line(log_file, search_text, from_end=False):
+    """First (or last) line of log_file containing search_text, as bytes, or None (see find_lines)."""
+    return find_lines(log_file, [search_text], from_end)[0]
+
+def search_logs(log_file, search_texts, from_end=False, index=None):
+    """
+    For each of search_texts, what follows it on the first (or last) line that contains it,
+    stripped; None if absent. When every text contains an indexed marker, the log is read through
+    the section index: only the indexed sections when its entry is valid, otherwise one full parse
+    that fills the entry for the next query. Without an index, or for other texts, find_lines.
+    """
+    if index is not None:
+        parser = LogParser([TextSearchExtractor(text, last=from_end, name=position) for position, text in enumerate(search_texts)])
+        if parser._indexed_markers(dict.fromkeys(index.markers)) is not None:
+            results = parser.parse(log_file, index)
+            return [results[position] for position in range(len(search_texts))]
+    lines = find_lines(log_file, search_texts, from_end)
+    return [None if line is None else line.decode("latin-1").split(text, 1)[1].strip()
+            for text, line in zip(search_texts, lines)]
+
+def search_log(log_file, search_text, from_end=False, index=None):
+    """What follows search_text on the first (or last) line that contains it, stripped; None if absent."""
+    return search_logs(log_file, [search_text], from_end, index)[0]
+
+def iter_log_files(base_folder, pattern="*.log", max_depth=None, skip_base=False):
+    """
+    Yields every file below base_folder whose name matches pattern. Folders are walked in sorted
+    order and paths are produced as they are found.
+
+    Args:
+    base_folder (str): The starting folder for exploration
+    pattern (str): fnmatch pattern of the file names
+    max_depth (int): Depth grade of the deepest subfolders searched (0 = immediate subfolders, None = no limit)
+    skip_base (bool): Do not yield the files of base_folder itself
+    """
+    def report(e):
+        print(f"Cannot read {e.filename}: {e}", file=sys.stderr)
+
+    base_depth = base_folder.rstrip(os.sep).count(os.sep)
+    for folder, subfolders, files in os.walk(base_folder, onerror=report):
+        depth = folder.rstrip(os.sep).count(os.sep) - base_depth
+        subfolders.sort()
+        if max_depth is not None and depth > max_depth:
+            subfolders.clear()
+        if depth == 0 and skip_base:
+            continue
+        for file_name in sorted(files):
+            if fnmatch.fnmatch(file_name, pattern):
+                yield os.path.join(folder, file_name)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Job Ledger
+
+Persistent SQLite record of every (molecule, step) run by AutoGaussian: state, hash of the
+input that ran, checkpoint and log paths, termination status and the size/mtime of the finished
+log. A step restarted by a recovery action runs a different input than the one built from the
+configuration; the hash of the latter is kept as planned_hash. When the driver is restarted,
+steps whose ledger entry is "done", whose planned input has not changed and whose log is
+untouched are skipped without reading the log again.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    molecule    TEXT NOT NULL,
+    step        INTEGER NOT NULL,
+    state       TEXT NOT NULL,
+    input_hash  TEXT,
+    chk_path    TEXT,
+    log_path    TEXT,
+    termination TEXT,
+    log_size    INTEGER,
+    log_mtime   REAL,
+    updated     REAL NOT NULL,
+    planned_hash TEXT,
+    PRIMARY KEY (molecule, step)
+)
+"""
+
+def input_hash(com_text):
+    """
+    Hash of a Gaussian input ignoring the Link0 %mem/%nprocshared lines, so that changing the
+    resources given to a step does not invalidate its finished result.
+    """
+    lines = [line for line in com_text.splitlines()
+             if not line.lower().startswith(("%mem", "%nprocshared", "%nproc"))]
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+class JobLedger:
+    """
+    Args:
+    path (str): SQLite database file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(steps)")]
+        if "planned_hash" not in columns:  # Ledgers written before restarts kept their own hash
+            self.connection.execute("ALTER TABLE steps ADD COLUMN planned_hash TEXT")
+
+    def record(self, molecule, step, state, input_hash=None, chk_path=None, log_path=None, termination=None, planned_hash=None):
+        """
+        Inserts or updates the entry of (molecule, step). The log size/mtime are taken from disk.
+        planned_hash defaults to input_hash (the input that ran is the one built from the configuration).
+        """
+        log_size, log_mtime = None, None
+        if log_path is not None and os.path.exists(log_path):
+            stat = os.stat(log_path)
+            log_size, log_mtime = stat.st_size, stat.st_mtime
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (molecule, step, state, input_hash, chk_path, log_path, termination, log_size, log_mtime, time.time(),
+                 planned_hash or input_hash))
+
+    def get(self, molecule, step):
+        """Returns the entry of (molecule, step) as a dict, or None."""
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM steps WHERE molecule = ? AND step = ?", (molecule, step))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def is_done(self, molecule, step):
+        entry = self.get(molecule, step)
+        return entry is not None and entry["state"] == "done"
+
+    @staticmethod
+    def planned_hash(entry):
+        """Hash of the input built from the configuration for an entry (None for stale entries)."""
+        return entry["planned_hash"] or entry["input_hash"]
+
+    def is_complete(self, molecule, step, step_input_hash, log_path):
+        """
+        True if (molecule, step) finished normally with the same planned input and its log has not
+        been modified since. Only the log's metadata is checked, never its contents.
+        """
+        entry = self.get(molecule, step)
+        if entry is None or entry["state"] != "done" or self.planned_hash(entry) != step_input_hash:
+            return False
+        try:
+            stat = os.stat(log_path)
+        except OSError:
+            return False
+        return stat.st_size == entry["log_size"] and stat.st_mtime == entry["log_mtime"]
+
+    def invalidate(self, molecule, steps):
+        """Marks steps as stale, e.g. the steps downstream of one that is being rerun."""
+        for step in steps:
+            self.record(molecule, step, "stale")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
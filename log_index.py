@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Log Section Index
+
+Persistent SQLite cache of the byte offsets where the main sections of each Gaussian log start
+(atom count, SCF Done, ESP charges, frequencies, excited states, thermochemistry, termination).
+An entry is valid only while the log keeps the same path, size, mtime and inode, so any rewrite
+of the log invalidates it. With a valid entry, gaussian_log_parser seeks straight to the sections
+it needs instead of reading the whole log. The least recently used entries are evicted beyond max_entries.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+DEFAULT_INDEX_FILE = os.path.join(os.path.expanduser("~"), ".cache", "gaussian_log_index.sqlite")
+
+# Offsets are stored for the start of every line containing one of these markers
+INDEXED_MARKERS = (
+    b"NAtoms=",
+    b"SCF Done:",
+    b"ESP charges:",
+    b"Low frequencies",
+    b"Harmonic frequencies",
+    b" Excited State ",
+    b"Zero-point correction=",
+    b"Thermal correction to",
+    b"Sum of electronic and",
+    b"Normal termination",
+    b"Error termination",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    inode     INTEGER NOT NULL,
+    offsets   TEXT NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+class LogIndex:
+    """
+    Args:
+    path (str): SQLite database file (created if needed)
+    max_entries (int): Logs kept in the index; the least recently used are evicted beyond it
+    """
+    markers = INDEXED_MARKERS
+
+    def __init__(self, path=DEFAULT_INDEX_FILE, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS logs_last_used ON logs (last_used)")
+
+    @staticmethod
+    def key(stat):
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def lookup(self, log_file, stat):
+        """
+        Returns {marker: [line offsets]} for log_file if its entry matches stat, else None.
+
+        Args:
+        log_file (str): Path of the log
+        stat (os.stat_result): Current metadata of the log
+        """
+        path = os.path.abspath(log_file)
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns, inode, offsets FROM logs WHERE path = ?", (path,)).fetchone()
+            if row is None or tuple(row[:3]) != self.key(stat):
+                return None
+            offsets = {marker.encode("latin-1"): positions for marker, positions in json.loads(row[3]).items()}
+            if set(offsets) != set(self.markers):
+                return None  # Indexed with another marker list: rebuilt by the next parse
+            self.connection.execute("UPDATE logs SET last_used = ? WHERE path = ?", (time.time(), path))
+        return offsets
+
+    def store(self, log_file, stat, offsets):
+        """Records the offsets found while parsing log_file, whose metadata before parsing was stat."""
+        path = os.path.abspath(log_file)
+        encoded = json.dumps({marker.decode("latin-1"): positions for marker, positions in offsets.items()})
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?, ?, ?, ?)",
+                                    (path, *self.key(stat), encoded, time.time()))
+            count = self.connection.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute("DELETE FROM logs WHERE path IN (SELECT path FROM logs ORDER BY last_used LIMIT ?)",
+                                        (count - self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
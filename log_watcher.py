@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Gaussian Log Watcher
+
+Follows any number of growing Gaussian .log files from a single background thread.
+Each log keeps its own byte offset, so only the bytes appended since the last check are read.
+On Linux the thread is woken by inotify; everywhere else (and as a safety net for network
+filesystems, where writes from compute nodes do not raise inotify events) it falls back to
+adaptive polling: short intervals while the logs are growing, longer ones while they are idle.
+"""
+import os
+import re
+import time
+import select
+import asyncio
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+# Gaussian termination markers
+SUCCESS_MARKERS = [b"Normal termination"]
+ERROR_MARKERS = [
+    b"Error termination",              # Error termination via Lnk1e / request processed by link 9999
+    b"Lnk1e",
+    b"could not allocate memory",      # galloc
+    b"Erroneous write",
+    b"Erroneous read",
+    b"Convergence failure -- run terminated",
+    b"segmentation violation",
+    b"Out-of-memory error",
+]
+
+# Messages printed before an error termination, in order of precedence, and the failure kind they reveal
+FAILURE_SIGNATURES = [
+    ("opt_steps", b"Number of steps exceeded"),                 # Optimization stopped, l9999
+    ("opt_steps", b"Optimization stopped"),
+    ("scf_convergence", b"Convergence failure -- run terminated"),
+    ("scf_convergence", b"Convergence criterion not met"),
+    ("memory", b"could not allocate memory"),
+    ("memory", b"Out-of-memory error"),
+    ("io", b"Erroneous write"),
+    ("io", b"Erroneous read"),
+    ("crash", b"segmentation violation"),
+]
+FAILURE_KINDS = ("opt_steps", "scf_convergence", "memory", "io", "crash", "stall", "error")
+
+READ_CHUNK = 4 * 1024 * 1024  # Bytes read per log and wake-up
+
+def count_job_steps(commands):
+    """
+    Number of "Normal termination" lines a route section produces.
+    Gaussian runs "Opt Freq" as two chained jobs, so it terminates twice.
+    """
+    route = commands.lower()
+    has_opt = re.search(r"(^|\s)opt(\s|=|\(|$)", route) is not None
+    has_freq = re.search(r"(^|\s)freq(\s|=|\(|$)", route) is not None
+    return 2 if has_opt and has_freq else 1
+
+def classify_failure(text, seen=()):
+    """
+    Failure kind of a log section that ended in an error.
+
+    Args:
+    text (bytes): Text read from the log (a chunk or the whole tail)
+    seen (iterable): Kinds already found earlier in the same section
+
+    Returns:
+    str: One of FAILURE_KINDS other than "stall"
+    """
+    for kind, signature in FAILURE_SIGNATURES:
+        if kind in seen or signature in text:
+            return kind
+    return "error"
+
+def read_termination(log_file, tail_bytes=8192):
+    """
+    Termination status of a finished log, read from its last bytes only.
+
+    Returns:
+    str: The final "Normal termination" line, the last error marker line, or None if the log
+         does not end with a termination (missing, still running or killed)
+    """
+    try:
+        with open(log_file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tail_bytes))
+            lines = [line.strip() for line in f.read().splitlines() if line.strip()]
+    except OSError:
+        return None
+    if lines and any(marker in lines[-1] for marker in SUCCESS_MARKERS):
+        return lines[-1].decode(errors="replace")
+    for line in reversed(lines):
+        if any(marker in line for marker in ERROR_MARKERS):
+            return line.decode(errors="replace")
+    return None
+
+class _Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API (directory watches only)."""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}  # wd -> directory
+
+    def add_directory(self, directory):
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            return None
+        self.directories[wd] = directory
+        return wd
+
+    def remove_directory(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+        self.directories.pop(wd, None)
+
+    def read_paths(self):
+        """Drains pending events and returns the set of paths that changed."""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if wd in self.directories and name:
+                    changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class _WatchedLog:
+    def __init__(self, path, callback, expected_terminations, progress):
+        self.path = path
+        self.callback = callback
+        self.expected_terminations = expected_terminations
+        self.progress = progress
+        self.offset = 0
+        self.partial = b""
+        self.terminations = 0
+        self.signals = set()            # Failure kinds seen since the last normal termination
+        self.last_growth = time.monotonic()
+        self.watched_at = time.time()
+        self.first_output = None        # When the log was first seen growing (time.time())
+
+class LogWatcher:
+    """
+    Watches Gaussian logs until they report their final termination.
+
+    Args:
+    min_interval (float): Shortest time between polls, in seconds
+    max_interval (float): Longest time between polls once the logs stop growing, in seconds
+    use_inotify (bool): Use inotify wake-ups when the platform supports them
+    stall_timeout (float): Seconds without log growth after which a started job is reported as
+                           stalled (None disables it). Jobs whose log does not exist yet are queued
+                           and never stall.
+    """
+    def __init__(self, min_interval=1.0, max_interval=60.0, use_inotify=True, stall_timeout=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.use_inotify = use_inotify
+        self.stall_timeout = stall_timeout
+        self.logs = {}          # path -> _WatchedLog
+        self.timings = {}       # path -> timing of the finished watch, see pop_timing()
+        self.directory_watches = {}  # directory -> (wd, number of logs)
+        self.inotify = None
+        self.thread = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.wake_read, self.wake_write = os.pipe()
+
+    def watch(self, log_file, callback, expected_terminations=1, progress=None):
+        """
+        Starts following a log. callback(log_file, success, detail) is called once from the
+        watcher thread when the job ends: detail is the termination marker (str) on success and
+        the failure kind (one of FAILURE_KINDS) on failure.
+        progress(log_file, terminations) is called every time another job step of a compound or
+        --Link1-- log terminates normally.
+        """
+        log_file = os.path.abspath(log_file)
+        with self.condition:
+            if log_file not in self.logs:
+                self._start()
+                self._add_directory(os.path.dirname(log_file))
+            self.logs[log_file] = _WatchedLog(log_file, callback, expected_terminations, progress)
+        os.write(self.wake_write, b"\0")
+
+    def wait(self, log_file, expected_terminations=1):
+        """Blocks until the log terminates. Returns (success, detail), see watch()."""
+        done = threading.Event()
+        outcome = []
+
+        def on_finish(path, success, detail):
+            outcome.append((success, detail))
+            done.set()
+
+        self.watch(log_file, on_finish, expected_terminations)
+        done.wait()
+        return outcome[0]
+
+    async def wait_async(self, log_file, expected_terminations=1, progress=None):
+        """
+        Awaitable version of wait() for asyncio callers; no thread is blocked while waiting.
+        progress, if given, is called on the event loop thread.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def on_finish(path, success, detail):
+            loop.call_soon_threadsafe(future.set_result, (success, detail))
+
+        def on_progress(path, terminations):
+            loop.call_soon_threadsafe(progress, path, terminations)
+
+        self.watch(log_file, on_finish, expected_terminations, on_progress if progress else None)
+        return await future
+
+    def pop_timing(self, log_file):
+        """
+        Timing of the last finished watch of log_file (wall-clock times from time.time()), or None:
+        watched_at, first_output (None if the log never grew), finished (when the termination was
+        detected) and detection_lag (finished minus the log's last modification).
+        """
+        with self.condition:
+            return self.timings.pop(os.path.abspath(log_file), None)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+        os.write(self.wake_write, b"\0")
+        if self.thread is not None:
+            self.thread.join()
+
+    def _start(self):
+        if self.thread is not None:
+            return
+        if self.use_inotify:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError):
+                self.inotify = None
+        self.thread = threading.Thread(target=self._run, name="LogWatcher", daemon=True)
+        self.thread.start()
+
+    def _add_directory(self, directory):
+        wd, count = self.directory_watches.get(directory, (None, 0))
+        if count == 0 and self.inotify is not None:
+            wd = self.inotify.add_directory(directory)
+        self.directory_watches[directory] = (wd, count + 1)
+
+    def _remove_directory(self, directory):
+        wd, count = self.directory_watches.get(directory, (None, 1))
+        if count <= 1:
+            self.directory_watches.pop(directory, None)
+            if wd is not None and self.inotify is not None:
+                self.inotify.remove_directory(wd)
+        else:
+            self.directory_watches[directory] = (wd, count - 1)
+
+    def _read_new_bytes(self, log):
+        """Scans the bytes appended since the last call. Returns (grew, finished, success, detail)."""
+        try:
+            size = os.path.getsize(log.path)
+        except OSError:
+            return False, False, False, None
+        if size < log.offset:  # Log was truncated or replaced: start over
+            log.offset, log.partial, log.terminations = 0, b"", 0
+            log.signals.clear()
+        if size == log.offset:
+            return False, False, False, None
+
+        with open(log.path, "rb") as f:
+            f.seek(log.offset)
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                log.offset += len(chunk)
+                text = log.partial + chunk
+                cut = text.rfind(b"\n") + 1
+                complete, log.partial = text[:cut], text[cut:]
+
+                # Failure signals only count for the section after the last normal termination
+                last_termination = max(complete.rfind(marker) for marker in SUCCESS_MARKERS)
+                if last_termination >= 0:
+                    log.signals.clear()
+                section = complete[max(last_termination, 0):]
+                log.signals.update(kind for kind, signature in FAILURE_SIGNATURES if signature in section)
+
+                for marker in ERROR_MARKERS:
+                    if marker in section:
+                        return True, True, False, classify_failure(section, log.signals)
+                for marker in SUCCESS_MARKERS:
+                    found = complete.count(marker)
+                    if found == 0:
+                        continue
+                    log.terminations += found
+                    if log.terminations >= log.expected_terminations:
+                        return True, True, True, marker.decode()
+                    if log.progress is not None:
+                        log.progress(log.path, log.terminations)
+        return True, False, False, None
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self.condition:
+                if self.stopped:
+                    break
+                logs = list(self.logs.values())
+
+            grew = False
+            now = time.monotonic()
+            for log in logs:
+                log_grew, finished, success, detail = self._read_new_bytes(log)
+                grew = grew or log_grew
+                if log_grew or log.offset == 0:
+                    log.last_growth = now
+                if log_grew and log.first_output is None:
+                    log.first_output = time.time()
+                elif self.stall_timeout is not None and now - log.last_growth > self.stall_timeout:
+                    finished, success, detail = True, False, "stall"
+                if finished:
+                    finished_at = time.time()
+                    try:
+                        detection_lag = max(0.0, finished_at - os.path.getmtime(log.path))
+                    except OSError:
+                        detection_lag = None
+                    with self.condition:
+                        self.logs.pop(log.path, None)
+                        self._remove_directory(os.path.dirname(log.path))
+                        self.timings[log.path] = {"watched_at": log.watched_at, "first_output": log.first_output,
+                                                  "finished": finished_at, "detection_lag": detection_lag}
+                    log.callback(log.path, success, detail)
+
+            # Adaptive polling: stay responsive while logs grow, back off while they are idle
+            interval = self.min_interval if grew else min(interval * 1.5, self.max_interval)
+            self._sleep(interval)
+
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def _sleep(self, timeout):
+        """Sleeps until the timeout, a new watch, or an inotify event on a watched log."""
+        start = time.monotonic()
+        deadline = start + timeout
+        fds = [self.wake_read]
+        if self.inotify is not None:
+            fds.append(self.inotify.fd)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select(fds, [], [], remaining)
+            if self.wake_read in readable:
+                os.read(self.wake_read, 4096)
+                return
+            if self.inotify is not None and self.inotify.fd in readable:
+                changed = self.inotify.read_paths()
+                with self.condition:
+                    relevant = any(path in self.logs for path in changed)
+                if relevant:
+                    # Coalesce bursts of small writes into one scan per min_interval
+                    time.sleep(max(0.0, start + self.min_interval - time.monotonic()))
+                    return
@@ -1,95 +1,251 @@
 #!/usr/bin/env python3
 
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
 """
 XYZ to PDB Converter
 
 This script extracts molecular geometries from an XYZ file and inserts them into a base PDB file.
-Each geometry is saved as a separate PDB file with a numbered suffix.
+Each geometry is saved as a separate PDB file with a numbered suffix, or all of them as the models
+of a single multi-MODEL PDB, or as a binary trajectory (.npy, float32, frames x atoms x 3).
 
-Usage:
-    python multixyz_to_pdb.py input.xyz base.pdb output_prefix
+The base PDB is parsed once into a fixed-width template and the frames are read lazily, one at a
+time, so trajectories of any length are converted with constant memory.
 
-# Author: Richard Lopez Corbalan
-# GitHub: github.com/richardloopez
-# Citation: If you use this code, please cite Lopez-Corbalan, R
+Usage:
+    python multixyz_to_pdb.py input.xyz base.pdb output_prefix [--format separate|multimodel|npy]
+                              [--frames START STOP] [--workers N]
 """
 import sys
 import os
+import struct
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from xyz_trajectory import XyzTrajectory
+
+NPY_HEADER_SIZE = 128  # Fixed, so the frame count can be written once the trajectory has been read
 
-def read_xyz(file_path):
-    """Reads an XYZ file and extracts molecular geometries."""
+def iter_xyz(file_path, with_comments=False):
+    """
+    Yields the geometries of an XYZ file one at a time (as (comment, geometry) pairs if
+    with_comments), without reading the rest of the file.
+    """
     with open(file_path, 'r') as f:
-        lines = f.readlines()
-    
-    geometries = []
-    i = 0
-    while i < len(lines):
-        try:
-            num_atoms = int(lines[i].strip())
-            geom = lines[i+2 : i+2+num_atoms]  # Skip comment line
-            geometries.append(geom)
+        i = 0
+        line = f.readline()
+        while line:
+            try:
+                num_atoms = int(line.strip())
+            except ValueError:
+                print(f"Warning: Skipping invalid line {i} in {file_path}")
+                i += 1
+                line = f.readline()
+                continue
+            comment = f.readline()
+            geom = [f.readline() for _ in range(num_atoms)]
+            geom = [atom_line for atom_line in geom if atom_line]  # Truncated last frame
+            yield (comment.strip(), geom) if with_comments else geom
             i += num_atoms + 2
-        except ValueError:
-            print(f"Warning: Skipping invalid line {i} in {file_path}")
-            i += 1
-    
-    return geometries
+            line = f.readline()
+
+def read_xyz(file_path, with_comments=False):
+    """Reads an XYZ file and extracts molecular geometries (as (comment, geometry) pairs if with_comments)."""
+    return list(iter_xyz(file_path, with_comments))
+
+def geometry_coordinates(geometry):
+    """(n_atoms, 3) float array from the lines of one XYZ geometry."""
+    fields = " ".join(geometry).split()
+    columns = len(fields) // len(geometry) if geometry else 4
+    return np.array(fields, dtype=object).reshape(len(geometry), columns)[:, 1:4].astype(np.float64)
+
+class PdbTemplate:
+    """
+    A base PDB parsed once. The atom records are turned into a single printf-style format with
+    three %8.3f fields per atom (columns 31-54), so a whole frame is formatted in one operation.
+    """
+    def __init__(self, base_pdb):
+        with open(base_pdb, 'r') as f:
+            pdb_lines = f.readlines()
+        self.atom_count = 0
+        model_format = []
+        # Multi-MODEL output: records before the first atom once, atom/TER records in every model, the rest (CONECT...) at the end
+        self.header, self.model_format, self.trailer = [], [], []
+        for line in pdb_lines:
+            if line.startswith("ATOM") or line.startswith("HETATM"):
+                body = line.rstrip("\n")
+                model_format.append(body[:30].replace("%", "%%") + "%8.3f%8.3f%8.3f" + body[54:].replace("%", "%%") + "\n")
+                self.atom_count += 1
+            else:
+                model_format.append(line.replace("%", "%%"))
+            if line.startswith(("ATOM", "HETATM", "ANISOU", "TER")):
+                self.model_format.append(model_format[-1])
+            elif not line.startswith(("END", "MODEL")):
+                (self.trailer if self.atom_count else self.header).append(line)
+        self.format = "".join(model_format)
+        self.model_format = "".join(self.model_format)
+
+    def _check(self, coordinates):
+        if len(coordinates) != self.atom_count:
+            raise ValueError("Mismatch between PDB atom count and XYZ geometry atom count.")
+
+    def render(self, coordinates):
+        """The whole PDB text for one (n_atoms, 3) coordinate array."""
+        self._check(coordinates)
+        return self.format % tuple(np.asarray(coordinates, dtype=np.float64).ravel().tolist())
+
+    def render_model(self, coordinates, model_number):
+        """One MODEL ... ENDMDL block (without the END record) for a multi-model PDB."""
+        self._check(coordinates)
+        return f"MODEL     {model_number:4d}\n" + self.model_format % tuple(np.asarray(coordinates, dtype=np.float64).ravel().tolist()) + "ENDMDL\n"
 
 def insert_geometry(base_pdb, geometry):
     """Inserts extracted geometry into the base PDB structure."""
-    with open(base_pdb, 'r') as f:
-        pdb_lines = f.readlines()
-    
-    atom_lines = [line for line in pdb_lines if line.startswith("ATOM") or line.startswith("HETATM")]
-    if len(atom_lines) != len(geometry):
+    template = base_pdb if isinstance(base_pdb, PdbTemplate) else PdbTemplate(base_pdb)
+    if len(geometry) != template.atom_count:
         raise ValueError("Mismatch between PDB atom count and XYZ geometry atom count.")
-    
-    new_pdb = []
-    xyz_coords = [line.split()[1:] for line in geometry]
-    
-    atom_idx = 0
-    for line in pdb_lines:
-        if line.startswith("ATOM") or line.startswith("HETATM"):
-            parts = list(line)
-            x, y, z = xyz_coords[atom_idx]
-            parts[30:54] = f"{float(x):8.3f}{float(y):8.3f}{float(z):8.3f}".rjust(24)
-            new_pdb.append("".join(parts))
-            atom_idx += 1
-        else:
-            new_pdb.append(line)
-    
-    return new_pdb
+    return template.render(geometry_coordinates(geometry)).splitlines(keepends=True)
 
 def write_pdb(output_path, pdb_lines):
     """Writes the modified PDB structure to a file."""
     with open(output_path, 'w') as f:
         f.writelines(pdb_lines)
 
-def main():
-    if len(sys.argv) != 4:
-        print("Usage: python multixyz_to_pdb.py input.xyz base.pdb output_prefix")
-        sys.exit(1)
-    
-    xyz_file = sys.argv[1]
-    base_pdb = sys.argv[2]
-    output_prefix = sys.argv[3]
-    
-    if not os.path.isfile(xyz_file) or not os.path.isfile(base_pdb):
-        print("Error: One or more input files do not exist.")
-        sys.exit(1)
-    
-    geometries = read_xyz(xyz_file)
-    for idx, geometry in enumerate(geometries, start=1):
+def _npy_header(shape):
+    header = repr({"descr": "<f4", "fortran_order": False, "shape": shape}).encode("latin-1")
+    header = header.ljust(NPY_HEADER_SIZE - 11) + b"\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header
+
+def _frames(xyz_file, frames):
+    """Yields (frame number from 1, function returning its coordinates), all frames or range(*frames) through the frame index."""
+    if frames is None:
+        for idx, geometry in enumerate(iter_xyz(xyz_file), start=1):
+            yield idx, lambda geometry=geometry: geometry_coordinates(geometry)
+        return
+    with XyzTrajectory(xyz_file) as trajectory:
+        for i in range(*slice(*frames).indices(len(trajectory))):
+            yield i + 1, lambda i=i: trajectory[i]
+
+def convert(xyz_file, base_pdb, output_prefix, output_format="separate", frames=None):
+    """
+    Converts every frame of xyz_file, streaming.
+
+    Args:
+    xyz_file (str): Multi-frame XYZ file
+    base_pdb (str): PDB with the same atoms in the same order
+    output_prefix (str): Prefix of the output file(s)
+    output_format (str): "separate" (output_prefix_N.pdb), "multimodel" (output_prefix.pdb) or
+                         "npy" (output_prefix.npy, float32 array frames x atoms x 3)
+    frames (tuple): (start, stop) frame range, counted from 0, read through the frame index; None for all
+
+    Returns:
+    int: Frames written
+    """
+    template = PdbTemplate(base_pdb)
+    written = 0
+    output = None
+    try:
+        if output_format == "multimodel":
+            output = open(f"{output_prefix}.pdb", 'w')
+            output.writelines(template.header)
+        elif output_format == "npy":
+            output = open(f"{output_prefix}.npy", 'wb')
+            output.write(_npy_header((0, template.atom_count, 3)))
+        elif output_format != "separate":
+            raise ValueError(f"Unknown output format: {output_format}. Use separate, multimodel or npy")
+
+        for idx, read_coordinates in _frames(xyz_file, frames):
+            try:
+                coordinates = read_coordinates()
+                if output_format == "separate":
+                    output_pdb = f"{output_prefix}_{idx}.pdb"
+                    with open(output_pdb, 'w') as f:
+                        f.write(template.render(coordinates))
+                    print(f"Generated: {output_pdb}")
+                elif output_format == "multimodel":
+                    output.write(template.render_model(coordinates, idx))
+                else:
+                    template._check(coordinates)
+                    output.write(coordinates.astype("<f4").tobytes())
+                written += 1
+            except ValueError as e:
+                print(f"Skipping frame {idx} due to error: {e}")
+
+        if output_format == "multimodel":
+            output.writelines(template.trailer)
+            output.write("END\n")
+        elif output_format == "npy":
+            output.seek(0)
+            output.write(_npy_header((written, template.atom_count, 3)))
+    finally:
+        if output is not None:
+            output.close()
+    return written
+
+# Worker state, set once per process by init_worker
+worker_trajectory = None
+worker_template = None
+
+def init_worker(xyz_file, base_pdb):
+    global worker_trajectory, worker_template
+    worker_trajectory = XyzTrajectory(xyz_file)
+    worker_template = PdbTemplate(base_pdb)
+
+def convert_frames(job):
+    """Writes output_prefix_N.pdb for the frames range(start, stop). job is (output_prefix, start, stop); returns frames written."""
+    output_prefix, start, stop = job
+    written = 0
+    for i in range(start, stop):
         try:
-            new_pdb = insert_geometry(base_pdb, geometry)
-            output_pdb = f"{output_prefix}_{idx}.pdb"
-            write_pdb(output_pdb, new_pdb)
-            print(f"Generated: {output_pdb}")
+            with open(f"{output_prefix}_{i + 1}.pdb", 'w') as f:
+                f.write(worker_template.render(worker_trajectory[i]))
+            written += 1
         except ValueError as e:
-            print(f"Skipping frame {idx} due to error: {e}")
+            print(f"Skipping frame {i + 1} due to error: {e}")
+    return written
 
-if __name__ == "__main__":
-    main()
+def convert_parallel(xyz_file, base_pdb, output_prefix, workers=None, frames=None, chunk=256):
+    """
+    One PDB per frame (output_prefix_N.pdb), written by a pool of processes. The frame index is
+    built (or loaded) once here; every worker then maps the trajectory and converts its own
+    blocks of chunk frames.
 
+    Returns:
+    int: Frames written
+    """
+    with XyzTrajectory(xyz_file) as trajectory:
+        selected = range(*slice(*(frames or (None,))).indices(len(trajectory)))
+    jobs = [(output_prefix, start, min(start + chunk, selected.stop)) for start in range(selected.start, selected.stop, chunk)]
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(xyz_file, base_pdb)) as executor:
+        return sum(executor.map(convert_frames, jobs))
 
+def main():
+    parser = argparse.ArgumentParser(description="Insert the geometries of a multi-frame XYZ file into a base PDB.")
+    parser.add_argument("xyz_file")
+    parser.add_argument("base_pdb")
+    parser.add_argument("output_prefix")
+    parser.add_argument("--format", choices=["separate", "multimodel", "npy"], default="separate",
+                        help="One PDB per frame (default), one multi-MODEL PDB, or a binary .npy trajectory")
+    parser.add_argument("--frames", type=int, nargs=2, metavar=("START", "STOP"),
+                        help="Convert only frames START to STOP - 1 (counted from 0), read through the frame index")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes writing the PDB files of --format separate (0: all cores)")
+    args = parser.parse_args()
 
+    if not os.path.isfile(args.xyz_file) or not os.path.isfile(args.base_pdb):
+        print("Error: One or more input files do not exist.")
+        sys.exit(1)
+
+    if args.format == "separate" and args.workers != 1:
+        written = convert_parallel(args.xyz_file, args.base_pdb, args.output_prefix, args.workers or None, args.frames)
+    else:
+        written = convert(args.xyz_file, args.base_pdb, args.output_prefix, args.format, args.frames)
+    if args.format == "separate":
+        print(f"Wrote {written} PDB files")
+    else:
+        print(f"Wrote {written} frames to {args.output_prefix}.{'pdb' if args.format == 'multimodel' else 'npy'}")
+
+if __name__ == "__main__":
+    main()
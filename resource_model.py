@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Resource Model
+
+Learns from finished Gaussian logs how long each kind of calculation takes and chooses the
+%nprocshared and %mem of every (molecule, step) of a batch.
+
+The elapsed time of a job is modelled per route signature (kind of job + method/basis) as
+    T = a * NBasis^k * (s + (1 - s) / cores)
+i.e. a power law in the number of basis functions and Amdahl's law in the number of cores, with
+the serial fraction s fitted from logs run with different core counts (a default is used until
+such logs exist). Memory is given per core, from the %mem/%nprocshared of the runs that
+succeeded, and raised for signatures that ran out of memory.
+
+plan() then hands out cores to minimize the estimated makespan of the whole batch: every step
+starts with the fewest cores (the most work per core-hour), and the steps of the molecule on the
+critical path get more only while the batch is limited by its longest molecule rather than by the
+node being full.
+
+Usage (offline, against any tree of existing logs):
+    python resource_model.py fit my_projects --output resource_model.json
+    python resource_model.py evaluate my_projects --folds 5
+    python resource_model.py plan resource_model.json inputs/*.xyz --route "# Opt Freq B3LYP/6-31+G(d,p)" --cores 560
+"""
+import os
+import re
+import json
+import glob
+import heapq
+import argparse
+import numpy as np
+from gaussian_log_parser import LogParser, AtomCountExtractor, JobSetupExtractor, JobStatisticsExtractor, TerminationExtractor, TextSearchExtractor
+from step_scheduler import parse_memory
+from scan_manifest import ScanManifest
+from conformer_filter import read_input_geometry, parse_geometry
+
+CORE_OPTIONS = (1, 2, 4, 8, 16, 32, 64)
+DEFAULT_EXPONENT = 3.0              # Cost ~ NBasis^3 (hybrid DFT) until the logs say otherwise
+DEFAULT_SERIAL_FRACTION = 0.05
+SERIAL_FRACTIONS = np.linspace(0.0, 0.6, 121)   # Grid searched for the serial fraction
+DEFAULT_MEMORY_PER_CORE = 1024      # MB
+MIN_MEMORY = 1024                   # MB
+JOB_KINDS = ("opt", "freq", "td", "irc", "scan", "scrf", "nonequilibrium", "stable", "nmr", "pop")
+MEMORY_ERROR_TEXT = "could not allocate memory"
+
+def route_signature(route):
+    """
+    Kind of calculation of a route section: the job keywords present and the method/basis,
+    e.g. "freq+opt+scrf b3lyp/6-31+g(d,p)". Options that do not change the cost much (Geom=Check,
+    Guess=Read, NoSymm, solvent names...) are left out.
+    """
+    route = re.sub(r"^#[npt]?\s*", "", route.strip().lower())
+    words = re.findall(r"[a-z0-9_\-+*()/,=.']+", route)
+    kinds = sorted({kind for kind in JOB_KINDS for word in words if re.match(rf"{kind}\b", word) or f"{kind}=" in word or f",{kind}" in word})
+    method = next((word.split("=")[0] for word in words if "/" in word and "=" not in word.split("/")[0]), "")
+    return f"{'+'.join(kinds) or 'sp'} {method}".strip()
+
+def read_job_record(log_file):
+    """
+    What a finished log says about the cost of its job.
+
+    Returns:
+    dict: signature, route, atoms, basis_functions, cores, memory (MB), elapsed and cpu time (s),
+          success, memory_error; None for logs that cannot be read
+    """
+    parser = LogParser([AtomCountExtractor(), JobSetupExtractor(), JobStatisticsExtractor(), TerminationExtractor(),
+                        TextSearchExtractor(MEMORY_ERROR_TEXT, name="memory_error")])
+    try:
+        results = parser.parse(log_file)
+    except (OSError, ValueError):
+        return None
+    setup, statistics = results["job_setup"], results["job_statistics"]
+    try:
+        memory = parse_memory(setup["mem"]) if setup["mem"] else None
+    except (ValueError, KeyError):
+        memory = None
+    return {"signature": route_signature(setup["route"] or ""), "route": setup["route"], "atoms": results["atom_count"],
+            "basis_functions": setup["basis_functions"], "cores": setup["nprocshared"] or 1, "memory": memory,
+            "elapsed": statistics["elapsed_time"] if statistics["jobs"] else None,
+            "cpu": statistics["cpu_time"] if statistics["jobs"] else None,
+            "success": results["termination"] is not None and "Normal termination" in results["termination"],
+            "memory_error": results["memory_error"] is not None}
+
+def read_job_records(log_files, manifest_file=None):
+    """
+    read_job_record of every log. With a manifest file (see scan_manifest.py), logs unchanged
+    since they were last read are not read again.
+    """
+    manifest = ScanManifest(manifest_file) if manifest_file else None
+    records, seen = [], []
+    for log_file in log_files:
+        try:
+            stat = os.stat(log_file)
+        except OSError:
+            continue
+        key = os.path.abspath(log_file)
+        seen.append(key)
+        unchanged, record = manifest.lookup(key, stat) if manifest is not None else (False, None)
+        if not unchanged:
+            record = read_job_record(log_file)
+            if manifest is not None:
+                manifest.update(key, stat, record)
+        if record is not None:
+            records.append(dict(record, path=log_file))
+    if manifest is not None:
+        manifest.prune(seen)
+        manifest.close()
+    return records
+
+def fit_time_model(basis_functions, cores, elapsed):
+    """
+    Least-squares fit of log T = log a + k log N + log(s + (1 - s) / cores), for every serial
+    fraction s of the grid at once; the best one is kept.
+
+    Returns:
+    dict: log_a, exponent, serial_fraction, samples, rms (of log T)
+    """
+    basis_functions, cores, elapsed = (np.asarray(values, dtype=np.float64) for values in (basis_functions, cores, elapsed))
+    fit_exponent = len(np.unique(basis_functions)) > 1
+    fractions = SERIAL_FRACTIONS if len(np.unique(cores)) > 1 else np.array([DEFAULT_SERIAL_FRACTION])
+    # (fractions, samples): log T minus the Amdahl term of each candidate serial fraction
+    targets = np.log(elapsed)[None, :] - np.log(fractions[:, None] + (1 - fractions[:, None]) / cores[None, :])
+    if fit_exponent:
+        design = np.column_stack([np.ones_like(basis_functions), np.log(basis_functions)])
+        coefficients = np.linalg.lstsq(design, targets.T, rcond=None)[0]     # (2, fractions)
+        predictions = (design @ coefficients).T
+    else:
+        log_a = (targets - DEFAULT_EXPONENT * np.log(basis_functions)[None, :]).mean(axis=1)
+        coefficients = np.vstack([log_a, np.full_like(log_a, DEFAULT_EXPONENT)])
+        predictions = coefficients[0][:, None] + DEFAULT_EXPONENT * np.log(basis_functions)[None, :]
+    errors = np.sqrt(((targets - predictions) ** 2).mean(axis=1))
+    best = int(np.argmin(errors))
+    return {"log_a": float(coefficients[0, best]), "exponent": float(coefficients[1, best]),
+            "serial_fraction": float(fractions[best]), "samples": int(len(elapsed)), "rms": float(errors[best])}
+
+class ResourceModel:
+    """
+    Fitted per route signature; signatures never seen fall back to a fit of all logs.
+
+    Args:
+    time_models (dict): {signature: fit_time_model result}, plus "*" for all logs
+    basis_per_atom (dict): {signature: median basis functions per atom}, plus "*"
+    memory_per_core (dict): {signature: MB per core}, plus "*"
+    """
+    def __init__(self, time_models=None, basis_per_atom=None, memory_per_core=None):
+        self.time_models = time_models or {}
+        self.basis_per_atom = basis_per_atom or {}
+        self.memory_per_core = memory_per_core or {}
+
+    @classmethod
+    def fit(cls, records):
+        """Fits the model to job records (read_job_record)."""
+        groups = {}
+        for record in records:
+            groups.setdefault(record["signature"], []).append(record)
+        groups["*"] = list(records)
+
+        time_models, basis_per_atom, memory_per_core = {}, {}, {}
+        for signature, group in groups.items():
+            timed = [r for r in group if r["success"] and r["elapsed"] and r["basis_functions"] and r["cores"]]
+            if timed:
+                time_models[signature] = fit_time_model([r["basis_functions"] for r in timed], [r["cores"] for r in timed],
+                                                        [r["elapsed"] for r in timed])
+                time_models[signature]["typical_basis"] = float(np.median([r["basis_functions"] for r in timed]))
+            ratios = [r["basis_functions"] / r["atoms"] for r in group if r["basis_functions"] and r["atoms"]]
+            if ratios:
+                basis_per_atom[signature] = float(np.median(ratios))
+            used = [r["memory"] / r["cores"] for r in group if r["success"] and r["memory"] and r["cores"]]
+            short = [r["memory"] / r["cores"] for r in group if r["memory_error"] and r["memory"] and r["cores"]]
+            if used:
+                memory_per_core[signature] = float(np.median(used))
+            if short:  # Twice the largest amount that was not enough, if more than what usually works
+                memory_per_core[signature] = max(memory_per_core.get(signature, 0.0), 2.0 * max(short))
+        return cls(time_models, basis_per_atom, memory_per_core)
+
+    def _get(self, table, signature, default):
+        return table.get(signature, table.get("*", default))
+
+    def estimate_basis(self, signature, atoms):
+        """Basis functions of a molecule with atoms atoms (None: a typical molecule of the history)."""
+        ratio = self._get(self.basis_per_atom, signature, None)
+        if atoms and ratio:
+            return atoms * ratio
+        model = self._get(self.time_models, signature, None)
+        return None if model is None else model.get("typical_basis")
+
+    def predict_time(self, signature, basis_functions, cores):
+        """Expected elapsed seconds (None without a model for the signature or a basis size)."""
+        model = self._get(self.time_models, signature, None)
+        if model is None or not basis_functions:
+            return None
+        s = model["serial_fraction"]
+        return float(np.exp(model["log_a"]) * basis_functions ** model["exponent"] * (s + (1 - s) / cores))
+
+    def memory_for(self, signature, cores):
+        """%mem in MB for a job of signature on cores cores."""
+        return max(MIN_MEMORY, int(self._get(self.memory_per_core, signature, DEFAULT_MEMORY_PER_CORE) * cores))
+
+    def plan(self, jobs, total_cores, total_memory=None, max_running=None, core_options=CORE_OPTIONS, min_cores=1):
+        """
+        Cores and memory for every job of a batch.
+
+        The makespan is estimated as the largest of four bounds: core-seconds / total_cores,
+        MB-seconds / total_memory, job-seconds / max_running and the longest molecule (its steps
+        run one after another). Every job starts with the fewest cores; while the longest molecule
+        or the running cap sets the makespan, the job whose next core count saves the most time per
+        extra core-second gets it, as long as the node bounds stay below the makespan.
+
+        Args:
+        jobs (list): (molecule, step, signature, atoms) tuples
+        total_cores (int): Cores of the node (or allocation) shared by all the jobs
+        total_memory (int or str): Memory shared by all the jobs (MB or "560GB"), None for no limit
+        max_running (int): Cap on simultaneously running jobs (AutoGaussian max_concurrent_molecules)
+        core_options (tuple): Allowed %nprocshared values
+        min_cores (int): Fewest cores given to any job
+
+        Returns:
+        dict: {(molecule, step): (cores, memory in MB)}; jobs the model cannot time get the fewest cores
+        """
+        total_memory = parse_memory(total_memory) if total_memory is not None else None
+        options = sorted(c for c in core_options if min_cores <= c <= total_cores) or [min(total_cores, max(1, min_cores))]
+        if total_memory is not None:
+            options = [c for c in options if all(self.memory_for(job[2], c) <= total_memory for job in jobs)] or options[:1]
+
+        level, times, signatures, basis, by_molecule = {}, {}, {}, {}, {}
+        for molecule, step, signature, atoms in jobs:
+            key = (molecule, step)
+            level[key], signatures[key], basis[key] = 0, signature, self.estimate_basis(signature, atoms)
+            seconds = self.predict_time(signature, basis[key], options[0])
+            if seconds is not None:
+                times[key] = seconds
+                by_molecule.setdefault(molecule, []).append(key)
+
+        def cost(key, option):
+            """(seconds, core-seconds, MB-seconds) of a job on options[option] cores."""
+            cores = options[option]
+            seconds = self.predict_time(signatures[key], basis[key], cores)
+            return seconds, seconds * cores, seconds * self.memory_for(signatures[key], cores)
+
+        def upgrade(key):
+            """(time saved, extra core-seconds, extra MB-seconds) of the next core count, None if there is none or it is not faster."""
+            if level[key] + 1 >= len(options):
+                return None
+            now, later = cost(key, level[key]), cost(key, level[key] + 1)
+            if later[0] >= now[0]:
+                return None
+            return now[0] - later[0], later[1] - now[1], later[2] - now[2]
+
+        def ratio(change):
+            return change[0] / max(change[1], 1e-9)
+
+        area = sum(cost(key, 0)[1] for key in times)
+        memory_area = sum(cost(key, 0)[2] for key in times)
+        busy = sum(times.values())
+        chains = {molecule: sum(times[key] for key in keys) for molecule, keys in by_molecule.items()}
+        longest = [(-length, molecule) for molecule, length in chains.items()]  # Lazy max-heap of the molecule lengths
+        heapq.heapify(longest)
+        candidates = []                                                          # Lazy max-heap of the upgrades by time saved per core-second
+        for key in times:
+            change = upgrade(key)
+            if change is not None:
+                candidates.append((-ratio(change), key, 0))
+        heapq.heapify(candidates)
+
+        def node_bound(area, memory_area):
+            return max(area / total_cores, memory_area / total_memory if total_memory else 0.0)
+
+        while longest:
+            while longest and -longest[0][0] != chains[longest[0][1]]:
+                heapq.heappop(longest)  # Stale entries
+            critical = longest[0][1]
+            cap_bound = busy / max_running if max_running else 0.0
+            makespan = max(node_bound(area, memory_area), cap_bound, chains[critical])
+            if chains[critical] == makespan:
+                # Only the critical molecule getting faster shortens the batch
+                changes = [(upgrade(key), key) for key in by_molecule[critical]]
+                changes = [(change, key) for change, key in changes if change is not None]
+                if not changes:
+                    break
+                change, key = max(changes, key=lambda item: ratio(item[0]))
+            elif cap_bound == makespan:
+                # Too few jobs may run at once to fill the node: every job getting faster helps
+                while candidates and candidates[0][2] != level[candidates[0][1]]:
+                    heapq.heappop(candidates)
+                if not candidates:
+                    break
+                key = heapq.heappop(candidates)[1]
+                change = upgrade(key)
+            else:
+                break  # The node is full: more cores per job only cost core-hours
+            if node_bound(area + change[1], memory_area + change[2]) > makespan:
+                break
+            level[key] += 1
+            times[key] -= change[0]
+            area, memory_area, busy = area + change[1], memory_area + change[2], busy - change[0]
+            chains[key[0]] -= change[0]
+            heapq.heappush(longest, (-chains[key[0]], key[0]))
+            change = upgrade(key)
+            if change is not None:
+                heapq.heappush(candidates, (-ratio(change), key, level[key]))
+
+        plan = {}
+        for molecule, step, signature, atoms in jobs:
+            cores = options[level[(molecule, step)]]
+            plan[(molecule, step)] = (cores, self.memory_for(signature, cores))
+        return plan
+
+    def to_dict(self):
+        return {"time_models": self.time_models, "basis_per_atom": self.basis_per_atom, "memory_per_core": self.memory_per_core}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+def format_memory(memory_mb):
+    """%mem value for a size in MB ("16GB", "1500MB")."""
+    return f"{memory_mb // 1024}GB" if memory_mb % 1024 == 0 else f"{memory_mb}MB"
+
+def evaluate(records, folds=5, seed=0):
+    """
+    Cross-validated error of the predicted elapsed times: the model is fitted on all folds but
+    one and predicts the logs of the remaining fold.
+
+    Returns:
+    dict: predicted (count), median and 90th percentile of |predicted / measured - 1|, and the
+          same errors by signature
+    """
+    timed = [r for r in records if r["success"] and r["elapsed"] and r["basis_functions"]]
+    order = np.random.default_rng(seed).permutation(len(timed))
+    errors = {}
+    for fold in range(folds):
+        held_out = set(order[fold::folds].tolist())
+        test = [timed[i] for i in sorted(held_out)]
+        train = [timed[i] for i in range(len(timed)) if i not in held_out]
+        model = ResourceModel.fit(train)
+        for record in test:
+            predicted = model.predict_time(record["signature"], record["basis_functions"], record["cores"])
+            if predicted is not None:
+                errors.setdefault(record["signature"], []).append(abs(predicted / record["elapsed"] - 1))
+    every = [error for values in errors.values() for error in values]
+
+    def summary(values):
+        return {"predicted": len(values), "median_error": float(np.median(values)), "p90_error": float(np.percentile(values, 90))}
+
+    return {**(summary(every) if every else {"predicted": 0}),
+            "by_signature": {signature: summary(values) for signature, values in sorted(errors.items())}}
+
+def count_atoms(input_file):
+    """Atoms of an .xyz or .com input (None for other files, e.g. .chk)."""
+    if not input_file.endswith((".xyz", ".com")):
+        return None
+    try:
+        return len(parse_geometry(read_input_geometry(input_file, "0", "1")[2].splitlines())[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn Gaussian job costs from finished logs and size %nprocshared/%mem.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, description in (("fit", "Fit a model to the logs of a folder tree"), ("evaluate", "Cross-validate the predicted elapsed times")):
+        command = commands.add_parser(name, help=description)
+        command.add_argument("folder")
+        command.add_argument("--pattern", default="**/*.log", help="Glob of the logs below folder")
+        command.add_argument("--manifest", default=None, help="Scan manifest caching the records of unchanged logs")
+        if name == "fit":
+            command.add_argument("--output", default="resource_model.json")
+        else:
+            command.add_argument("--folds", type=int, default=5)
+    plan_parser = commands.add_parser("plan", help="Recommend %%nprocshared/%%mem for a batch of inputs")
+    plan_parser.add_argument("model")
+    plan_parser.add_argument("inputs", nargs="+", help=".xyz/.com inputs (.chk inputs get a typical molecule size)")
+    plan_parser.add_argument("--route", action="append", required=True, help="Route of each step, in order (repeat)")
+    plan_parser.add_argument("--cores", type=int, default=560)
+    plan_parser.add_argument("--memory", default=None, help="Memory of the node, e.g. 560GB")
+    plan_parser.add_argument("--max-running", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command in ("fit", "evaluate"):
+        records = read_job_records(sorted(glob.glob(os.path.join(args.folder, args.pattern), recursive=True)), args.manifest)
+        print(f"{len(records)} logs read, {sum(1 for r in records if r['success'] and r['elapsed'])} with timings.")
+        if args.command == "fit":
+            model = ResourceModel.fit(records)
+            model.save(args.output)
+            for signature, fit in sorted(model.time_models.items()):
+                print(f"{signature}: T = {np.exp(fit['log_a']):.3g} * NBasis^{fit['exponent']:.2f} * "
+                      f"({fit['serial_fraction']:.2f} + {1 - fit['serial_fraction']:.2f} / cores)  [{fit['samples']} logs, rms log {fit['rms']:.2f}]")
+            print(f"Model written to {args.output}")
+        else:
+            result = evaluate(records, args.folds)
+            if not result["predicted"]:
+                print("Not enough timed logs to evaluate.")
+                return
+            print(f"Median error {result['median_error']:.1%}, 90th percentile {result['p90_error']:.1%} over {result['predicted']} logs")
+            for signature, summary in result["by_signature"].items():
+                print(f"    {signature}: median {summary['median_error']:.1%}, p90 {summary['p90_error']:.1%} ({summary['predicted']} logs)")
+        return
+
+    model = ResourceModel.load(args.model)
+    jobs = []
+    for input_file in args.inputs:
+        molecule, atoms = os.path.splitext(os.path.basename(input_file))[0], count_atoms(input_file)
+        jobs += [(molecule, step, route_signature(route), atoms) for step, route in enumerate(args.route, start=1)]
+    plan = model.plan(jobs, args.cores, args.memory, args.max_running)
+    print("Molecule\tStep\t%nprocshared\t%mem\tExpected time (h)")
+    for molecule, step, signature, atoms in jobs:
+        cores, memory_mb = plan[(molecule, step)]
+        expected = model.predict_time(signature, model.estimate_basis(signature, atoms), cores)
+        print(f"{molecule}\t{step}\t{cores}\t{format_memory(memory_mb)}\t{'-' if expected is None else f'{expected / 3600:.2f}'}")
+
+if __name__ == "__main__":
+    main()
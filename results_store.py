@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Results Store
+
+One SQLite database with the properties extracted from every Gaussian log of a project, so that
+cross-property analyses (Boltzmann populations, spectra, charges, frequencies) are queries instead
+of new crawls of the log tree. Each log is one row of the results table, keyed by its path
+(relative to the folder of the database) with its molecule and step, and with one typed column
+per scalar property. Arrays (SCF energies, ESP charges, frequencies, excitations...) are stored
+as NPY blobs in the arrays table, one per (log, property).
+
+AutoGaussian records every step it finishes; frequencies_analyzer.py and ESP_Charges_Finder.py
+add their results; Boltzmann_Population_Calculator.py and uv_vis_spectrum.py can read from it.
+
+Usage:
+    python results_store.py ingest my_project --pattern "step*.log"
+    python results_store.py query "SELECT molecule, step, scf_energy FROM results WHERE step = 1"
+
+    store = ResultsStore("AutoGaussian_results.sqlite")
+    names, energies = store.column("scf_energy", step=1)
+    spectra = store.arrays("excitation_energies", step=2)      # {path: ndarray}
+"""
+import io
+import os
+import re
+import sys
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gaussian_log_parser import (LogParser, AtomCountExtractor, ScfEnergyExtractor, EspChargesExtractor, FrequencyExtractor,
+                                 ExcitedStateExtractor, ThermochemistryExtractor, TerminationExtractor, TextSearchExtractor,
+                                 last_excited_block, iter_log_files)
+
+DEFAULT_RESULTS_FILE = "AutoGaussian_results.sqlite"
+TD_ENERGY_TEXT = "Total Energy, E(TD-HF/TD-DFT) ="
+
+# Typed columns of the results table (besides path)
+SCALAR_COLUMNS = {
+    "molecule": "TEXT",
+    "step": "INTEGER",
+    "size": "INTEGER",
+    "mtime_ns": "INTEGER",
+    "termination": "TEXT",
+    "normal_termination": "INTEGER",
+    "atom_count": "INTEGER",
+    "scf_energy": "REAL",                       # Last SCF Done (Hartree)
+    "td_energy": "REAL",                        # Last E(TD-HF/TD-DFT) total energy (Hartree)
+    **{key: "REAL" for key in ThermochemistryExtractor.LABELS.values()},   # Hartree
+    "imaginary_modes": "INTEGER",
+    "lowest_frequency": "REAL",                 # cm-1
+    "excited_states": "INTEGER",
+    "updated": "REAL",
+}
+EXTRACTED_COLUMNS = [column for column in SCALAR_COLUMNS if column not in ("molecule", "step", "size", "mtime_ns", "updated")]
+
+# Arrays kept per log: scf_energies, esp_charges (first ESP block), frequencies, reduced_masses,
+# force_constants, ir_intensities (last frequency block), excitation_energies (eV), wavelengths (nm),
+# oscillator_strengths (last TD block)
+FREQUENCY_FIELDS = ("frequencies", "reduced_masses", "force_constants", "ir_intensities")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS results (path TEXT PRIMARY KEY, "
+    + ", ".join(f"{column} {kind}" for column, kind in SCALAR_COLUMNS.items()) + ")",
+    "CREATE INDEX IF NOT EXISTS results_molecule_step ON results (molecule, step)",
+    "CREATE TABLE IF NOT EXISTS arrays (path TEXT NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (path, name))",
+]
+
+STEP_FOLDER = re.compile(r"step_(\d+)$")
+
+def encode_array(array):
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+def decode_array(blob):
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+def molecule_and_step(path):
+    """(molecule, step) of a log in the AutoGaussian layout molecule/step_N/stepN.log, else (file name without extension, None)."""
+    folder = os.path.dirname(os.path.abspath(path))
+    match = STEP_FOLDER.search(os.path.basename(folder))
+    if match:
+        return os.path.basename(os.path.dirname(folder)), int(match.group(1))
+    return os.path.splitext(os.path.basename(path))[0], None
+
+def store_extractors():
+    """Extractors of every stored property; callers may add their own to the same pass."""
+    return [AtomCountExtractor(), ScfEnergyExtractor(), EspChargesExtractor(), FrequencyExtractor(),
+            ExcitedStateExtractor(), ThermochemistryExtractor(), TerminationExtractor(),
+            TextSearchExtractor(TD_ENERGY_TEXT, last=True, name="td_energy")]
+
+def extract_log(log_file):
+    """
+    Reads every stored property of one log in a single pass.
+
+    Returns:
+    tuple: (scalars dict with keys of SCALAR_COLUMNS, arrays dict {name: ndarray})
+    """
+    return stored_properties(LogParser(store_extractors()).parse(log_file))
+
+def stored_properties(results):
+    """(scalars, arrays) of extract_log from the LogParser results of store_extractors()."""
+    scalars = {"termination": results["termination"],
+               "normal_termination": int(results["termination"] is not None and "Normal termination" in results["termination"]),
+               "atom_count": results["atom_count"],
+               "scf_energy": results["scf_energies"][-1] if results["scf_energies"] else None,
+               "td_energy": float(results["td_energy"].split()[0]) if results["td_energy"] else None,
+               **results["thermochemistry"]}
+    arrays = {}
+    if results["scf_energies"]:
+        arrays["scf_energies"] = np.array(results["scf_energies"], dtype=np.float64)
+    if results["esp_charges"]:
+        arrays["esp_charges"] = np.array([charge for _, _, charge in results["esp_charges"][0]], dtype=np.float64)
+    blocks = results["frequencies"]["blocks"]
+    if blocks and blocks[-1]["frequencies"]:
+        for field in FREQUENCY_FIELDS:
+            arrays[field] = np.array(blocks[-1][field], dtype=np.float64)
+        scalars["imaginary_modes"] = int(np.count_nonzero(arrays["frequencies"] < 0))
+        scalars["lowest_frequency"] = float(arrays["frequencies"].min())
+    states = last_excited_block(results["excited_states"])
+    if states:
+        scalars["excited_states"] = len(states)
+        arrays["excitation_energies"] = np.array([state["energy_ev"] for state in states], dtype=np.float64)
+        arrays["wavelengths"] = np.array([state["wavelength_nm"] for state in states], dtype=np.float64)
+        arrays["oscillator_strengths"] = np.array([state["oscillator_strength"] for state in states], dtype=np.float64)
+    return scalars, arrays
+
+def _extract_job(log_file):
+    try:
+        stat = os.stat(log_file)  # Before reading: a log still growing is read again next time
+        return log_file, stat, extract_log(log_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {log_file}: {e}", file=sys.stderr)
+        return log_file, None, None
+
+class ResultsStore:
+    """
+    Args:
+    path (str): SQLite database file (created if needed). Log paths are stored relative to its folder
+    """
+    def __init__(self, path=DEFAULT_RESULTS_FILE):
+        self.path = path
+        self.base = os.path.dirname(os.path.abspath(path))
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+
+    def key(self, log_file):
+        """Path of log_file as stored (relative to the folder of the database)."""
+        return os.path.relpath(os.path.abspath(log_file), self.base)
+
+    def is_current(self, log_file, stat=None):
+        """
+        True if every property of log_file has been extracted (record_log, ingest) and the log has
+        not changed (size and mtime) since. Rows written only by a single script are not.
+        """
+        stat = stat or os.stat(log_file)
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns FROM results WHERE path = ? AND normal_termination IS NOT NULL",
+                                          (self.key(log_file),)).fetchone()
+        return row is not None and tuple(row) == (stat.st_size, stat.st_mtime_ns)
+
+    def update(self, log_file, scalars=None, arrays=None, stat=None, molecule=None, step=None, replace=False):
+        """
+        Inserts or updates the row of log_file: only the given scalar columns and arrays are
+        replaced, so each script can add its own results to those already stored.
+
+        Args:
+        log_file (str): Log path
+        scalars (dict): {column of SCALAR_COLUMNS: value}
+        arrays (dict): {name: ndarray}
+        stat (os.stat_result): Metadata of the log the results come from (size and mtime are recorded).
+                               If it differs from the recorded one, the update counts as replace: the
+                               other results belong to an older version of the log
+        molecule, step: Default to those of the AutoGaussian folder layout (molecule_and_step)
+        replace (bool): The results are those of a new version of the log: every extracted column
+                        not given is cleared and the arrays not given are removed
+        """
+        self.update_many([{"log_file": log_file, "scalars": scalars, "arrays": arrays, "stat": stat,
+                           "molecule": molecule, "step": step, "replace": replace}])
+
+    def update_many(self, updates):
+        """Several update() calls, given as dicts of their arguments, in a single transaction."""
+        rows = []
+        for update in updates:
+            scalars = {**(update.get("scalars") or {})}
+            molecule, step = update.get("molecule"), update.get("step")
+            default_molecule, default_step = molecule_and_step(update["log_file"])
+            scalars["molecule"] = molecule if molecule is not None else default_molecule
+            scalars["step"] = step if step is not None else default_step
+            stat = update.get("stat")
+            if stat is not None:
+                scalars["size"], scalars["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            scalars["updated"] = time.time()
+            unknown = set(scalars) - set(SCALAR_COLUMNS)
+            if unknown:
+                raise ValueError(f"Unknown result columns: {sorted(unknown)}")
+            rows.append((self.key(update["log_file"]), scalars, update.get("arrays") or {}, update.get("replace", False), stat))
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                for key, scalars, arrays, replace, stat in rows:
+                    if not replace and stat is not None:
+                        recorded = self.connection.execute("SELECT size, mtime_ns FROM results WHERE path = ?", (key,)).fetchone()
+                        replace = recorded is not None and tuple(recorded) != (stat.st_size, stat.st_mtime_ns)
+                    if replace:
+                        scalars = {**{column: None for column in EXTRACTED_COLUMNS}, **scalars}
+                        self.connection.execute("DELETE FROM arrays WHERE path = ?", (key,))
+                    columns = list(scalars)
+                    self.connection.execute(
+                        f"INSERT INTO results (path, {', '.join(columns)}) VALUES (?{', ?' * len(columns)}) "
+                        f"ON CONFLICT(path) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}",
+                        [key] + [scalars[column] for column in columns])
+                    self.connection.executemany("INSERT OR REPLACE INTO arrays VALUES (?, ?, ?)",
+                                                [(key, name, encode_array(array)) for name, array in arrays.items()])
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def record_log(self, log_file, molecule=None, step=None, force=False, extracted=None, stat=None):
+        """
+        Extracts and stores every property of log_file, unless it is already stored unchanged.
+        A caller that has already parsed the log (with store_extractors() among its extractors)
+        passes extracted, the stored_properties of its results, and the stat taken before parsing.
+
+        Returns:
+        bool: True if the log was read (or extracted was stored)
+        """
+        if extracted is not None:
+            self.update(log_file, *extracted, stat, molecule, step, replace=True)
+            return True
+        stat = os.stat(log_file)
+        if not force and self.is_current(log_file, stat):
+            return False
+        scalars, arrays = extract_log(log_file)
+        self.update(log_file, scalars, arrays, stat, molecule, step, replace=True)
+        return True
+
+    def _where(self, step, molecule, prefix=""):
+        clauses, params = [], []
+        if step is not None:
+            clauses.append(f"{prefix}step = ?")
+            params.append(step)
+        if molecule is not None:
+            clauses.append(f"{prefix}molecule = ?")
+            params.append(molecule)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def column(self, name, step=None, molecule=None):
+        """
+        Non-null values of one scalar column.
+
+        Returns:
+        tuple: (paths array, values array), sorted by path
+        """
+        if name not in SCALAR_COLUMNS:
+            raise ValueError(f"Unknown result column: {name}")
+        where, params = self._where(step, molecule)
+        where += (" AND " if where else " WHERE ") + f"{name} IS NOT NULL"
+        with self.lock:
+            rows = self.connection.execute(f"SELECT path, {name} FROM results{where} ORDER BY path", params).fetchall()
+        kind = object if SCALAR_COLUMNS[name] == "TEXT" else np.float64
+        return np.array([row[0] for row in rows], dtype=str), np.array([row[1] for row in rows], dtype=kind)
+
+    def array(self, log_file, name):
+        """One stored array of log_file, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM arrays WHERE path = ? AND name = ?", (self.key(log_file), name)).fetchone()
+        return None if row is None else decode_array(row[0])
+
+    def arrays(self, name, step=None, molecule=None):
+        """{path: ndarray} of one array for every matching log that has it, sorted by path."""
+        where, params = self._where(step, molecule, "results.")
+        with self.lock:
+            rows = self.connection.execute(f"SELECT arrays.path, arrays.data FROM arrays JOIN results ON results.path = arrays.path "
+                                           f"{where}{' AND' if where else ' WHERE'} arrays.name = ? ORDER BY arrays.path",
+                                           params + [name]).fetchall()
+        return {path: decode_array(data) for path, data in rows}
+
+    def query(self, sql, params=()):
+        """Runs any SELECT on the database. Returns (column names, rows)."""
+        with self.lock:
+            cursor = self.connection.execute(sql, params)
+            return [description[0] for description in cursor.description or ()], cursor.fetchall()
+
+    def prune(self, seen_paths, folder=None):
+        """Forgets the logs (below folder, if given) that are not in seen_paths: logs that no longer exist."""
+        seen = {self.key(path) for path in seen_paths}
+        prefix = None if folder is None else self.key(folder)
+        if prefix is not None:
+            prefix = None if prefix == os.curdir else prefix + os.sep
+        with self.lock:
+            missing = [(path,) for (path,) in self.connection.execute("SELECT path FROM results")
+                       if path not in seen and (prefix is None or path.startswith(prefix))]
+            self.connection.executemany("DELETE FROM results WHERE path = ?", missing)
+            self.connection.executemany("DELETE FROM arrays WHERE path = ?", missing)
+        return len(missing)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def ingest(store, base_folder, pattern="*.log", workers=None, prune=False):
+    """
+    Stores every new or changed log below base_folder, reading them in parallel.
+
+    Returns:
+    tuple: (logs read, logs found)
+    """
+    log_files = list(iter_log_files(base_folder, pattern))
+    pending = [log_file for log_file in log_files if not store.is_current(log_file)]
+    read = 0
+    with ProcessPoolExecutor(workers) as executor:
+        for log_file, stat, extracted in executor.map(_extract_job, pending, chunksize=8):
+            if extracted is None:
+                continue
+            scalars, arrays = extracted
+            store.update(log_file, scalars, arrays, stat, replace=True)
+            read += 1
+    if prune:
+        store.prune(log_files, base_folder)
+    return read, len(log_files)
+
+def main():
+    parser = argparse.ArgumentParser(description="Results store of the properties extracted from Gaussian logs.")
+    parser.add_argument("--store", default=DEFAULT_RESULTS_FILE, help="Database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Store the new or changed logs of a folder tree")
+    ingest_parser.add_argument("folder", nargs="?", default=os.getcwd())
+    ingest_parser.add_argument("--pattern", default="*.log", help="Name pattern of the logs (e.g. step*.log)")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Worker processes reading the logs (default: all cores)")
+    ingest_parser.add_argument("--prune", action="store_true", help="Forget stored logs that are no longer in the tree")
+    query_parser = commands.add_parser("query", help="Run an SQL query and print the rows as CSV")
+    query_parser.add_argument("sql")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.store)
+    try:
+        if args.command == "ingest":
+            read, found = ingest(store, args.folder, args.pattern, args.workers, args.prune)
+            print(f"Read {read} of {found} log files into {args.store}.")
+        else:
+            columns, rows = store.query(args.sql)
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Scan Manifest
+
+Remembers, for each log a tree crawler has analyzed, its size, mtime and a hash of its first
+bytes together with the extracted results (JSON). On the next run only new logs, logs that
+grew (a calculation still running) or logs that were replaced are parsed again; everything else
+is taken from the manifest, so a re-scan costs one stat per unchanged log.
+"""
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+HASH_PREFIX_BYTES = 64 * 1024
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    hash_prefix TEXT NOT NULL,
+    result      TEXT,
+    updated     REAL NOT NULL
+)
+"""
+
+def hash_prefix(path, length=HASH_PREFIX_BYTES):
+    """sha256 of the first length bytes of path."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+class ScanManifest:
+    """
+    Args:
+    path (str): SQLite database file (created if needed)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(SCHEMA)
+        self.pending = 0
+        with self.lock:
+            self.entries = {row[0]: row[1:] for row in self.connection.execute(
+                "SELECT path, size, mtime_ns, hash_prefix, result FROM entries")}
+
+    def lookup(self, path, stat):
+        """
+        Returns (True, result) if path is unchanged since it was recorded, else (False, None).
+        A log with a new mtime but the same size and first bytes (copied, touched) counts as unchanged.
+        """
+        entry = self.entries.get(path)
+        if entry is None:
+            return False, None
+        size, mtime_ns, prefix, result = entry
+        if stat.st_size != size:
+            return False, None  # New content (grown or replaced)
+        if stat.st_mtime_ns != mtime_ns:
+            if hash_prefix(path) != prefix:
+                return False, None
+            self.update(path, stat, None if result is None else json.loads(result), prefix)
+        return True, None if result is None else json.loads(result)
+
+    def update(self, path, stat, result, prefix=None):
+        """Records result for path, whose metadata before parsing was stat."""
+        prefix = prefix or hash_prefix(path)
+        encoded = None if result is None else json.dumps(result)
+        with self.lock:
+            self.entries[path] = (stat.st_size, stat.st_mtime_ns, prefix, encoded)
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                    (path, stat.st_size, stat.st_mtime_ns, prefix, encoded, time.time()))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:  # Progress survives an interrupted scan
+                self.connection.commit()
+                self.pending = 0
+
+    def prune(self, seen_paths):
+        """Forgets the logs that no longer exist (not in seen_paths)."""
+        missing = set(self.entries) - set(seen_paths)
+        with self.lock:
+            for path in missing:
+                del self.entries[path]
+            self.connection.executemany("DELETE FROM entries WHERE path = ?", [(path,) for path in missing])
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
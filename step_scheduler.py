@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Resource-aware Step Scheduler
+
+Every (molecule, step) pair is a task in a dependency graph. Tasks whose dependencies have
+finished are packed against a core and memory budget, so the node stays full while molecules
+advance at different speeds. When a task fails, everything that depends on it is skipped.
+Tasks are coroutines run on a single asyncio event loop, so thousands of pipelines can be in
+flight without one thread per molecule.
+
+Scheduling policies (order in which ready tasks are offered the free resources):
+    "fifo"              Submission order
+    "shortest_first"    Shortest expected run time first
+    "finish_molecules"  Molecules with the fewest remaining steps first
+    "critical_path"     Longest remaining chain of work first (usually the best makespan)
+
+Smaller tasks backfill around a task that does not fit yet. To keep a large task from being
+starved by a stream of small ones, the first task in priority order that does not fit counts the
+tasks started ahead of it; after max_bypass of them it reserves the resources being freed, and
+no task of lower priority starts until it has.
+"""
+import re
+import time
+import heapq
+import asyncio
+import itertools
+from collections import Counter
+
+POLICIES = ("fifo", "shortest_first", "finish_molecules", "critical_path")
+
+PENDING, READY, RUNNING, DONE, FAILED, SKIPPED = "pending", "ready", "running", "done", "failed", "skipped"
+
+def parse_memory(memory):
+    """Converts a Gaussian %mem string ("16GB", "500MW", "2000MB") to MB (binary multipliers, 1GB = 1024MB)."""
+    if isinstance(memory, (int, float)):
+        return int(memory)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)([BW]?)\s*", memory.upper())
+    if match is None:
+        raise ValueError(f"Invalid memory specification: {memory}")
+    value, prefix, unit = match.groups()
+    value = float(value) * {"": 1 / (1024 * 1024), "K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}[prefix]
+    if unit == "W" or (unit == "" and prefix == ""):  # Gaussian words are 8 bytes
+        value *= 8
+    return int(value)
+
+class StepTask:
+    def __init__(self, molecule, step, run, cores, memory, expected_time, depends_on):
+        self.molecule = molecule
+        self.step = step
+        self.run = run
+        self.cores = cores
+        self.memory = memory
+        self.expected_time = expected_time
+        self.depends_on = list(depends_on)
+        self.dependents = []
+        self.state = PENDING
+        self.result = None
+        self.order = None
+        self.ready_at = None        # time.monotonic() when its dependencies finished
+        self.bypassed = 0           # Tasks started ahead of it while it was first in line and did not fit
+        self.started_at = None      # time.monotonic() when it was given its resources
+
+    @property
+    def queue_latency(self):
+        """Seconds the task waited for resources once it was ready (None before it starts)."""
+        if self.ready_at is None or self.started_at is None:
+            return None
+        return self.started_at - self.ready_at
+
+    @property
+    def key(self):
+        return (self.molecule, self.step)
+
+class StepScheduler:
+    """
+    Packs ready tasks against a resource budget.
+
+    Args:
+    total_cores (int): Cores available to all running tasks together
+    total_memory (int or str): Memory available to all running tasks together (MB or "256GB")
+    policy (str): One of POLICIES
+    max_running (int): Optional cap on the number of simultaneously running tasks
+    max_bypass (int): Tasks that may backfill ahead of the first waiting task before it reserves
+                      the resources being freed (0 disables backfilling)
+    """
+    def __init__(self, total_cores, total_memory, policy="critical_path", max_running=None, max_bypass=8):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}. Use one of {POLICIES}")
+        self.total_cores = int(total_cores)
+        self.total_memory = parse_memory(total_memory)
+        self.policy = policy
+        self.max_running = max_running
+        self.max_bypass = max_bypass
+        self.tasks = []
+        self.counter = itertools.count()
+
+    def add_task(self, molecule, step, run, cores=1, memory=0, expected_time=1.0, depends_on=()):
+        """
+        Registers run as the task (molecule, step). run is a coroutine function (or a plain function,
+        which is then run in a worker thread) returning True on success.
+        depends_on is a list of tasks previously returned by add_task.
+        """
+        cores, memory = int(cores), parse_memory(memory)
+        if cores > self.total_cores or memory > self.total_memory:
+            raise ValueError(f"Task {molecule} step {step} needs {cores} cores / {memory} MB, "
+                             f"more than the budget of {self.total_cores} cores / {self.total_memory} MB")
+        task = StepTask(molecule, step, run, cores, memory, expected_time, depends_on)
+        task.order = next(self.counter)
+        for dependency in task.depends_on:
+            dependency.dependents.append(task)
+        self.tasks.append(task)
+        return task
+
+    def _critical_path(self, task, memo):
+        if task.order not in memo:
+            memo[task.order] = task.expected_time + max((self._critical_path(t, memo) for t in task.dependents), default=0.0)
+        return memo[task.order]
+
+    def _priority(self, task, memo, remaining_steps):
+        if self.policy == "shortest_first":
+            return (task.expected_time, task.order)
+        if self.policy == "finish_molecules":
+            return (remaining_steps[task.molecule], task.expected_time, task.order)
+        if self.policy == "critical_path":
+            return (-self._critical_path(task, memo), task.order)
+        return (task.order,)
+
+    def _skip_dependents(self, task, skipped):
+        for dependent in task.dependents:
+            if dependent.state == PENDING:
+                dependent.state = SKIPPED
+                skipped.append(dependent)
+                self._skip_dependents(dependent, skipped)
+        return skipped
+
+    async def _execute(self, task, finished, wake):
+        try:
+            if asyncio.iscoroutinefunction(task.run):
+                success = bool(await task.run())
+            else:
+                success = bool(await asyncio.to_thread(task.run))
+        except Exception as exc:
+            print(f"{task.molecule} step {task.step} generated an exception: {exc}")
+            success = False
+        task.result = success
+        task.state = DONE if success else FAILED
+        finished.append(task)
+        wake.set()
+
+    async def run_async(self):
+        """
+        Runs every task and returns once the graph is exhausted.
+
+        Returns:
+        dict: {(molecule, step): "done" | "failed" | "skipped"}
+        """
+        memo = {}
+        free_cores, free_memory = self.total_cores, self.total_memory
+        running = 0
+        handles = set()  # Keeps references to the asyncio tasks until they finish
+        finished = []    # Tasks finished since the last wake
+        wake = asyncio.Event()
+
+        # Readiness is tracked incrementally: each task counts the dependencies it still waits for
+        waiting = {task.order: len(task.depends_on) for task in self.tasks}
+        remaining_steps = Counter(task.molecule for task in self.tasks)
+        ready = []               # Heap of (priority, order, task); the priority is fixed when the task becomes ready
+        ready_sizes = Counter()  # (cores, memory) of the ready tasks, to stop looking once none of them fits
+
+        def make_ready(task):
+            task.state = READY
+            task.ready_at = time.monotonic()
+            heapq.heappush(ready, (self._priority(task, memo, remaining_steps), task.order, task))
+            ready_sizes[task.cores, task.memory] += 1
+
+        def any_fits():
+            return any(count and cores <= free_cores and memory <= free_memory
+                       for (cores, memory), count in ready_sizes.items())
+
+        for task in self.tasks:
+            if not task.depends_on:
+                make_ready(task)
+
+        while True:
+            # Release the resources of finished tasks and offer their dependents
+            for task in finished:
+                running -= 1
+                free_cores += task.cores
+                free_memory += task.memory
+                remaining_steps[task.molecule] -= 1
+                if task.state == DONE:
+                    for dependent in task.dependents:
+                        waiting[dependent.order] -= 1
+                        if waiting[dependent.order] == 0 and dependent.state == PENDING:
+                            make_ready(dependent)
+                else:
+                    for skipped in self._skip_dependents(task, []):
+                        remaining_steps[skipped.molecule] -= 1
+            finished.clear()
+
+            # Packing in priority order; smaller tasks backfill around ones that do not fit until the
+            # first of those has been bypassed max_bypass times and reserves what is being freed
+            blocked = []
+            while ready and (self.max_running is None or running < self.max_running) and any_fits():
+                entry = heapq.heappop(ready)
+                task = entry[2]
+                if blocked and blocked[0][2].bypassed >= self.max_bypass:
+                    blocked.append(entry)
+                    break
+                if task.cores > free_cores or task.memory > free_memory:
+                    blocked.append(entry)
+                    continue
+                if blocked:
+                    blocked[0][2].bypassed += 1
+                ready_sizes[task.cores, task.memory] -= 1
+                task.state = RUNNING
+                task.started_at = time.monotonic()
+                running += 1
+                free_cores -= task.cores
+                free_memory -= task.memory
+                handle = asyncio.create_task(self._execute(task, finished, wake))
+                handles.add(handle)
+                handle.add_done_callback(handles.discard)
+            for entry in blocked:
+                heapq.heappush(ready, entry)
+
+            if not running:
+                break
+            await wake.wait()
+            wake.clear()
+
+        return {task.key: task.state for task in self.tasks}
+
+    def run(self):
+        """Blocking wrapper around run_async."""
+        return asyncio.run(self.run_async())
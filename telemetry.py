@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Step Telemetry
+
+Records one entry per Gaussian run of AutoGaussian (molecule, step, attempt): time waiting for
+resources in the scheduler, launch latency (launcher command) and start latency (until the log
+starts growing, which includes a cluster queue, or the whole run for launchers that block until
+Gaussian finishes), wall time, Gaussian's
+own "Job cpu time" and "Elapsed time", SCF cycles, optimization steps, checkpoint copy time and
+the lag between the last write of the log and the watcher noticing its termination.
+
+Entries are appended to a JSON-lines file and aggregated per step into a Prometheus
+textfile-collector file (node_exporter --collector.textfile.directory), rewritten atomically
+after every run. The report shows where the core-hours of a batch went and how well each step
+uses its cores (CPU time / (elapsed time x cores)).
+
+Usage:
+    python telemetry.py AutoGaussian_telemetry.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from gaussian_log_parser import LogParser, JobStatisticsExtractor
+
+DEFAULT_TELEMETRY_FILE = "AutoGaussian_telemetry.jsonl"
+METRIC_PREFIX = "autogaussian"
+
+# Durations aggregated per step as Prometheus summaries (_sum and _count), seconds
+DURATIONS = {
+    "queue_latency": "Time ready steps waited for cores and memory",
+    "launch_latency": "Time the launcher command (launch_g16, sbatch) took to return",
+    "start_latency": "Time from launch until the log started growing (cluster queue included)",
+    "wall_time": "Time from launch until the termination was detected",
+    "cpu_time": "Gaussian Job cpu time",
+    "elapsed_time": "Gaussian Elapsed time",
+    "chk_copy_time": "Time staging the checkpoint of the previous step",
+    "watcher_lag": "Time between the last write of the log and the detection of its termination",
+}
+# Counts aggregated per step as Prometheus counters (_total)
+COUNTS = {
+    "scf_cycles": "SCF cycles",
+    "opt_steps": "Optimization steps",
+}
+
+def read_job_statistics(log_file):
+    """{cpu_time, elapsed_time, scf_cycles, opt_steps, jobs} of a log, None if it cannot be read."""
+    try:
+        return LogParser([JobStatisticsExtractor()]).parse(log_file)["job_statistics"]
+    except (OSError, ValueError):
+        return None
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Telemetry:
+    """
+    Args:
+    jsonl_file (str): JSON-lines file the entries are appended to (None to keep them only in memory)
+    prometheus_file (str): Prometheus textfile-collector file (.prom), None to skip it
+    """
+    def __init__(self, jsonl_file=DEFAULT_TELEMETRY_FILE, prometheus_file=None):
+        self.jsonl_file = jsonl_file
+        self.prometheus_file = prometheus_file
+        self.lock = threading.Lock()
+        self.entries = []
+        # Per-step aggregates of this run, kept up to date for the Prometheus file
+        self.sums, self.counts, self.totals, self.runs = defaultdict(float), defaultdict(int), defaultdict(float), defaultdict(int)
+
+    def record(self, molecule, step, success, log_file=None, cores=None, memory=None, attempt=0, failure=None, statistics=None, **metrics):
+        """
+        Adds the entry of one run. metrics holds any of the DURATIONS (seconds, None when unknown);
+        Gaussian's times and cycle counts are taken from statistics (JobStatisticsExtractor result
+        of a caller that already parsed the log) or else read from log_file.
+
+        Returns:
+        dict: The entry
+        """
+        entry = {"time": time.time(), "molecule": molecule, "step": step, "attempt": attempt, "success": bool(success),
+                 "failure": None if success else failure, "cores": None if cores is None else int(cores), "memory": memory}
+        entry.update({name: metrics.get(name) for name in DURATIONS})
+        if statistics is None and log_file:
+            statistics = read_job_statistics(log_file)
+        if statistics is not None:
+            entry.update(cpu_time=statistics["cpu_time"] if statistics["jobs"] else None,
+                         elapsed_time=statistics["elapsed_time"] if statistics["jobs"] else None,
+                         scf_cycles=statistics["scf_cycles"], opt_steps=statistics["opt_steps"])
+        with self.lock:
+            self.entries.append(entry)
+            self._aggregate(entry)
+            if self.jsonl_file:
+                with open(self.jsonl_file, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+            if self.prometheus_file:
+                self._write_prometheus()
+        return entry
+
+    def _aggregate(self, entry):
+        step = str(entry["step"])
+        self.runs[(step, "success" if entry["success"] else entry["failure"] or "failure")] += 1
+        for name in DURATIONS:
+            if entry.get(name) is not None:
+                self.sums[(name, step)] += entry[name]
+                self.counts[(name, step)] += 1
+        for name in COUNTS:
+            self.totals[(name, step)] += entry.get(name) or 0
+        if entry.get("elapsed_time") is not None and entry.get("cores"):
+            self.totals[("core_seconds", step)] += entry["elapsed_time"] * entry["cores"]
+
+    def _write_prometheus(self):
+        sums, counts, totals, runs = self.sums, self.counts, self.totals, self.runs
+        lines = [f"# HELP {METRIC_PREFIX}_step_runs_total Gaussian runs by step and outcome",
+                 f"# TYPE {METRIC_PREFIX}_step_runs_total counter"]
+        lines += [f'{METRIC_PREFIX}_step_runs_total{{step="{_label(step)}",outcome="{_label(outcome)}"}} {count}'
+                  for (step, outcome), count in sorted(runs.items())]
+        for name, description in DURATIONS.items():
+            metric = f"{METRIC_PREFIX}_step_{name}_seconds"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} summary"]
+            for (metric_name, step), total in sorted(sums.items()):
+                if metric_name == name:
+                    lines.append(f'{metric}_sum{{step="{_label(step)}"}} {total:.6f}')
+                    lines.append(f'{metric}_count{{step="{_label(step)}"}} {counts[(name, step)]}')
+        for name, description in {**COUNTS, "core_seconds": "Gaussian elapsed time x cores"}.items():
+            metric = f"{METRIC_PREFIX}_step_{name}_total"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{step="{_label(step)}"}} {total:g}' for (metric_name, step), total in sorted(totals.items()) if metric_name == name]
+
+        # Written next to the target and renamed, so the collector never reads a partial file
+        temporary = f"{self.prometheus_file}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.prometheus_file)
+
+def load_entries(jsonl_file):
+    """Entries of a telemetry JSON-lines file (a line cut by an interrupted write is skipped)."""
+    entries = []
+    with open(jsonl_file, "r") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else None
+
+def summarize(entries):
+    """
+    Per (step, cores) aggregates of telemetry entries.
+
+    Returns:
+    list: One dict per (step, cores): runs, failed, wall_hours, core_hours, share (of all core-hours),
+          mean wall/queue/launch/start/chk copy/watcher lag (s), efficiency (cpu / (elapsed x cores)),
+          mean SCF cycles and optimization steps per run
+    """
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[(str(entry["step"]), entry.get("cores"))].append(entry)
+    rows = []
+    for (step, cores), group in groups.items():
+        core_seconds = sum((entry.get("elapsed_time") or entry.get("wall_time") or 0) * (cores or 1) for entry in group)
+        cpu = sum(entry["cpu_time"] for entry in group if entry.get("cpu_time") is not None and entry.get("elapsed_time"))
+        elapsed = sum(entry["elapsed_time"] for entry in group if entry.get("cpu_time") is not None and entry.get("elapsed_time"))
+        rows.append({"step": step, "cores": cores, "runs": len(group), "failed": sum(not entry["success"] for entry in group),
+                     "wall_hours": sum(entry.get("wall_time") or 0 for entry in group) / 3600, "core_hours": core_seconds / 3600,
+                     "mean_wall": _mean([entry.get("wall_time") for entry in group]),
+                     "mean_queue": _mean([entry.get("queue_latency") for entry in group]),
+                     "mean_launch": _mean([entry.get("launch_latency") for entry in group]),
+                     "mean_start": _mean([entry.get("start_latency") for entry in group]),
+                     "mean_chk_copy": _mean([entry.get("chk_copy_time") for entry in group]),
+                     "mean_watcher_lag": _mean([entry.get("watcher_lag") for entry in group]),
+                     "efficiency": cpu / (elapsed * cores) if elapsed and cores else None,
+                     "scf_cycles": _mean([entry.get("scf_cycles") for entry in group]),
+                     "opt_steps": _mean([entry.get("opt_steps") for entry in group])})
+    total = sum(row["core_hours"] for row in rows)
+    for row in rows:
+        row["share"] = row["core_hours"] / total if total else None
+    return sorted(rows, key=lambda row: -row["core_hours"])
+
+def format_report(entries):
+    """Text table of summarize(entries), the steps using the most core-hours first."""
+    def cell(value, template):
+        return "-" if value is None else template.format(value)
+
+    header = ["Step", "Cores", "Runs", "Failed", "Core-h", "Share", "Wall-h", "Mean wall s", "Queue s", "Launch s", "Start s",
+              "Chk copy s", "Watch lag s", "CPU eff.", "SCF cycles", "Opt steps"]
+    table = [header]
+    for row in summarize(entries):
+        table.append([row["step"], cell(row["cores"], "{}"), str(row["runs"]), str(row["failed"]),
+                      f"{row['core_hours']:.2f}", cell(row["share"], "{:.1%}"), f"{row['wall_hours']:.2f}",
+                      cell(row["mean_wall"], "{:.0f}"), cell(row["mean_queue"], "{:.1f}"), cell(row["mean_launch"], "{:.1f}"), cell(row["mean_start"], "{:.1f}"),
+                      cell(row["mean_chk_copy"], "{:.2f}"), cell(row["mean_watcher_lag"], "{:.2f}"),
+                      cell(row["efficiency"], "{:.0%}"), cell(row["scf_cycles"], "{:.0f}"), cell(row["opt_steps"], "{:.0f}")])
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    return "\n".join("  ".join(value.rjust(width) for value, width in zip(line, widths)) for line in table)
+
+def main():
+    parser = argparse.ArgumentParser(description="Where the time of an AutoGaussian batch went, by step and core count.")
+    parser.add_argument("telemetry_file", nargs="?", default=DEFAULT_TELEMETRY_FILE, help="Telemetry JSON-lines file")
+    args = parser.parse_args()
+    if not os.path.exists(args.telemetry_file):
+        print(f"File not found: {args.telemetry_file}")
+        sys.exit(1)
+    entries = load_entries(args.telemetry_file)
+    if not entries:
+        print("No runs recorded.")
+        return
+    print(format_report(entries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_backends
+from batch_backends import SlurmBackend
+
+class FakeProcess:
+    def __init__(self, returncode, stdout, stderr):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+    async def communicate(self):
+        return self.stdout, self.stderr
+
+def test_slurm_wait_retries_transient_squeue_errors(monkeypatch):
+    responses = [FakeProcess(1, b"", b"slurm_load_jobs error: Socket timed out on send/recv operation"),
+                 FakeProcess(0, b"1234_7\n", b""),
+                 FakeProcess(1, b"", b"slurm_load_jobs error: Invalid job id specified")]
+    calls = []
+
+    async def create_subprocess_exec(*arguments, **kwargs):
+        calls.append(arguments)
+        return responses[len(calls) - 1]
+
+    monkeypatch.setattr(batch_backends.asyncio, "create_subprocess_exec", create_subprocess_exec)
+    asyncio.run(SlurmBackend(poll_interval=0.001).wait(["1234"]))
+    assert len(calls) == 3
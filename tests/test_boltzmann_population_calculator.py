@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Boltzmann_Population_Calculator import read_energy_tree
+
+def write_log(path, energy, normal=True):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ending = " Normal termination of Gaussian 16" if normal else " Error termination via Lnk1e"
+    path.write_text(f" SCF Done:  E(RB3LYP) =  {energy}     A.U. after   10 cycles\n{ending}\n")
+
+def test_last_finished_step_of_each_molecule(tmp_path):
+    for molecule, energies in (("mol_1", (-1.0, -2.0)), ("mol_2", (-1.1, -2.1))):
+        for step, energy in enumerate(energies, start=1):
+            write_log(tmp_path / molecule / f"step_{step}" / f"step{step}.log", energy)
+    write_log(tmp_path / "mol_2" / "step_3" / "step3.log", -3.1, normal=False)
+    names, energies = read_energy_tree(str(tmp_path), workers=1, index_file=None)
+    assert sorted(zip(names.tolist(), energies.tolist())) == [(os.path.join("mol_1", "step_2", "step2.log"), -2.0),
+                                                              (os.path.join("mol_2", "step_2", "step2.log"), -2.1)]
+
+def test_molecules_at_different_steps_are_refused(tmp_path):
+    write_log(tmp_path / "mol_1" / "step_1" / "step1.log", -1.0)
+    write_log(tmp_path / "mol_1" / "step_2" / "step2.log", -2.0)
+    write_log(tmp_path / "mol_2" / "step_1" / "step1.log", -1.1)
+    with pytest.raises(ValueError):
+        read_energy_tree(str(tmp_path), workers=1, index_file=None)
+    names, _ = read_energy_tree(str(tmp_path), pattern="step1.log", workers=1, index_file=None)
+    assert len(names) == 2
+
+def test_several_logs_in_one_folder(tmp_path):
+    write_log(tmp_path / "conformers" / "a.log", -1.0)
+    write_log(tmp_path / "conformers" / "b.log", -1.1)
+    with pytest.raises(ValueError):
+        read_energy_tree(str(tmp_path), workers=1, index_file=None)
+    names, _ = read_energy_tree(str(tmp_path), workers=1, index_file=None, all_logs=True)
+    assert len(names) == 2
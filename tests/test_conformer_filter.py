@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conformer_filter import Conformer, parse_geometry, deduplicate
+
+def test_parse_geometry_stops_at_blank_line():
+    lines = ["C    0.0  0.0  0.0", "O    1.2  0.0  0.0", "", "B 1 2 F", ""]
+    elements, coordinates = parse_geometry(lines)
+    assert elements == ["C", "O"]
+    assert coordinates.shape == (2, 3)
+
+def test_deduplicate_rotated_copy():
+    rng = np.random.default_rng(0)
+    coordinates = rng.normal(size=(6, 3))
+    angle = 0.7
+    rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+    elements = ["C"] * 6
+    conformers = [Conformer("a", "", elements, coordinates, -1.0),
+                  Conformer("b", "", elements, coordinates @ rotation.T + 5.0, -0.9),
+                  Conformer("c", "", elements, rng.normal(size=(6, 3)), -0.8)]
+    kept, duplicates, discarded = deduplicate(conformers)
+    assert [c.name for c in kept] == ["a", "c"]
+    assert duplicates == {"a": ["b"], "c": []}
+    assert discarded == []
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_watcher import classify_failure
+from failure_recovery import apply_recovery, reads_checkpoint
+
+# Tails of real error terminations, as Gaussian 16 writes them
+FAILED_LOGS = {
+    "opt_steps": b""" Optimization stopped.
+    -- Number of steps exceeded,  NStep= 100
+    -- Flag reset to prevent archiving.
+ Error termination request processed by link 9999.
+ Error termination via Lnk1e in /opt/g16/l9999.exe at Tue Mar  5 10:12:44 2024.
+""",
+    "scf_convergence": b""" >>>>>>>>>> Convergence criterion not met.
+ SCF Done:  E(RB3LYP) =  -2820.25150012     A.U. after  129 cycles
+ Convergence failure -- run terminated.
+ Error termination via Lnk1e in /opt/g16/l502.exe at Tue Mar  5 10:12:44 2024.
+""",
+    "memory": b""" galloc:  could not allocate memory.: Resource temporarily unavailable
+ Error termination via Lnk1e in /opt/g16/l1002.exe at Tue Mar  5 10:12:44 2024.
+""",
+    "io": b""" Erroneous write. Write 1048576 instead of 4194304.
+ fd = 4
+ orig len = 4194304 left = 4194304
+ g_write
+ Error termination via Lnk1e in /opt/g16/l804.exe at Tue Mar  5 10:12:44 2024.
+""",
+    "crash": b""" Error: segmentation violation
+   rax 0000000000000000, rbx 00007ffd4c2b1e40, rcx ffffffffffffffff
+ Error termination via Lnk1e in /opt/g16/l502.exe at Tue Mar  5 10:12:44 2024.
+""",
+    "error": b""" Error in internal coordinate system.
+ Error termination via Lnk1e in /opt/g16/l103.exe at Tue Mar  5 10:12:44 2024.
+""",
+}
+
+@pytest.mark.parametrize("kind", sorted(FAILED_LOGS))
+def test_classify_failure(kind):
+    assert classify_failure(FAILED_LOGS[kind]) == kind
+
+def test_classify_failure_remembers_earlier_chunks():
+    tail = b" Error termination via Lnk1e in /opt/g16/l502.exe at Tue Mar  5 10:12:44 2024.\n"
+    assert classify_failure(tail, seen={"scf_convergence"}) == "scf_convergence"
+
+@pytest.mark.parametrize("action, route, expected", [
+    ("restart_opt", "# Opt Freq B3LYP/6-31G(d)", "# Opt=(Restart) Freq B3LYP/6-31G(d)"),
+    ("restart_opt", "# B3LYP/6-31G(d) Opt=CalcFC Freq", "# B3LYP/6-31G(d) Opt=(CalcFC,Restart) Freq"),
+    ("scf_xqc", "# B3LYP/6-31G(d)", "# B3LYP/6-31G(d) SCF=(XQC,MaxCycle=512)"),
+    ("scf_xqc", "# B3LYP/6-31G(d) SCF=(MaxCycle=128,Tight)", "# B3LYP/6-31G(d) SCF=(Tight,XQC,MaxCycle=512)"),
+    ("next_root", "# B3LYP/6-31G(d) TD=(NStates=6,Root=1) Opt", "# B3LYP/6-31G(d) TD=(NStates=6,Root=2) Opt"),
+    ("next_root", "# B3LYP/6-31G(d) TD=NStates=6", "# B3LYP/6-31G(d) TD=(NStates=6,Root=2)"),
+])
+def test_apply_recovery(action, route, expected):
+    assert apply_recovery(action, route) == expected
+
+def test_restarted_optimization_reads_checkpoint():
+    assert reads_checkpoint(apply_recovery("restart_opt", "# Opt Freq B3LYP/6-31G(d)"))
+    assert not reads_checkpoint("# Opt Freq B3LYP/6-31G(d)")
+
+def test_unknown_recovery_action():
+    with pytest.raises(ValueError):
+        apply_recovery("kill_job", "# Opt B3LYP/6-31G(d)")
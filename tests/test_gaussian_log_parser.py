@@ -0,0 +1,88 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gaussian_log_parser import LogParser, EspChargesExtractor, TextSearchExtractor, search_logs, find_lines, iter_log_files
+from log_index import LogIndex
+
+HEADER = " NAtoms=      3 NActive=      3 NUniq=      3 SFac= 1.00D+00 NAtFMM=   60 NAOKFM=F Big=F\n"
+
+ESP_BLOCK = """ ESP charges:
+               1
+     1  O   -0.834000
+     2  H    0.417000
+     3  H    0.417000
+"""
+
+def parse(tmp_path, text):
+    path = tmp_path / "water.log"
+    path.write_text(text)
+    return LogParser([EspChargesExtractor(totals=True)]).parse(str(path))["esp_charges"]
+
+def test_esp_block_closed_after_last_atom(tmp_path):
+    blocks = parse(tmp_path, HEADER + ESP_BLOCK + " Sum of ESP charges =   0.00000\n")
+    assert [charge for _, _, charge in blocks[0][0]] == [-0.834, 0.417, 0.417]
+    assert blocks[0][1] == 0.0
+
+def test_esp_block_without_sum_is_flagged(tmp_path):
+    blocks = parse(tmp_path, HEADER + ESP_BLOCK + "     4  H    0.100000\n Sum of ESP charges =   0.10000\n")
+    assert len(blocks[0][0]) == 3
+    assert blocks[0][1] is None
+
+def test_truncated_esp_block_is_flagged(tmp_path):
+    blocks = parse(tmp_path, HEADER + ESP_BLOCK.rsplit("     3", 1)[0])
+    assert len(blocks[0][0]) == 2
+    assert blocks[0][1] is None
+
+SCF_LOG = """ Some preamble
+ SCF Done:  E(RB3LYP) =  -76.4089533370     A.U. after   10 cycles
+ Normal termination of Gaussian 16 at Tue Mar  5 10:12:44 2024.
+"""
+
+def overlapping_parser():
+    return LogParser([TextSearchExtractor("SCF Done:", name="short"), TextSearchExtractor("SCF Done:  E(", name="long")])
+
+def test_overlapping_triggers_are_all_dispatched(tmp_path):
+    path = tmp_path / "water.log"
+    path.write_text(SCF_LOG)
+    results = overlapping_parser().parse(str(path))
+    assert results["short"].startswith("E(RB3LYP) =  -76.4089533370")
+    assert results["long"].startswith("RB3LYP) =  -76.4089533370")
+
+def test_overlapping_triggers_with_index(tmp_path):
+    path = tmp_path / "water.log"
+    path.write_text(SCF_LOG)
+    index = LogIndex(str(tmp_path / "index.sqlite"))
+    first = overlapping_parser().parse(str(path), index)   # Fills the index
+    second = overlapping_parser().parse(str(path), index)  # Reads the indexed sections only
+    assert first == second
+    assert second["short"] is not None and second["long"] is not None
+
+def test_search_logs_fills_the_index(tmp_path):
+    path = tmp_path / "water.log"
+    path.write_text(SCF_LOG)
+    index = LogIndex(str(tmp_path / "index.sqlite"))
+    assert search_logs(str(path), ["SCF Done:"], from_end=True, index=index) == ["E(RB3LYP) =  -76.4089533370     A.U. after   10 cycles"]
+    assert index.lookup(str(path), os.stat(path)) is not None
+    assert search_logs(str(path), ["SCF Done:"], from_end=True, index=index) == ["E(RB3LYP) =  -76.4089533370     A.U. after   10 cycles"]
+    assert search_logs(str(path), ["Some preamble", "missing"], index=index) == ["", None]  # Not indexed: find_lines
+
+def test_find_lines_overlapping_texts(tmp_path):
+    path = tmp_path / "water.log"
+    path.write_text(SCF_LOG + " SCF Done\n")
+    first = find_lines(str(path), ["SCF Done:", "SCF Done", "missing"])
+    last = find_lines(str(path), ["SCF Done:", "SCF Done", "missing"], from_end=True)
+    assert first[0] == first[1] == last[0] and first[0].startswith(b" SCF Done:  E(RB3LYP)")
+    assert last[1] == b" SCF Done\n"
+    assert first[2] is None and last[2] is None
+
+def test_iter_log_files_depth(tmp_path):
+    for name in ["top.log", "a/a.log", "a/b/b.log", "a/b/c/c.log", "d/d.log", "d/notes.txt"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("")
+    found = lambda **kwargs: [os.path.relpath(path, tmp_path) for path in iter_log_files(str(tmp_path), **kwargs)]
+    assert found() == ["top.log", os.path.join("a", "a.log"), os.path.join("a", "b", "b.log"),
+                       os.path.join("a", "b", "c", "c.log"), os.path.join("d", "d.log")]
+    assert found(max_depth=0, skip_base=True) == [os.path.join("a", "a.log"), os.path.join("d", "d.log")]
+    assert found(max_depth=1, skip_base=True) == [os.path.join("a", "a.log"), os.path.join("a", "b", "b.log"), os.path.join("d", "d.log")]
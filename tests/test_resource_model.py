@@ -0,0 +1,84 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resource_model import count_atoms, fit_time_model, ResourceModel
+
+WATER_XYZ = """3
+water
+O    0.000000    0.000000    0.117300
+H    0.000000    0.757200   -0.469200
+H    0.000000   -0.757200   -0.469200
+"""
+
+WATER_COM = """%mem=16GB
+%nprocshared=16
+%chk=water.chk
+# Opt B3LYP/6-31G(d)
+
+water
+
+0 1
+O    0.000000    0.000000    0.117300
+H    0.000000    0.757200   -0.469200
+H    0.000000   -0.757200   -0.469200
+
+"""
+
+SIGNATURE = "opt b3lyp/6-31g(d)"
+
+# T = a * NBasis^k * (s + (1 - s) / cores), on several basis sizes and core counts
+A, EXPONENT, SERIAL = 2e-6, 2.5, 0.1
+BASIS = np.tile([200, 300, 400, 600, 800], 3)
+CORES = np.repeat([1, 4, 16], 5)
+ELAPSED = A * BASIS ** EXPONENT * (SERIAL + (1 - SERIAL) / CORES)
+
+def job_record(basis_functions, cores, elapsed, memory_per_core=1024, success=True, memory_error=False):
+    return {"signature": SIGNATURE, "atoms": basis_functions // 10, "basis_functions": basis_functions, "cores": cores,
+            "memory": memory_per_core * cores, "elapsed": elapsed, "success": success, "memory_error": memory_error}
+
+def synthetic_model():
+    records = [job_record(int(n), int(c), t) for n, c, t in zip(BASIS, CORES, ELAPSED)]
+    records.append(job_record(200, 4, None, success=False, memory_error=True))
+    return ResourceModel.fit(records)
+
+def test_fit_time_model_recovers_parameters():
+    model = fit_time_model(BASIS, CORES, ELAPSED)
+    assert np.isclose(model["log_a"], np.log(A))
+    assert np.isclose(model["exponent"], EXPONENT)
+    assert np.isclose(model["serial_fraction"], SERIAL)
+    assert model["samples"] == len(ELAPSED) and model["rms"] < 1e-9
+
+def test_resource_model_fit():
+    model = synthetic_model()
+    assert np.isclose(model.predict_time(SIGNATURE, 500, 8), A * 500 ** EXPONENT * (SERIAL + (1 - SERIAL) / 8))
+    assert model.estimate_basis(SIGNATURE, 50) == 500
+    assert model.memory_for(SIGNATURE, 4) == 4 * 2048  # Twice the per-core memory that ran out
+
+def test_plan_gives_cores_to_the_critical_molecule():
+    model = synthetic_model()
+    jobs = [("large", 1, SIGNATURE, 80), ("large", 2, SIGNATURE, 80)] + [(f"small{i}", 1, SIGNATURE, 20) for i in range(4)]
+    plan = model.plan(jobs, 64)
+    assert plan[("large", 1)] == plan[("large", 2)] == (64, 64 * 2048)
+    assert all(plan[(f"small{i}", 1)] == (1, 2048) for i in range(4))
+    assert model.plan(jobs, 4)[("large", 1)] == (4, 4 * 2048)
+
+def test_plan_full_node_keeps_fewest_cores():
+    jobs = [(f"molecule{i}", 1, SIGNATURE, 40) for i in range(64)]
+    assert set(synthetic_model().plan(jobs, 64).values()) == {(1, 2048)}
+
+def test_count_atoms_xyz(tmp_path):
+    path = tmp_path / "water.xyz"
+    path.write_text(WATER_XYZ)
+    assert count_atoms(str(path)) == 3
+
+def test_count_atoms_com(tmp_path):
+    path = tmp_path / "water.com"
+    path.write_text(WATER_COM)
+    assert count_atoms(str(path)) == 3
+
+def test_count_atoms_chk(tmp_path):
+    assert count_atoms(str(tmp_path / "water.chk")) is None
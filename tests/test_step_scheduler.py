@@ -0,0 +1,42 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from step_scheduler import StepScheduler, parse_memory
+
+def make_run(name, started):
+    async def run():
+        started.append(name)
+        await asyncio.sleep(0.01)
+        return True
+    return run
+
+def test_parse_memory_binary():
+    assert parse_memory("16GB") == 16 * 1024
+    assert parse_memory("2048KB") == 2
+    assert parse_memory("1TB") == 1024 * 1024
+    assert parse_memory("128MW") == 1024
+
+def test_large_task_is_not_starved():
+    started = []
+    scheduler = StepScheduler(4, "4GB", "fifo", max_bypass=2)
+    scheduler.add_task("small", 0, make_run("small", started), cores=1)
+    scheduler.add_task("large", 0, make_run("large", started), cores=4)
+    for i in range(20):
+        scheduler.add_task(f"backfill{i}", 0, make_run(f"backfill{i}", started), cores=1)
+    states = scheduler.run()
+    assert all(state == "done" for state in states.values())
+    assert started.index("large") <= 3  # small, at most max_bypass backfills, then large
+
+def test_dependents_run_after_and_are_skipped_on_failure():
+    started = []
+    scheduler = StepScheduler(2, "2GB", "critical_path")
+    first = scheduler.add_task("a", 1, make_run("a1", started), cores=1)
+    scheduler.add_task("a", 2, make_run("a2", started), cores=1, depends_on=[first])
+    failing = scheduler.add_task("b", 1, lambda: False, cores=1)
+    scheduler.add_task("b", 2, make_run("b2", started), cores=1, depends_on=[failing])
+    states = scheduler.run()
+    assert started == ["a1", "a2"]
+    assert states == {("a", 1): "done", ("a", 2): "done", ("b", 1): "failed", ("b", 2): "skipped"}
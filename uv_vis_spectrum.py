@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Boltzmann-Weighted UV-Vis Spectrum
+
+Builds the absorption (or emission) spectrum of a conformer ensemble from the "Excited State"
+lines of TD-DFT logs (AutoGaussian steps 2-5). Each conformer is weighted by its Boltzmann
+population (calculate_boltzmann_population) and every transition is broadened with a Gaussian
+or Lorentzian line shape. The line shapes of all transitions are evaluated at once on the whole
+grid with NumPy broadcasting (transitions x grid points), in blocks that bound the memory used.
+
+Usage:
+    python uv_vis_spectrum.py my_project --pattern step2.log --fwhm 0.3 --range 200 800 --points 10000
+    python uv_vis_spectrum.py my_project --pattern step4.log --emission
+"""
+import os
+import sys
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from gaussian_log_parser import LogParser, ScfEnergyExtractor, ExcitedStateExtractor, TextSearchExtractor, last_excited_block, iter_log_files
+from Boltzmann_Population_Calculator import calculate_boltzmann_population, T
+from results_store import ResultsStore, TD_ENERGY_TEXT
+
+EV_NM = 1239.84198                # nm eV: wavelength (nm) = EV_NM / energy (eV)
+# Molar absorptivity per unit oscillator strength of a line shape normalized in eV:
+# integral of epsilon over wavenumber = f / 4.319e-9 L mol-1 cm-2, and 1 eV = 8065.544 cm-1
+EPSILON_PER_OSCILLATOR = 1 / (4.319e-9 * 8065.544)   # L mol-1 cm-1 eV
+BLOCK_ELEMENTS = 2 ** 24          # Largest (transitions x grid) block evaluated at once (128 MB)
+
+def gaussian(offsets, fwhm):
+    """Gaussian line shape of unit area (offsets and fwhm in eV)."""
+    a = 4 * np.log(2) / fwhm ** 2
+    return np.sqrt(a / np.pi) * np.exp(-a * offsets ** 2)
+
+def lorentzian(offsets, fwhm):
+    """Lorentzian line shape of unit area (offsets and fwhm in eV)."""
+    half = fwhm / 2
+    return half / np.pi / (offsets ** 2 + half ** 2)
+
+LINE_SHAPES = {"gaussian": gaussian, "lorentzian": lorentzian}
+
+def read_tddft_log(log_file):
+    """
+    Returns (excitation energies in eV, oscillator strengths, ground-state energy, excited-state
+    energy) of the last TD calculation of a log; the energies are in Hartree and None if absent.
+    """
+    parser = LogParser([ScfEnergyExtractor(), ExcitedStateExtractor(), TextSearchExtractor(TD_ENERGY_TEXT, last=True, name="td_energy")])
+    results = parser.parse(log_file)
+    states = last_excited_block(results["excited_states"])
+    energies = np.array([state["energy_ev"] for state in states], dtype=np.float64)
+    strengths = np.array([state["oscillator_strength"] for state in states], dtype=np.float64)
+    ground = results["scf_energies"][-1] if results["scf_energies"] else None
+    excited = float(results["td_energy"].split()[0]) if results["td_energy"] else None
+    return energies, strengths, ground, excited
+
+def _read_job(log_file):
+    try:
+        return log_file, read_tddft_log(log_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {log_file}: {e}", file=sys.stderr)
+        return log_file, None
+
+def read_store(store_file, step=None, emission=False):
+    """
+    Excitations and energies of the logs of a results store (see results_store.py), without reading any log.
+
+    Returns:
+    tuple: ({name: (excitation energies eV, oscillator strengths)}, {name: energy in Hartree})
+    """
+    store = ResultsStore(store_file)
+    try:
+        strengths = store.arrays("oscillator_strengths", step=step)
+        conformers = {name: (excitation, strengths[name]) for name, excitation in store.arrays("excitation_energies", step=step).items()
+                      if name in strengths and len(excitation)}
+        # Absorption starts from the ground state, emission from the relaxed excited state: never a mix of both
+        energies = dict(zip(*store.column("td_energy" if emission else "scf_energy", step=step)))
+    finally:
+        store.close()
+    return conformers, {name: energy for name, energy in energies.items() if name in conformers}
+
+def broaden(centers, intensities, grid, fwhm=0.3, shape="gaussian"):
+    """
+    Sum of line shapes centered at every transition, on an energy grid.
+
+    Args:
+    centers (ndarray): Transition energies in eV, shape (n_transitions,)
+    intensities (ndarray): Weight of each transition (e.g. population x oscillator strength)
+    grid (ndarray): Energies in eV where the spectrum is evaluated, shape (n_points,)
+    fwhm (float): Full width at half maximum in eV
+    shape (str): "gaussian" or "lorentzian"
+
+    Returns:
+    ndarray: Spectrum, shape (n_points,), in intensity units per eV
+    """
+    line_shape = LINE_SHAPES[shape]
+    centers = np.asarray(centers, dtype=np.float64).ravel()
+    intensities = np.asarray(intensities, dtype=np.float64).ravel()
+    grid = np.asarray(grid, dtype=np.float64)
+    spectrum = np.zeros(len(grid))
+    block = max(1, BLOCK_ELEMENTS // max(1, len(grid)))
+    for start in range(0, len(centers), block):
+        profiles = line_shape(grid[None, :] - centers[start:start + block, None], fwhm)  # (transitions, points)
+        spectrum += intensities[start:start + block] @ profiles
+    return spectrum
+
+def ensemble_spectrum(conformers, populations, grid, fwhm=0.3, shape="gaussian", emission=False):
+    """
+    Boltzmann-weighted spectrum of an ensemble.
+
+    Args:
+    conformers (dict): {name: (excitation energies eV, oscillator strengths)}
+    populations (dict): {name: population}, e.g. from calculate_boltzmann_population
+    grid (ndarray): Energy grid in eV
+    emission (bool): Use only the lowest excited state of each conformer (Kasha's rule), with
+                     the intensity of a spontaneous emission (f E^2)
+
+    Returns:
+    ndarray: Molar absorptivity (L mol-1 cm-1) on grid; for emission, normalized to a maximum of 1
+    """
+    names = [name for name in conformers if name in populations]
+    if emission:
+        centers = np.array([conformers[name][0][0] for name in names])
+        intensities = np.array([populations[name] * conformers[name][1][0] * conformers[name][0][0] ** 2 for name in names])
+    else:
+        centers = np.concatenate([conformers[name][0] for name in names])
+        intensities = np.concatenate([populations[name] * conformers[name][1] for name in names])
+    spectrum = broaden(centers, intensities, grid, fwhm, shape)
+    if emission:
+        return spectrum / spectrum.max() if spectrum.max() > 0 else spectrum
+    return spectrum * EPSILON_PER_OSCILLATOR
+
+def main():
+    parser = argparse.ArgumentParser(description="Boltzmann-weighted UV-Vis spectrum from TD-DFT logs.")
+    parser.add_argument("folder", help="Folder tree with the TD-DFT .log files, or results store (.sqlite)")
+    parser.add_argument("--step", type=int, help="Results store: only the logs of this AutoGaussian step")
+    parser.add_argument("--pattern", default="*.log", help="Name pattern of the TD-DFT logs (e.g. step2.log)")
+    parser.add_argument("--emission", action="store_true", help="Emission spectrum from the lowest excited state (excited-state optimizations)")
+    parser.add_argument("--temperature", type=float, default=T, help="Temperature of the Boltzmann weights in K")
+    parser.add_argument("--no-weighting", action="store_true", help="Weight every conformer equally")
+    parser.add_argument("--shape", choices=sorted(LINE_SHAPES), default="gaussian", help="Line shape")
+    parser.add_argument("--fwhm", type=float, default=0.3, help="Full width at half maximum in eV")
+    parser.add_argument("--range", type=float, nargs=2, default=(200.0, 800.0), metavar=("MIN_NM", "MAX_NM"), help="Wavelength range in nm")
+    parser.add_argument("--points", type=int, default=10000, help="Grid points")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes reading the logs (default: all cores)")
+    parser.add_argument("--output", default="spectrum.csv", help="Output .csv (wavelength, energy, intensity)")
+    args = parser.parse_args()
+
+    conformers, energies = {}, {}
+    if args.folder.endswith(".sqlite"):
+        conformers, energies = read_store(args.folder, args.step, args.emission)
+    else:
+        with ProcessPoolExecutor(args.workers) as executor:
+            for log_file, data in executor.map(_read_job, iter_log_files(args.folder, args.pattern), chunksize=8):
+                if data is None or len(data[0]) == 0:
+                    continue
+                name = os.path.relpath(log_file, args.folder)
+                excitation, strengths, ground, excited = data
+                conformers[name] = (excitation, strengths)
+                # Absorption starts from the ground state, emission from the relaxed excited state (never a mix of both)
+                energy = excited if args.emission else ground
+                if energy is not None:
+                    energies[name] = energy
+    if not conformers:
+        print("No excited states found.")
+        sys.exit(1)
+
+    if args.no_weighting:
+        populations = {name: 1 / len(conformers) for name in conformers}
+    else:
+        missing = set(conformers) - set(energies)
+        if missing:
+            kind = "an excited-state (TD) total energy" if args.emission else "an SCF energy"
+            print(f"Skipped {len(missing)} logs without {kind}: {', '.join(sorted(missing))}", file=sys.stderr)
+        if not energies:
+            print("No energies to weight the conformers with (use --no-weighting).")
+            sys.exit(1)
+        populations = calculate_boltzmann_population(energies, args.temperature)
+
+    wavelengths = np.linspace(args.range[0], args.range[1], args.points)
+    grid = EV_NM / wavelengths
+    spectrum = ensemble_spectrum(conformers, populations, grid, args.fwhm, args.shape, args.emission)
+
+    column = "Relative intensity" if args.emission else "Epsilon (L mol-1 cm-1)"
+    np.savetxt(args.output, np.column_stack([wavelengths, grid, spectrum]), delimiter=",", fmt="%.6f",
+               header=f"Wavelength (nm),Energy (eV),{column}", comments="")
+    print(f"{len(populations)} conformers. Spectrum written to {args.output}")
+    for name, population in sorted(populations.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"    {name}\t{population*100:.2f} %")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+"""
+Indexed Multi-Frame XYZ Reader
+
+Random access to the frames of large XYZ trajectories (scans, IRCs, conformer searches). The
+byte offset and atom count of every frame are found in one pass over the memory-mapped file and
+kept in a sidecar file (trajectory.xyz.idx.npz), reused while the size and mtime of the
+trajectory do not change. traj[i] then parses only frame i, and traj[a:b] only those frames.
+
+Binary trajectories written by multixyz_to_pdb.py --format npy are opened memory-mapped, and
+traj[i] / traj[a:b] are views of the file without any copy.
+
+Usage:
+    from xyz_trajectory import XyzTrajectory
+    traj = XyzTrajectory("irc.xyz")
+    len(traj), traj[50000].shape, traj[50000:50100].shape, traj.comment(0), traj.elements(0)
+"""
+import os
+import mmap
+import numpy as np
+
+SCAN_BLOCK_SIZE = 64 * 1024 * 1024  # Bytes searched for line ends at once while indexing
+INDEX_SUFFIX = ".idx.npz"
+
+def _newlines(mm, start, stop):
+    """Positions of the b"\\n" bytes of mm[start:stop]."""
+    block = np.frombuffer(mm, dtype=np.uint8, count=stop - start, offset=start)
+    return np.flatnonzero(block == 10) + start
+
+def build_frame_index(mm):
+    """
+    Byte offsets and atom counts of the frames of a memory-mapped XYZ file.
+
+    Only the line ends are searched for (with NumPy, a block at a time); the file is then walked
+    from one frame header to the next without touching the atom lines. Lines that are not an atom
+    count where a header is expected are skipped, as read_xyz does, and a truncated last frame is
+    left out.
+
+    Returns:
+    tuple: (offsets int64 array of length frames + 1, the last one the end of the data; atom counts int64 array)
+    """
+    size = len(mm)
+    offsets, counts = [], []
+    header_line = 0         # Line number of the next frame header
+    line_base = 0           # Line ends before the current block
+    block_start = 0
+    while block_start < size:
+        block_stop = min(block_start + SCAN_BLOCK_SIZE, size)
+        newlines = _newlines(mm, block_start, block_stop)
+        line_count = line_base + len(newlines)
+        # Headers whose line start is known (line L starts after line end L - 1)
+        while header_line <= line_count:
+            start = 0 if header_line == 0 else int(newlines[header_line - 1 - line_base]) + 1
+            if start >= size:
+                break
+            end = mm.find(b"\n", start)
+            try:
+                atoms = int(mm[start:size if end < 0 else end].strip())
+            except ValueError:
+                header_line += 1
+                continue
+            offsets.append(start)
+            counts.append(atoms)
+            header_line += atoms + 2
+        line_base = line_count
+        block_start = block_stop
+
+    total_lines = line_base + (1 if size and mm[size - 1] != 10 else 0)
+    if counts and header_line > total_lines:  # The last frame runs past the end of the file
+        offsets.pop()
+        counts.pop()
+    return np.array(offsets + [size], dtype=np.int64), np.array(counts, dtype=np.int64)
+
+def load_frame_index(xyz_file, stat=None):
+    """
+    Frame index of xyz_file from its sidecar file, or None if there is none or the trajectory
+    changed (size or mtime) since it was written.
+    """
+    stat = stat or os.stat(xyz_file)
+    try:
+        with np.load(xyz_file + INDEX_SUFFIX) as index:
+            if int(index["size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns:
+                return index["offsets"], index["atom_counts"]
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
+def save_frame_index(xyz_file, stat, offsets, atom_counts):
+    """Writes the sidecar file (atomically; silently skipped where the folder is read-only)."""
+    temporary = f"{xyz_file}{INDEX_SUFFIX}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            np.savez(f, offsets=offsets, atom_counts=atom_counts, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        os.replace(temporary, xyz_file + INDEX_SUFFIX)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+class XyzTrajectory:
+    """
+    Random-access view of a multi-frame XYZ file (or of a .npy trajectory).
+
+    traj[i] is the (atoms, 3) coordinate array of frame i (negative indices allowed) and
+    traj[a:b:c] an (frames, atoms, 3) array; slices of frames with different atom counts are
+    returned as a list of arrays. Frames are parsed on demand from the memory-mapped file.
+
+    Args:
+    path (str): .xyz file, or .npy file written by multixyz_to_pdb.py --format npy
+    use_index_file (bool): Read and write the sidecar index (path + ".idx.npz")
+    """
+    def __init__(self, path, use_index_file=True):
+        self.path = path
+        self.file = open(path, "rb")
+        if path.endswith(".npy"):
+            self.mm = None
+            self.coordinates = np.load(path, mmap_mode="r")
+            self.atom_counts = np.full(len(self.coordinates), self.coordinates.shape[1], dtype=np.int64)
+            return
+        stat = os.fstat(self.file.fileno())
+        self.coordinates = None
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        index = load_frame_index(path, stat) if use_index_file else None
+        if index is None:
+            index = build_frame_index(self.mm)
+            if use_index_file:
+                save_frame_index(path, stat, *index)
+        self.offsets, self.atom_counts = index
+
+    def __len__(self):
+        return len(self.atom_counts)
+
+    def _lines(self, i):
+        """Comment line and atom lines (bytes) of frame i."""
+        atoms = int(self.atom_counts[i])
+        lines = self.mm[self.offsets[i]:self.offsets[i + 1]].split(b"\n", atoms + 2)
+        return lines[1], lines[2:atoms + 2]
+
+    def _parse(self, i):
+        atom_lines = self._lines(i)[1]
+        if not atom_lines:
+            return np.zeros((0, 3))
+        fields = b" ".join(atom_lines).split()
+        return np.array(fields).reshape(len(atom_lines), -1)[:, 1:4].astype(np.float64)
+
+    def __getitem__(self, key):
+        if self.coordinates is not None:
+            return self.coordinates[key]  # Memory-mapped view
+        if isinstance(key, slice):
+            frames = [self._parse(i) for i in range(*key.indices(len(self)))]
+            if len(set(len(frame) for frame in frames)) > 1:
+                return frames
+            return np.stack(frames) if frames else np.zeros((0, 0, 3))
+        i = key + len(self) if key < 0 else key
+        if not 0 <= i < len(self):
+            raise IndexError(f"Frame {key} out of range ({len(self)} frames)")
+        return self._parse(i)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def comment(self, i):
+        """Comment line of frame i (None for .npy trajectories)."""
+        if self.coordinates is not None:
+            return None
+        return self._lines(i % len(self))[0].decode(errors="replace").strip()
+
+    def elements(self, i):
+        """Element symbols of frame i (None for .npy trajectories)."""
+        if self.coordinates is not None:
+            return None
+        return [line.split()[0].decode() for line in self._lines(i % len(self))[1]]
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()